@@ -0,0 +1,18 @@
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userprofile',
+            name='photo',
+            field=models.ImageField(blank=True, help_text='Upload your profile photo', null=True, storage=core.storage.ContentAddressedStorage(), upload_to='profile_photos/'),
+        ),
+    ]
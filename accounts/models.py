@@ -2,10 +2,12 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from core.storage import photo_storage
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
-    photo = models.ImageField(upload_to='profile_photos/', blank=True, null=True, help_text='Upload your profile photo')
+    photo = models.ImageField(upload_to='profile_photos/', storage=photo_storage, blank=True, null=True,
+                              help_text='Upload your profile photo')
     phone_number = models.CharField(max_length=15, blank=True, null=True, help_text='Your contact number')
     address = models.TextField(blank=True, null=True, help_text='Your address')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Agent
+from .models import Agent, AgentLocation
 
 
 @admin.register(Agent)
@@ -7,4 +7,10 @@ class AgentAdmin(admin.ModelAdmin):
     list_display = ("user", "center", "phone", "is_active")
     list_filter = ("is_active", "center")
 
+
+@admin.register(AgentLocation)
+class AgentLocationAdmin(admin.ModelAdmin):
+    list_display = ("agent", "latitude", "longitude", "accuracy_m", "recorded_at")
+    list_select_related = ("agent__user", "agent__center")
+
 # Register your models here.
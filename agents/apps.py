@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AgentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agents'
+
+    def ready(self):
+        from . import locations, spatial  # noqa: F401  (connect signal receivers)
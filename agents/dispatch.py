@@ -0,0 +1,215 @@
+"""Load-aware assignment of unassigned orders and problem reports to agents.
+
+Each tick gathers every unassigned job, orders them by urgency and age, and
+greedily gives each one to the agent with the lowest
+``distance_km + DISPATCH_LOAD_PENALTY_KM * open_jobs``. Loads are updated as
+the tick goes, so a surge is spread across nearby agents instead of piling up
+on whoever happens to be closest. Results are written back with one
+``bulk_update`` per table; since that skips model signals, the tick then
+feeds the stats rollup, status log and live updates through their helpers.
+"""
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.events import publish_status
+from core.geo import haversine_many, np
+from core.transitions import record as record_transitions
+from orders.models import Order
+from reports.models import ProblemReport
+from reports.stats import count_status_changes
+from .locations import agent_position
+from .models import Agent
+from .spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+OPEN_ORDER_STATUSES = ('confirmed', 'assigned')
+OPEN_REPORT_STATUSES = ('assigned', 'in_progress')
+# Online orders stay 'pending' until payment_success confirms them; only paid
+# (or cash) orders are handed to agents.
+DISPATCHABLE_ORDER_STATUSES = ('confirmed',)
+PRIORITY_RANK = {'urgent': 0, 'high': 1, 'medium': 2, 'low': 3}
+ORDER_PRIORITY = 'high'
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def agent_loads(agent_ids=None) -> dict:
+    """Map ``Agent.id`` to the number of open orders and reports it holds."""
+    orders = Order.objects.filter(status__in=OPEN_ORDER_STATUSES, assigned_agent__isnull=False)
+    reports = ProblemReport.objects.filter(status__in=OPEN_REPORT_STATUSES, assigned_agent__isnull=False)
+    if agent_ids is not None:
+        orders = orders.filter(assigned_agent__in=agent_ids)
+        reports = reports.filter(assigned_agent__agent_profile__in=agent_ids)
+    loads = {}
+    for agent_id, n in orders.values_list('assigned_agent').annotate(n=Count('id')).order_by():
+        loads[agent_id] = loads.get(agent_id, 0) + n
+    rows = reports.values_list('assigned_agent__agent_profile').annotate(n=Count('id')).order_by()
+    for agent_id, n in rows:
+        if agent_id is not None:
+            loads[agent_id] = loads.get(agent_id, 0) + n
+    return loads
+
+
+def job_cost(distance_km: float, load: int) -> float:
+    return distance_km + _setting('DISPATCH_LOAD_PENALTY_KM', 3.0) * load
+
+
+def pick_agent(agents, lat: float, lng: float):
+    """Best agent among ``agents`` for a single job at ``(lat, lng)``, or None."""
+    agents = list(agents)
+    if not agents:
+        return None
+    loads = agent_loads([ag.id for ag in agents])
+    positions = [agent_position(ag) for ag in agents]
+    distances = haversine_many(lat, lng, [p[0] for p in positions], [p[1] for p in positions])
+    costs = [job_cost(d, loads.get(ag.id, 0)) for d, ag in zip(distances, agents)]
+    return agents[min(range(len(agents)), key=costs.__getitem__)]
+
+
+def _locked(qs):
+    if connection.features.has_select_for_update_skip_locked:
+        return qs.select_for_update(skip_locked=True, of=('self',))
+    return qs
+
+
+def _pending_jobs(batch: int):
+    """Unassigned work as ``(rank, created_at, kind, id, status, lat, lng)`` tuples."""
+    # One query per status, so each reads order_dispatch_idx in created_at
+    # order and stops after ``batch`` rows instead of sorting every match.
+    orders = []
+    for status in DISPATCHABLE_ORDER_STATUSES:
+        orders += _locked(
+            Order.objects.filter(assigned_agent__isnull=True, status=status, center__isnull=False)
+            .order_by('created_at')[:batch]
+        ).values_list('created_at', 'id', 'status', 'center__latitude', 'center__longitude')
+    orders = sorted(orders)[:batch]
+    reports = _locked(
+        ProblemReport.objects.filter(assigned_agent__isnull=True, status='pending')
+        .order_by('created_at')[:batch]
+    ).values_list('created_at', 'id', 'status', 'priority', 'latitude', 'longitude',
+                  'assigned_center__latitude', 'assigned_center__longitude')
+    order_rank = PRIORITY_RANK[ORDER_PRIORITY]
+    jobs = [(order_rank, created_at, 'order', pk, status, lat, lng)
+            for created_at, pk, status, lat, lng in orders]
+    for created_at, pk, status, priority, lat, lng, c_lat, c_lng in reports:
+        if lat is None or lng is None:
+            lat, lng = c_lat, c_lng
+        if lat is None or lng is None:
+            continue
+        jobs.append((PRIORITY_RANK.get(priority, 2), created_at, 'report', pk, status, lat, lng))
+    jobs.sort(key=lambda job: (job[0], job[1]))
+    return jobs
+
+
+def _assign_vectorized(jobs, agents, loads: dict, max_load: int, max_km: float):
+    penalty = _setting('DISPATCH_LOAD_PENALTY_KM', 3.0)
+    positions = [agent_position(ag) for ag in agents]
+    lats = np.array([p[0] for p in positions], dtype=float)
+    lngs = np.array([p[1] for p in positions], dtype=float)
+    load = np.array([loads.get(ag.id, 0) for ag in agents], dtype=float)
+    blocked = np.where(load >= max_load, np.inf, 0.0)
+    result = []
+    for start in range(0, len(jobs), 512):
+        block = jobs[start:start + 512]
+        # One broadcast call per block: rows are jobs, columns are agents.
+        dist = haversine_many(np.array([job[5] for job in block])[:, None],
+                              np.array([job[6] for job in block])[:, None],
+                              lats[None, :], lngs[None, :])
+        dist[dist > max_km] = np.inf
+        for job, row in zip(block, dist):
+            cost = row + penalty * load + blocked
+            i = int(cost.argmin())
+            if not np.isfinite(cost[i]):
+                continue
+            load[i] += 1
+            if load[i] >= max_load:
+                blocked[i] = np.inf
+            result.append((job, agents[i]))
+    for ag, n in zip(agents, load):
+        loads[ag.id] = int(n)
+    return result
+
+
+def _assign_grid(jobs, agents, loads: dict, max_load: int, max_km: float):
+    k = _setting('DISPATCH_CANDIDATES', 25)
+    index = GridIndex()
+    by_id = {}
+    for ag in agents:
+        if loads.get(ag.id, 0) < max_load:
+            index.insert(ag.id, *agent_position(ag))
+            by_id[ag.id] = ag
+    result = []
+    for job in jobs:
+        if not len(index):
+            break
+        candidates = index.nearest(job[5], job[6], k, max_km)
+        if not candidates:
+            continue
+        d, agent_id = min(candidates, key=lambda c: job_cost(c[0], loads.get(c[1], 0)))
+        loads[agent_id] = loads.get(agent_id, 0) + 1
+        if loads[agent_id] >= max_load:
+            index.remove(agent_id)
+        result.append((job, by_id[agent_id]))
+    return result
+
+
+def assign(jobs, agents, loads: dict):
+    """Greedily assign ``jobs`` to ``agents``; returns ``[(job, agent), ...]``.
+
+    ``jobs`` are ``(rank, created_at, kind, id, status, lat, lng)`` tuples in
+    the order they should be served. ``loads`` is updated in place. With
+    NumPy the job x agent distance matrix is computed in blocks; without it
+    candidates are narrowed through a grid index instead.
+    """
+    agents = list(agents)
+    if not jobs or not agents:
+        return []
+    max_load = _setting('DISPATCH_MAX_LOAD', 5)
+    max_km = _setting('DISPATCH_MAX_KM', 50.0)
+    if np is not None:
+        return _assign_vectorized(jobs, agents, loads, max_load, max_km)
+    return _assign_grid(jobs, agents, loads, max_load, max_km)
+
+
+def dispatch_tick(batch: int = None) -> dict:
+    """Assign every dispatchable job once and persist the result."""
+    batch = batch or _setting('DISPATCH_BATCH', 5000)
+    with transaction.atomic():
+        jobs = _pending_jobs(batch)
+        if not jobs:
+            return {'jobs': 0, 'orders': 0, 'reports': 0}
+        agents = list(Agent.objects.filter(is_active=True).select_related('center', 'location'))
+        assignments = assign(jobs, agents, agent_loads())
+
+        now = timezone.now()
+        orders, reports, order_changes, report_changes = [], [], [], []
+        for (_, _, kind, pk, status, _, _), agent in assignments:
+            if kind == 'order':
+                orders.append(Order(pk=pk, assigned_agent=agent, status='assigned'))
+                order_changes.append((pk, status, 'assigned'))
+            else:
+                # bulk_update does not apply auto_now.
+                reports.append(ProblemReport(pk=pk, assigned_agent_id=agent.user_id,
+                                             assigned_center_id=agent.center_id, status='assigned', updated_at=now))
+                report_changes.append((pk, status, 'assigned'))
+        size = _setting('DISPATCH_UPDATE_BATCH', 500)
+        Order.objects.bulk_update(orders, ['assigned_agent', 'status'], batch_size=size)
+        ProblemReport.objects.bulk_update(reports, ['assigned_agent', 'assigned_center', 'status', 'updated_at'],
+                                          batch_size=size)
+        count_status_changes(report_changes)
+        record_transitions(Order, order_changes, now)
+        record_transitions(ProblemReport, report_changes, now)
+        for pk, _, status in order_changes:
+            publish_status(Order, 'order', pk, status)
+        for pk, _, status in report_changes:
+            publish_status(ProblemReport, 'problem', pk, status)
+    stats = {'jobs': len(jobs), 'orders': len(orders), 'reports': len(reports)}
+    logger.info("dispatch tick: %(jobs)s jobs, %(orders)s orders and %(reports)s reports assigned", stats)
+    return stats
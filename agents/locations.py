@@ -0,0 +1,145 @@
+"""Write-behind buffer for live agent GPS pings.
+
+Pings only touch process memory: the newest position per agent is kept in a
+dict that nearest-agent lookups read directly, and a background thread
+upserts whatever changed into ``AgentLocation`` every
+``AGENT_LOCATION_FLUSH_INTERVAL`` seconds with a single ``bulk_create``.
+"""
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import spatial
+from .models import Agent, AgentLocation
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = {}
+_latest = {}
+_agent_ids = {}
+_flusher = None
+
+
+def _flush_interval() -> float:
+    return getattr(settings, 'AGENT_LOCATION_FLUSH_INTERVAL', 2.0)
+
+
+def max_age() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'AGENT_LOCATION_MAX_AGE', 300))
+
+
+def agent_id_for_user(user):
+    """Active ``Agent.id`` for ``user`` (memoized per process), or None."""
+    agent_id = _agent_ids.get(user.pk)
+    if agent_id is None:
+        agent_id = Agent.objects.filter(user=user, is_active=True).values_list('id', flat=True).first()
+        if agent_id is not None:
+            _agent_ids[user.pk] = agent_id
+    return agent_id
+
+
+def record_ping(agent_id: int, lat: float, lng: float, accuracy_m: float = None, recorded_at=None) -> None:
+    recorded_at = recorded_at or timezone.now()
+    with _lock:
+        previous = _latest.get(agent_id)
+        if previous is not None and previous[3] > recorded_at:
+            return
+        _latest[agent_id] = _pending[agent_id] = (lat, lng, accuracy_m, recorded_at)
+    spatial.move_agent(agent_id, lat, lng)
+    _ensure_flusher()
+
+
+def latest_position(agent_id: int):
+    """``(lat, lng)`` of the agent's freshest in-memory ping, or None."""
+    ping = _latest.get(agent_id)
+    if ping is None or timezone.now() - ping[3] > max_age():
+        return None
+    return ping[0], ping[1]
+
+
+def agent_position(agent):
+    """Best known ``(lat, lng)`` for an ``Agent`` loaded with ``location`` and ``center``.
+
+    Prefers an in-memory ping, then a fresh ``AgentLocation`` row, then the
+    agent's service center.
+    """
+    position = latest_position(agent.id)
+    if position is not None:
+        return position
+    location = getattr(agent, 'location', None)
+    if location is not None and timezone.now() - location.recorded_at <= max_age():
+        return location.latitude, location.longitude
+    return agent.center.latitude, agent.center.longitude
+
+
+def flush() -> int:
+    """Persist buffered pings; returns the number of rows written."""
+    global _pending
+    with _lock:
+        batch, _pending = _pending, {}
+    if not batch:
+        return 0
+    rows = [
+        AgentLocation(agent_id=agent_id, latitude=lat, longitude=lng, accuracy_m=accuracy, recorded_at=at)
+        for agent_id, (lat, lng, accuracy, at) in batch.items()
+    ]
+    try:
+        AgentLocation.objects.bulk_create(
+            rows, batch_size=500, update_conflicts=True, unique_fields=['agent'],
+            update_fields=['latitude', 'longitude', 'accuracy_m', 'recorded_at'],
+        )
+    except Exception:
+        logger.exception("Failed to flush %d agent locations", len(rows))
+        with _lock:
+            for agent_id, ping in batch.items():
+                _pending.setdefault(agent_id, ping)
+        return 0
+    return len(rows)
+
+
+def reset() -> None:
+    """Drop all buffered pings and cached lookups without writing them."""
+    with _lock:
+        _pending.clear()
+        _latest.clear()
+        _agent_ids.clear()
+
+
+def _run_flusher():
+    while True:
+        time.sleep(_flush_interval())
+        try:
+            flush()
+        finally:
+            close_old_connections()
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is not None or not _flush_interval():
+        # A falsy interval disables the thread; callers then flush() themselves.
+        return
+    with _lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_run_flusher, name='agent-location-flusher', daemon=True)
+            _flusher.start()
+            atexit.register(flush)
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def _forget_agent(sender, instance, **kwargs):
+    _agent_ids.pop(instance.user_id, None)
+    if kwargs.get('signal') is post_delete or not instance.is_active:
+        with _lock:
+            _latest.pop(instance.id, None)
+            _pending.pop(instance.id, None)
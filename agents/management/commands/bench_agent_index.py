@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from agents.spatial import GridIndex
+from core.geo import haversine_many
+
+
+class Command(BaseCommand):
+    help = "Benchmark nearest-agent lookups: grid index vs. a full linear scan"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,10000,100000',
+                            help='Comma-separated fleet sizes to benchmark')
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--limit', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        limit = options['limit']
+        # Synthetic fleet spread over Bangladesh, denser around Dhaka and Chattogram.
+        hubs = [(23.78, 90.40, 0.25), (22.35, 91.82, 0.15), (23.7, 90.3, 1.5)]
+
+        def point():
+            lat, lng, spread = rng.choice(hubs)
+            return rng.gauss(lat, spread), rng.gauss(lng, spread)
+
+        self.stdout.write(f"{'agents':>8} {'build ms':>9} {'grid p50 us':>12} {'grid p99 us':>12} {'scan p50 us':>12}")
+        for size in [int(s) for s in options['sizes'].split(',')]:
+            points = [point() for _ in range(size)]
+            queries = [point() for _ in range(options['queries'])]
+            lats = [p[0] for p in points]
+            lngs = [p[1] for p in points]
+
+            started = time.perf_counter()
+            index = GridIndex()
+            for i, (lat, lng) in enumerate(points):
+                index.insert(i, lat, lng)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            grid = []
+            for lat, lng in queries:
+                t = time.perf_counter()
+                index.nearest(lat, lng, limit)
+                grid.append((time.perf_counter() - t) * 1e6)
+
+            scan = []
+            for lat, lng in queries[:50]:
+                t = time.perf_counter()
+                distances = haversine_many(lat, lng, lats, lngs)
+                sorted(range(size), key=distances.__getitem__)[:limit]
+                scan.append((time.perf_counter() - t) * 1e6)
+
+            grid.sort()
+            scan.sort()
+            self.stdout.write(
+                f"{size:>8} {build_ms:>9.1f} {grid[len(grid) // 2]:>12.1f} "
+                f"{grid[int(len(grid) * 0.99)]:>12.1f} {scan[len(scan) // 2]:>12.1f}"
+            )
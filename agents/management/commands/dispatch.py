@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from agents.dispatch import dispatch_tick
+
+
+class Command(BaseCommand):
+    help = "Assign unassigned orders and problem reports to agents, balancing distance and load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep between ticks')
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Maximum orders and reports to consider per tick')
+        parser.add_argument('--once', action='store_true', help='Run a single tick and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            stats = dispatch_tick(options['batch'])
+            elapsed = (time.perf_counter() - started) * 1000
+            if stats['jobs'] or options['once']:
+                self.stdout.write(
+                    f"{stats['jobs']} jobs: assigned {stats['orders']} orders, "
+                    f"{stats['reports']} reports in {elapsed:.0f} ms"
+                )
+            if options['once']:
+                return
+            time.sleep(options['interval'])
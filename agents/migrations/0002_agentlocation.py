@@ -0,0 +1,24 @@
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('accuracy_m', models.FloatField(blank=True, null=True)),
+                ('recorded_at', models.DateTimeField()),
+                ('agent', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='location', to='agents.agent')),
+            ],
+        ),
+    ]
@@ -5,13 +5,31 @@ from centers.models import ServiceCenter
 User = get_user_model()
 
 
+class AgentQuerySet(models.QuerySet):
+    def near(self, lat: float, lng: float, radius_km: float):
+        """Agents whose center falls inside the bounding box of ``radius_km``."""
+        return self.filter(center__in=ServiceCenter.objects.near(lat, lng, radius_km))
+
+
 class Agent(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='agent_profile')
     center = models.ForeignKey(ServiceCenter, on_delete=models.CASCADE, related_name='agents')
     phone = models.CharField(max_length=20)
     is_active = models.BooleanField(default=True)
 
+    objects = AgentQuerySet.as_manager()
+
     def __str__(self) -> str:
         return f"{self.user.get_username()} ({self.center.name})"
 
-# Create your models here.
+
+class AgentLocation(models.Model):
+    """Last reported GPS position of an agent; one row per agent."""
+    agent = models.OneToOneField(Agent, on_delete=models.CASCADE, related_name='location')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy_m = models.FloatField(null=True, blank=True)
+    recorded_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"{self.agent_id} @ {self.latitude:.5f},{self.longitude:.5f}"
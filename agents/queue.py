@@ -0,0 +1,154 @@
+"""Pull-based work queue: an agent claims the next job near them.
+
+Jobs are unassigned problem reports and confirmed (paid or cash) orders inside
+``AGENT_QUEUE_RADIUS_KM`` of the agent, most urgent first, then oldest. A
+claim assigns the job and sets ``lease_expires_at``; the agent acknowledges
+it (``acknowledge``) to keep it. A claim left unacknowledged past
+``AGENT_QUEUE_LEASE`` seconds goes back in the queue.
+
+Claiming never waits on another agent:
+
+* PostgreSQL (and other backends with ``SKIP LOCKED``): the best candidate
+  row is locked with ``select_for_update(skip_locked=True)``, so concurrent
+  claimers each get a different row.
+* SQLite: candidates are read without locks and taken with a
+  compare-and-swap ``UPDATE ... WHERE <still claimable>``; a claimer that
+  loses the race moves on to the next candidate.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from centers.models import ServiceCenter
+from core.events import publish_status
+from core.geo import bounding_box
+from core.transitions import record as record_transitions
+from orders.models import Order
+from reports.models import ProblemReport
+from reports.stats import adjust as adjust_problem_stats
+from .dispatch import ORDER_PRIORITY, PRIORITY_RANK
+from .locations import agent_position
+
+# SQLite path: candidates read per kind before giving up on a contended batch.
+CANDIDATES = 10
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def _lease_until(now):
+    return now + timedelta(seconds=_setting('AGENT_QUEUE_LEASE', 300))
+
+
+def _report_candidates(lat, lng, radius_km, now):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+    near = (Q(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+            | Q(latitude__isnull=True,
+                assigned_center__in=ServiceCenter.objects.near(lat, lng, radius_km)))
+    claimable = (Q(status='pending', assigned_agent__isnull=True)
+                 | Q(status='assigned', lease_expires_at__lt=now))
+    rank = Case(*[When(priority=p, then=Value(r)) for p, r in PRIORITY_RANK.items()],
+                default=Value(2), output_field=IntegerField())
+    return (ProblemReport.objects.filter(claimable, near)
+            .annotate(rank=rank).order_by('rank', 'created_at', 'id'))
+
+
+def _order_candidates(lat, lng, radius_km, now):
+    # Unpaid online orders stay 'pending' until payment_success; never lease them.
+    claimable = (Q(status='confirmed', assigned_agent__isnull=True)
+                 | Q(status='assigned', lease_expires_at__lt=now))
+    return (Order.objects.filter(claimable, center__in=ServiceCenter.objects.near(lat, lng, radius_km))
+            .order_by('created_at', 'id'))
+
+
+def _claim_fields(kind: str, agent, lease_until):
+    if kind == 'report':
+        return {'assigned_agent': agent.user, 'assigned_center': agent.center, 'status': 'assigned',
+                'lease_expires_at': lease_until, 'updated_at': timezone.now()}
+    return {'assigned_agent': agent, 'status': 'assigned', 'lease_expires_at': lease_until}
+
+
+def _after_claim(kind: str, pk: int, old_status: str, new_status: str) -> None:
+    # Queryset updates skip the stats, status log and live-update signals.
+    model = ProblemReport if kind == 'report' else Order
+    record_transitions(model, [(pk, old_status, new_status)])
+    if kind == 'report':
+        if old_status != 'assigned':
+            adjust_problem_stats({f'status:{old_status}': -1, 'status:assigned': 1})
+        publish_status(ProblemReport, 'problem', pk, new_status)
+    elif new_status != old_status:
+        publish_status(Order, 'order', pk, new_status)
+
+
+def _claim_locked(reports, orders, agent, now):
+    with transaction.atomic():
+        report = reports.select_for_update(skip_locked=True, of=('self',)).first()
+        order = orders.select_for_update(skip_locked=True, of=('self',)).first()
+        picks = []
+        if report is not None:
+            picks.append(((report.rank, report.created_at), 'report', report))
+        if order is not None:
+            picks.append(((PRIORITY_RANK[ORDER_PRIORITY], order.created_at), 'order', order))
+        if not picks:
+            return None
+        _, kind, job = min(picks, key=lambda pick: pick[0])
+        old_status = job.status
+        fields = _claim_fields(kind, agent, _lease_until(now))
+        type(job).objects.filter(pk=job.pk).update(**fields)
+        _after_claim(kind, job.pk, old_status, fields['status'])
+    return kind, job.pk
+
+
+def _claim_cas(reports, orders, agent, now):
+    order_rank = PRIORITY_RANK[ORDER_PRIORITY]
+    candidates = [((rank, created_at), 'report', pk, status)
+                  for pk, status, created_at, rank
+                  in reports.values_list('id', 'status', 'created_at', 'rank')[:CANDIDATES]]
+    candidates += [((order_rank, created_at), 'order', pk, status)
+                   for pk, status, created_at
+                   in orders.values_list('id', 'status', 'created_at')[:CANDIDATES]]
+    candidates.sort(key=lambda c: (c[0], c[1] == 'order', c[2]))
+    for _, kind, pk, status in candidates:
+        source = reports if kind == 'report' else orders
+        with transaction.atomic():
+            # Updating through the candidate queryset re-checks claimability
+            # in the WHERE clause, so only one claimer wins.
+            fields = _claim_fields(kind, agent, _lease_until(now))
+            won = source.filter(pk=pk, status=status).update(**fields)
+            if won:
+                _after_claim(kind, pk, status, fields['status'])
+                return kind, pk
+    return None
+
+
+def claim_next(agent):
+    """Claim the best job near ``agent``; returns ``(kind, id)`` or None."""
+    lat, lng = agent_position(agent)
+    radius_km = _setting('AGENT_QUEUE_RADIUS_KM', 25.0)
+    now = timezone.now()
+    reports = _report_candidates(lat, lng, radius_km, now)
+    orders = _order_candidates(lat, lng, radius_km, now)
+    if connection.features.has_select_for_update_skip_locked:
+        return _claim_locked(reports, orders, agent, now)
+    return _claim_cas(reports, orders, agent, now)
+
+
+def acknowledge(agent, kind: str, pk: int) -> bool:
+    """Keep a claimed job: clear its lease. False if the claim has lapsed."""
+    now = timezone.now()
+    if kind == 'report':
+        rows = ProblemReport.objects.filter(pk=pk, assigned_agent=agent.user, status='assigned',
+                                            lease_expires_at__gte=now)
+        with transaction.atomic():
+            updated = rows.update(status='in_progress', lease_expires_at=None, updated_at=now)
+            if updated:
+                adjust_problem_stats({'status:assigned': -1, 'status:in_progress': 1})
+                record_transitions(ProblemReport, [(pk, 'assigned', 'in_progress')], now)
+                publish_status(ProblemReport, 'problem', pk, 'in_progress')
+        return bool(updated)
+    rows = Order.objects.filter(pk=pk, assigned_agent=agent, lease_expires_at__gte=now)
+    return bool(rows.update(lease_expires_at=None))
@@ -0,0 +1,222 @@
+import threading
+import time
+from datetime import timedelta
+from math import asin, cos, pi, sin
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from centers.models import ServiceCenter
+from core.geo import EARTH_RADIUS_KM, KM_PER_DEG_LAT, bounding_box, haversine_km
+from .models import Agent
+
+
+class GridIndex:
+    """Uniform lat/lng grid over agent positions.
+
+    Points are bucketed into square cells of ``cell_deg`` degrees. k-nearest
+    queries walk rings of cells outwards from the query cell and stop as soon
+    as the k-th best distance is closer than anything an unvisited ring could
+    hold, so the work depends on local density rather than fleet size.
+    """
+
+    def __init__(self, cell_deg: float = 0.05):
+        self.cell_deg = cell_deg
+        self._cells = {}
+        self._positions = {}
+        self._extent = None
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def _cell(self, lat: float, lng: float):
+        return int(lat // self.cell_deg), int(lng // self.cell_deg)
+
+    def insert(self, key, lat: float, lng: float) -> None:
+        if key in self._positions:
+            self.remove(key)
+        cell = self._cell(lat, lng)
+        if self._extent is None:
+            self._extent = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            e = self._extent
+            e[0], e[1] = min(e[0], cell[0]), max(e[1], cell[0])
+            e[2], e[3] = min(e[2], cell[1]), max(e[3], cell[1])
+        self._cells.setdefault(cell, []).append((key, lat, lng))
+        self._positions[key] = (lat, lng, cell)
+
+    def remove(self, key) -> None:
+        pos = self._positions.pop(key, None)
+        if pos is None:
+            return
+        bucket = self._cells.get(pos[2], [])
+        bucket[:] = [entry for entry in bucket if entry[0] != key]
+        if not bucket:
+            self._cells.pop(pos[2], None)
+
+    def position(self, key):
+        pos = self._positions.get(key)
+        return (pos[0], pos[1]) if pos else None
+
+    def _ring(self, ci: int, cj: int, r: int):
+        if r == 0:
+            yield ci, cj
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield ci - r, j
+            yield ci + r, j
+        for i in range(ci - r + 1, ci + r):
+            yield i, cj - r
+            yield i, cj + r
+
+    def _ring_bound_km(self, lat: float, lng: float, ci: int, cj: int, r: int) -> float:
+        # Lower bound on the distance from (lat, lng) to any point outside the
+        # (2r+1)x(2r+1) block of cells already visited.
+        c = self.cell_deg
+        d_lat = min(lat - (ci - r) * c, (ci + r + 1) * c - lat)
+        d_lng = min(lng - (cj - r) * c, (cj + r + 1) * c - lng)
+        edge_lat = min(89.9, max(abs((ci - r) * c), abs((ci + r + 1) * c)))
+        lat_km = d_lat * KM_PER_DEG_LAT
+        lng_km = 2 * EARTH_RADIUS_KM * asin(min(1.0, cos(edge_lat * pi / 180.0) * sin(d_lng * pi / 360.0)))
+        return min(lat_km, lng_km)
+
+    def nearest(self, lat: float, lng: float, k: int = 5, radius_km: float = None):
+        """Return up to ``k`` ``(distance_km, key)`` pairs, closest first."""
+        if not self._cells or k <= 0:
+            return []
+        ci, cj = self._cell(lat, lng)
+        i_lo, i_hi, j_lo, j_hi = self._extent
+        max_r = max(ci - i_lo, i_hi - ci, cj - j_lo, j_hi - cj, 0)
+        found = []
+        visited = 0
+        r = 0
+        while True:
+            if r and 8 * r > len(self._cells):
+                # Sparse grid: sweeping empty rings would cost more than
+                # visiting the remaining occupied cells directly.
+                for (i, j), bucket in self._cells.items():
+                    if max(abs(i - ci), abs(j - cj)) >= r:
+                        for key, p_lat, p_lng in bucket:
+                            found.append((haversine_km(lat, lng, p_lat, p_lng), key))
+                break
+            for cell in self._ring(ci, cj, r):
+                bucket = self._cells.get(cell)
+                if not bucket:
+                    continue
+                visited += len(bucket)
+                for key, p_lat, p_lng in bucket:
+                    found.append((haversine_km(lat, lng, p_lat, p_lng), key))
+            bound = self._ring_bound_km(lat, lng, ci, cj, r)
+            if len(found) >= k:
+                found.sort(key=lambda x: x[0])
+                del found[k:]
+                if found[-1][0] <= bound:
+                    break
+            if radius_km is not None and bound > radius_km:
+                break
+            if visited >= len(self._positions) or r >= max_r:
+                break
+            r += 1
+        found.sort(key=lambda x: x[0])
+        if radius_km is not None:
+            found = [hit for hit in found if hit[0] <= radius_km]
+        return found[:k]
+
+    def within(self, lat: float, lng: float, radius_km: float):
+        """Return every ``(distance_km, key)`` within ``radius_km``, closest first."""
+        c = self.cell_deg
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        i0, j0 = int(min_lat // c), int(min_lng // c)
+        i1, j1 = int(max_lat // c), int(max_lng // c)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._cells):
+            cells = [cell for cell in self._cells if i0 <= cell[0] <= i1 and j0 <= cell[1] <= j1]
+        else:
+            cells = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+        hits = []
+        for cell in cells:
+            for key, p_lat, p_lng in self._cells.get(cell, ()):
+                d = haversine_km(lat, lng, p_lat, p_lng)
+                if d <= radius_km:
+                    hits.append((d, key))
+        hits.sort(key=lambda x: x[0])
+        return hits
+
+
+# Process-local index of active agents keyed by Agent.id. Signals patch it in
+# place; the TTL bounds staleness caused by writes from other processes.
+_lock = threading.RLock()
+_index = None
+_built_at = 0.0
+
+
+def _ttl() -> float:
+    return getattr(settings, 'AGENT_INDEX_TTL', 60.0)
+
+
+def build_index() -> GridIndex:
+    index = GridIndex(getattr(settings, 'AGENT_INDEX_CELL_DEG', 0.05))
+    fresh_after = timezone.now() - timedelta(seconds=getattr(settings, 'AGENT_LOCATION_MAX_AGE', 300))
+    rows = Agent.objects.filter(is_active=True).values_list(
+        'id', 'center__latitude', 'center__longitude',
+        'location__latitude', 'location__longitude', 'location__recorded_at',
+    )
+    from .locations import latest_position  # locations patches this module
+
+    for agent_id, lat, lng, loc_lat, loc_lng, loc_at in rows:
+        if loc_at is not None and loc_at >= fresh_after:
+            lat, lng = loc_lat, loc_lng
+        lat, lng = latest_position(agent_id) or (lat, lng)
+        index.insert(agent_id, lat, lng)
+    return index
+
+
+def get_index() -> GridIndex:
+    global _index, _built_at
+    with _lock:
+        if _index is None or time.monotonic() - _built_at > _ttl():
+            _index = build_index()
+            _built_at = time.monotonic()
+        return _index
+
+
+def move_agent(agent_id: int, lat: float, lng: float) -> None:
+    """Patch a live position into the index if the agent is already indexed."""
+    with _lock:
+        if _index is not None and _index.position(agent_id) is not None:
+            _index.insert(agent_id, lat, lng)
+
+
+def invalidate_index() -> None:
+    global _index
+    with _lock:
+        _index = None
+
+
+@receiver(post_save, sender=Agent)
+def _agent_saved(sender, instance, **kwargs):
+    with _lock:
+        if _index is None:
+            return
+        if instance.is_active:
+            from .locations import latest_position
+
+            center = instance.center
+            lat, lng = latest_position(instance.id) or (center.latitude, center.longitude)
+            _index.insert(instance.id, lat, lng)
+        else:
+            _index.remove(instance.id)
+
+
+@receiver(post_delete, sender=Agent)
+def _agent_deleted(sender, instance, **kwargs):
+    with _lock:
+        if _index is not None:
+            _index.remove(instance.id)
+
+
+@receiver(post_save, sender=ServiceCenter)
+@receiver(post_delete, sender=ServiceCenter)
+def _center_changed(sender, instance, **kwargs):
+    invalidate_index()
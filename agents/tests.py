@@ -1,3 +1,234 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from centers.models import ServiceCenter
+from core.models import StatusEvent
+from orders.models import Order
+from reports.models import ProblemReport
+from reports.stats import reconcile, rollup
+from . import dispatch, locations
+from .models import Agent, AgentLocation
+from .queue import claim_next
+from .spatial import invalidate_index
+
+
+class NearestAgentsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        dhaka = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                             latitude=23.7925, longitude=90.4078)
+        ctg = ServiceCenter.objects.create(name='Chattogram', phone='2', address='GEC',
+                                           latitude=22.3595, longitude=91.8212)
+        for i, center in enumerate([dhaka, dhaka, ctg]):
+            user = User.objects.create_user(username=f'agent{i}', password='x')
+            Agent.objects.create(user=user, center=center, phone=str(i))
+
+    def setUp(self):
+        locations.reset()
+        invalidate_index()
+
+    def test_radius_limits_results_to_local_agents(self):
+        for enabled in (True, False):
+            with self.subTest(spatial_index=enabled), override_settings(AGENT_SPATIAL_INDEX=enabled):
+                data = self.client.get('/agents/nearest/', {'lat': 22.36, 'lng': 91.82, 'radius_km': 25}).json()
+                self.assertEqual([a['center'] for a in data['agents']], ['Chattogram'])
+                data = self.client.get('/agents/nearest/', {'lat': 22.36, 'lng': 91.82}).json()
+                self.assertEqual([a['center'] for a in data['agents']], ['Chattogram', 'Dhaka', 'Dhaka'])
+
+    def test_bounding_box_prefilter_uses_center_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan text is SQLite specific')
+        plan = ServiceCenter.objects.near(22.36, 91.82, 25).explain()
+        self.assertIn('center_lat_lng_idx', plan)
+        plan = Agent.objects.filter(is_active=True).near(22.36, 91.82, 25).explain()
+        self.assertIn('center_lat_lng_idx', plan)
+
+
+@override_settings(AGENT_LOCATION_FLUSH_INTERVAL=None)
+class LocationPingTests(TestCase):
+    def setUp(self):
+        center = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                              latitude=23.7925, longitude=90.4078)
+        self.user = User.objects.create_user(username='rider-agent', password='x')
+        self.agent = Agent.objects.create(user=self.user, center=center, phone='1')
+        locations.reset()
+        invalidate_index()
+
+    def test_pings_are_buffered_and_flushed_in_bulk(self):
+        self.client.force_login(self.user)
+        with self.assertNumQueries(0):
+            for lat in (22.30, 22.35, 22.36):
+                locations.record_ping(self.agent.id, lat, 91.82)
+        self.assertFalse(AgentLocation.objects.exists())
+
+        data = self.client.get('/agents/nearest/', {'lat': 22.36, 'lng': 91.82, 'radius_km': 5}).json()
+        self.assertEqual([a['id'] for a in data['agents']], [self.agent.id])
+
+        with self.assertNumQueries(1):
+            self.assertEqual(locations.flush(), 1)
+        self.assertEqual(AgentLocation.objects.get(agent=self.agent).latitude, 22.36)
+
+    def test_ping_endpoint_rejects_non_agents(self):
+        other = User.objects.create_user(username='rider', password='x')
+        self.client.force_login(other)
+        response = self.client.post('/agents/ping/', {'lat': 22.36, 'lng': 91.82})
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(AGENT_LOCATION_FLUSH_INTERVAL=None)
+class WorkQueueTests(TestCase):
+    def setUp(self):
+        locations.reset()
+        self.center = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                                   latitude=23.7925, longitude=90.4078)
+        self.agents = []
+        for i in range(2):
+            user = User.objects.create_user(username=f'agent{i}', password='x')
+            self.agents.append(Agent.objects.create(user=user, center=self.center, phone=str(i)))
+        self.rider = User.objects.create_user(username='rider', password='x')
+
+    def report(self, priority='medium', lat=23.79, lng=90.41, **fields):
+        return ProblemReport.objects.create(user=self.rider, title=priority, description='', location='x',
+                                            phone_number='1', priority=priority, latitude=lat, longitude=lng,
+                                            **fields)
+
+    def claim(self, agent):
+        self.client.force_login(agent.user)
+        return self.client.post('/agents/queue/claim/').json()['job']
+
+    def test_claims_most_urgent_nearby_job_first(self):
+        older = self.report('medium')
+        urgent = self.report('urgent')
+        self.report('urgent', lat=22.36, lng=91.82)  # Chattogram, out of range
+        order = Order.objects.create(user=self.rider, center=self.center, total_amount=100, status='confirmed')
+        Order.objects.create(user=self.rider, center=self.center, total_amount=100)  # unpaid
+
+        self.assertEqual(self.claim(self.agents[0])['id'], urgent.id)
+        job = self.claim(self.agents[1])
+        self.assertEqual((job['kind'], job['id']), ('order', order.id))
+        self.assertEqual(self.claim(self.agents[0])['id'], older.id)
+        self.assertIsNone(self.claim(self.agents[1]))
+
+        urgent.refresh_from_db()
+        self.assertEqual((urgent.assigned_agent, urgent.status), (self.agents[0].user, 'assigned'))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'assigned')
+        self.assertEqual(rollup()['status:assigned'], 2)
+
+    def test_unacknowledged_claims_expire(self):
+        report = self.report('high')
+        self.claim(self.agents[0])
+        self.assertIsNone(self.claim(self.agents[1]))
+        ProblemReport.objects.filter(pk=report.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.claim(self.agents[1])['id'], report.id)
+
+        self.client.force_login(self.agents[0].user)
+        self.assertEqual(self.client.post(f'/agents/queue/report/{report.id}/ack/').status_code, 409)
+        self.client.force_login(self.agents[1].user)
+        self.assertEqual(self.client.post(f'/agents/queue/report/{report.id}/ack/').json()['job']['status'],
+                         'in_progress')
+        ProblemReport.objects.filter(pk=report.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(self.claim(self.agents[0]))
+
+
+class DispatchTests(TestCase):
+    def setUp(self):
+        locations.reset()
+        self.center = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                                   latitude=23.7925, longitude=90.4078)
+        user = User.objects.create_user(username='agent', password='x')
+        self.agent = Agent.objects.create(user=user, center=self.center, phone='1')
+        rider = User.objects.create_user(username='rider', password='x')
+        self.orders = Order.objects.bulk_create([
+            Order(user=rider, center=self.center, total_amount=100, status=status)
+            for status in ('confirmed', 'pending', 'completed', 'cancelled') * 5
+        ])
+
+    @override_settings(DISPATCH_MAX_LOAD=20)
+    def test_confirmed_orders_are_read_oldest_first(self):
+        jobs = dispatch._pending_jobs(3)
+        self.assertEqual([job[3] for job in jobs], [order.id for order in self.orders[0:12:4]])
+        self.assertEqual(dispatch.dispatch_tick()['orders'], 5)
+        self.assertEqual(dispatch.agent_loads(), {self.agent.id: 5})
+        # Unpaid online orders wait for payment_success.
+        self.assertFalse(Order.objects.filter(status='pending', assigned_agent__isnull=False).exists())
+
+    @override_settings(DISPATCH_MAX_LOAD=20)
+    def test_tick_keeps_rollup_log_and_events_in_step(self):
+        report = ProblemReport.objects.create(user=self.agent.user, title='Stalled', description='', location='x',
+                                              phone_number='1', latitude=23.79, longitude=90.41)
+        reconcile()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(dispatch.dispatch_tick()['reports'], 1)
+        self.assertEqual(len(callbacks), 6)  # one live status event per assigned job
+        report.refresh_from_db()
+        self.assertEqual((report.status, report.assigned_agent, report.assigned_center),
+                         ('assigned', self.agent.user, self.center))
+        self.assertEqual(reconcile(repair=False), {})
+        self.assertTrue(StatusEvent.objects.filter(kind='problem', object_id=report.pk, to_status='assigned').exists())
+
+    def test_queries_use_the_dispatch_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan text is SQLite specific')
+        with CaptureQueriesContext(connection) as ctx:
+            dispatch._pending_jobs(50)
+            dispatch.agent_loads()
+        for sql in [q['sql'] for q in ctx.captured_queries if 'FROM "orders_order"' in q['sql']]:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            with self.subTest(sql=sql):
+                self.assertIn('order_dispatch_idx', plan)
+                self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+
+@override_settings(AGENT_LOCATION_FLUSH_INTERVAL=None)
+class ConcurrentClaimTests(TransactionTestCase):
+    def test_agents_never_double_claim(self):
+        center = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                              latitude=23.7925, longitude=90.4078)
+        agents = [Agent.objects.create(user=User.objects.create_user(username=f'agent{i}', password='x'),
+                                       center=center, phone=str(i)) for i in range(6)]
+        rider = User.objects.create_user(username='rider', password='x')
+        ProblemReport.objects.bulk_create([
+            ProblemReport(user=rider, title=str(i), description='', location='x', phone_number='1',
+                          latitude=23.79, longitude=90.41, priority=('low', 'urgent')[i % 2])
+            for i in range(30)
+        ])
+        claims, errors = [], []
+        barrier = threading.Barrier(len(agents))
+
+        def worker(agent):
+            try:
+                barrier.wait()
+                while True:
+                    try:
+                        claimed = claim_next(agent)
+                    except OperationalError as exc:
+                        # Shared-cache in-memory SQLite reports contention instead of waiting.
+                        if 'locked' not in str(exc):
+                            raise
+                        continue
+                    if claimed is None:
+                        break
+                    claims.append((claimed, agent.user_id))
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                close_old_connections()
+
+        threads = [threading.Thread(target=worker, args=(agent,)) for agent in agents]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(claims), 30)
+        self.assertEqual(len({job for job, _ in claims}), 30)
+        owners = dict(ProblemReport.objects.values_list('id', 'assigned_agent'))
+        self.assertEqual({job[1]: user_id for job, user_id in claims}, owners)
@@ -4,5 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.agent_list, name='agent_list'),
     path('nearest/', views.nearest_agents, name='nearest_agents'),
+    path('ping/', views.location_ping, name='agent_location_ping'),
+    path('queue/claim/', views.claim_job, name='agent_claim_job'),
+    path('queue/<str:kind>/<int:job_id>/ack/', views.acknowledge_job, name='agent_acknowledge_job'),
 ]
 
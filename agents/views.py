@@ -1,17 +1,15 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from core.geo import haversine_many
+from orders.models import Order
+from reports.models import ProblemReport
+from .dispatch import ORDER_PRIORITY
+from .locations import agent_id_for_user, agent_position, record_ping
 from .models import Agent
-
-
-def _distance_km(a_lat: float, a_lng: float, b_lat: float, b_lng: float) -> float:
-    from math import asin, sqrt, sin, cos, pi
-    R = 6371.0
-    d_lat = (b_lat - a_lat) * pi / 180.0
-    d_lng = (b_lng - a_lng) * pi / 180.0
-    la1 = a_lat * pi / 180.0
-    la2 = b_lat * pi / 180.0
-    x = sin(d_lat/2)**2 + sin(d_lng/2)**2 * cos(la1) * cos(la2)
-    return 2 * R * asin(sqrt(x))
+from .queue import acknowledge, claim_next
+from .spatial import get_index
 
 
 def agent_list(request):
@@ -19,22 +17,41 @@ def agent_list(request):
     return render(request, 'agents/agent_list.html', {'agents': agents})
 
 
+def _nearest_from_db(lat: float, lng: float, limit: int, radius_km=None):
+    agents = Agent.objects.filter(is_active=True).select_related('user', 'center', 'location')
+    if radius_km is not None:
+        agents = agents.near(lat, lng, radius_km)
+    agents = list(agents)
+    positions = [agent_position(ag) for ag in agents]
+    distances = haversine_many(lat, lng, [p[0] for p in positions], [p[1] for p in positions])
+    enriched = sorted(zip(distances, agents), key=lambda x: x[0])
+    if radius_km is not None:
+        enriched = [(d, ag) for d, ag in enriched if d <= radius_km]
+    return enriched[:limit]
+
+
+def _nearest_from_index(lat: float, lng: float, limit: int, radius_km=None):
+    hits = get_index().nearest(lat, lng, limit, radius_km)
+    agents = Agent.objects.filter(id__in=[agent_id for _, agent_id in hits]).select_related('user', 'center').in_bulk()
+    return [(d, agents[agent_id]) for d, agent_id in hits if agent_id in agents]
+
+
 def nearest_agents(request):
     try:
         lat = float(request.GET.get('lat'))
         lng = float(request.GET.get('lng'))
+        limit = int(request.GET.get('limit', 5))
+        radius_km = request.GET.get('radius_km')
+        radius_km = float(radius_km) if radius_km else None
     except (TypeError, ValueError):
         return JsonResponse({'error': 'Invalid or missing lat/lng'}, status=400)
-    limit = int(request.GET.get('limit', 5))
-    agents = Agent.objects.filter(is_active=True).select_related('user', 'center')
-    enriched = []
-    for ag in agents:
-        c = ag.center
-        d = _distance_km(lat, lng, c.latitude, c.longitude)
-        enriched.append((d, ag))
-    enriched.sort(key=lambda x: x[0])
+    limit = max(1, min(limit, 50))
+    if getattr(settings, 'AGENT_SPATIAL_INDEX', True):
+        enriched = _nearest_from_index(lat, lng, limit, radius_km)
+    else:
+        enriched = _nearest_from_db(lat, lng, limit, radius_km)
     data = []
-    for d, ag in enriched[:limit]:
+    for d, ag in enriched:
         data.append({
             'id': ag.id,
             'name': ag.user.get_full_name() or ag.user.get_username(),
@@ -45,4 +62,67 @@ def nearest_agents(request):
         })
     return JsonResponse({'agents': data})
 
-# Create your views here.
+
+@require_POST
+def location_ping(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    agent_id = agent_id_for_user(request.user)
+    if agent_id is None:
+        return JsonResponse({'error': 'Only active agents can report locations'}, status=403)
+    try:
+        lat = float(request.POST.get('lat'))
+        lng = float(request.POST.get('lng'))
+        accuracy = request.POST.get('accuracy')
+        accuracy = float(accuracy) if accuracy else None
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid or missing lat/lng'}, status=400)
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return JsonResponse({'error': 'Invalid or missing lat/lng'}, status=400)
+    record_ping(agent_id, lat, lng, accuracy)
+    return JsonResponse({'ok': True}, status=202)
+
+
+def _queue_agent(request):
+    if not request.user.is_authenticated:
+        return None, JsonResponse({'error': 'Authentication required'}, status=401)
+    agent = (Agent.objects.filter(user=request.user, is_active=True)
+             .select_related('center', 'location').first())
+    if agent is None:
+        return None, JsonResponse({'error': 'Only active agents can take jobs'}, status=403)
+    return agent, None
+
+
+def _job_json(kind: str, pk: int):
+    if kind == 'report':
+        job = ProblemReport.objects.get(pk=pk)
+        return {'kind': kind, 'id': job.id, 'title': job.title, 'priority': job.priority,
+                'status': job.status, 'location': job.location, 'latitude': job.latitude,
+                'longitude': job.longitude, 'lease_expires_at': job.lease_expires_at}
+    job = Order.objects.select_related('center').get(pk=pk)
+    return {'kind': kind, 'id': job.id, 'title': job.item_summary, 'priority': ORDER_PRIORITY,
+            'status': job.status, 'location': job.center.name, 'latitude': job.center.latitude,
+            'longitude': job.center.longitude, 'lease_expires_at': job.lease_expires_at}
+
+
+@require_POST
+def claim_job(request):
+    agent, error = _queue_agent(request)
+    if error:
+        return error
+    claimed = claim_next(agent)
+    if claimed is None:
+        return JsonResponse({'job': None})
+    return JsonResponse({'job': _job_json(*claimed)})
+
+
+@require_POST
+def acknowledge_job(request, kind: str, job_id: int):
+    agent, error = _queue_agent(request)
+    if error:
+        return error
+    if kind not in ('report', 'order'):
+        return JsonResponse({'error': 'Unknown job kind'}, status=404)
+    if not acknowledge(agent, kind, job_id):
+        return JsonResponse({'error': 'Claim has expired or belongs to someone else'}, status=409)
+    return JsonResponse({'job': _job_json(kind, job_id)})
@@ -1,9 +1,8 @@
-from .models import Cart
+from django.utils.functional import SimpleLazyObject
 
-def cart_context(request):
+from .stores import get_cart_store
 
-    if request.user.is_authenticated:
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        return {'cart': cart}
-    return {'cart': None}
 
+def cart_context(request):
+    """Expose ``cart_summary`` lazily: templates that never read it cost nothing."""
+    return {'cart_summary': SimpleLazyObject(lambda: get_cart_store(request).summary())}
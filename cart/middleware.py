@@ -0,0 +1,12 @@
+class AnonymousCartMiddleware:
+    """Write back the anonymous cart if the view (or a login) changed it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        store = getattr(request, '_anonymous_cart', None)
+        if store is not None:
+            store.persist(response)
+        return response
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    CartItem = apps.get_model('cart', 'CartItem')
+    dupes = (CartItem.objects.values('cart_id', 'service_id')
+             .annotate(n=Count('id'), keep=Min('id'), quantity=Sum('quantity'))
+             .filter(n__gt=1).order_by())
+    for row in dupes:
+        CartItem.objects.filter(id=row['keep']).update(quantity=row['quantity'])
+        CartItem.objects.filter(cart_id=row['cart_id'], service_id=row['service_id']).exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'service'), name='unique_cart_service'),
+        ),
+    ]
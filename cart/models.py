@@ -1,9 +1,37 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Count, DecimalField, F, Sum
 from django.contrib.auth import get_user_model
 from services.models import Service
 
 User = get_user_model()
 
+LINE_TOTAL = F('quantity') * F('service__base_price')
+
+
+class CartItemQuerySet(models.QuerySet):
+    def for_user(self, user):
+        return self.filter(cart__user=user)
+
+    def with_services(self):
+        """Lines with their service (and its category) joined in."""
+        return self.select_related('service__category')
+
+    def summary(self) -> dict:
+        """``{'count': lines, 'total': amount}`` from a single aggregate."""
+        result = self.order_by().aggregate(
+            count=Count('id'),
+            total=Sum(LINE_TOTAL, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        )
+        result['total'] = result['total'] or Decimal('0')
+        return result
+
+    def total(self) -> Decimal:
+        return self.order_by().aggregate(
+            total=Sum(LINE_TOTAL, output_field=DecimalField(max_digits=10, decimal_places=2)),
+        )['total'] or Decimal('0')
+
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
@@ -13,9 +41,12 @@ class Cart(models.Model):
         return f"Cart of {self.user.get_username()}"
     
     @property
-    def total(self):
+    def lines(self):
+        return self.items.with_services()
 
-        return sum(item.line_total() for item in self.items.all())
+    @property
+    def total(self):
+        return self.items.total()
 
 
 class CartItem(models.Model):
@@ -23,6 +54,13 @@ class CartItem(models.Model):
     service = models.ForeignKey(Service, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'service'], name='unique_cart_service'),
+        ]
+
     def line_total(self):
         return self.quantity * self.service.base_price
 
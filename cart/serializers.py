@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """One ``{service_id, quantity}`` change; ``quantity`` is added (negative removes)."""
+
+    service_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(default=1, min_value=-1000, max_value=1000)
+
+    def validate_quantity(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Must not be zero.')
+        return value
+
+
+class CartLineSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    service_id = serializers.IntegerField()
+    service = serializers.CharField(source='service.name')
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(source='service.base_price', max_digits=8, decimal_places=2)
+    line_total = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+class CartSerializer(serializers.Serializer):
+    lines = CartLineSerializer(many=True)
+    count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=10, decimal_places=2)
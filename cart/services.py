@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Cart, CartItem
+from .summary import invalidate_cart_summary
+
+
+def apply_quantities(cart: Cart, deltas: dict) -> None:
+    """Add ``{service_id: delta}`` to ``cart`` as atomic upserts.
+
+    Missing lines are inserted in one statement (conflicts on
+    ``unique_cart_service`` are ignored), then each distinct delta is applied
+    with a single ``UPDATE ... SET quantity = quantity + delta``, so concurrent
+    callers never overwrite each other's increments. Lines that drop to zero
+    are removed. Statement count depends on the number of distinct deltas, not
+    on the number of lines.
+    """
+    deltas = {int(service_id): int(delta) for service_id, delta in deltas.items() if int(delta)}
+    if not deltas:
+        return
+    by_delta = {}
+    for service_id, delta in deltas.items():
+        by_delta.setdefault(delta, []).append(service_id)
+    with transaction.atomic():
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, service_id=service_id, quantity=0)
+             for service_id, delta in deltas.items() if delta > 0],
+            ignore_conflicts=True,
+        )
+        lines = CartItem.objects.filter(cart=cart)
+        for delta, service_ids in by_delta.items():
+            lines.filter(service_id__in=service_ids).update(quantity=Greatest(F('quantity') + delta, 0))
+        if any(delta < 0 for delta in by_delta):
+            lines.filter(quantity=0).delete()
+    # Queryset updates and bulk inserts skip the CartItem signals.
+    invalidate_cart_summary(cart.id)
@@ -0,0 +1,167 @@
+"""Where a request's cart lives.
+
+Authenticated users keep their cart in ``Cart``/``CartItem``. Anonymous carts
+are a ``{service_id: quantity}`` map held by ``CART_ANONYMOUS_STORE``: a signed
+cookie by default (no database access when mutating), or the session. When
+the user logs in the anonymous lines are merged into their ``Cart`` with
+``apply_quantities``.
+
+Anonymous lines are unsaved ``CartItem`` instances whose ``id`` is the
+service id, so templates and ``remove`` work the same for both stores.
+"""
+import json
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from services.models import Service
+from .models import Cart, CartItem
+from .services import apply_quantities
+from .summary import EMPTY, get_cart_summary, summarize
+
+
+class DatabaseCartStore:
+    def __init__(self, user):
+        self.user = user
+
+    def add(self, service_id: int) -> None:
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        apply_quantities(cart, {service_id: 1})
+
+    def remove(self, line_id: int) -> None:
+        for item in CartItem.objects.filter(pk=line_id, cart__user=self.user):
+            item.delete()
+
+    def lines(self):
+        return list(CartItem.objects.for_user(self.user).with_services())
+
+    def summary(self) -> dict:
+        return get_cart_summary(self.user.pk)
+
+
+class _AnonymousCartStore:
+    """Base for anonymous stores; subclasses implement ``_load`` and ``_save``."""
+
+    def __init__(self, request):
+        self.request = request
+        self.modified = False
+        self.quantities = self._load()
+        self._lines = None
+
+    def _load(self) -> dict:
+        raise NotImplementedError
+
+    def _save(self, response) -> None:
+        raise NotImplementedError
+
+    def add(self, service_id: int) -> None:
+        key = str(service_id)
+        self.quantities[key] = self.quantities.get(key, 0) + 1
+        self.modified = True
+        self._lines = None
+
+    def remove(self, line_id: int) -> None:
+        if self.quantities.pop(str(line_id), None) is not None:
+            self.modified = True
+            self._lines = None
+
+    def clear(self) -> None:
+        if self.quantities:
+            self.quantities = {}
+            self.modified = True
+            self._lines = None
+
+    def persist(self, response) -> None:
+        if self.modified:
+            self._save(response)
+            self.modified = False
+
+    def lines(self):
+        if not self.quantities:
+            return []
+        if self._lines is None:
+            services = Service.objects.filter(id__in=self.quantities, is_active=True).select_related('category')
+            self._lines = [CartItem(id=s.id, service=s, quantity=self.quantities[str(s.id)]) for s in services]
+        return self._lines
+
+    def summary(self) -> dict:
+        if not self.quantities:
+            return EMPTY
+        return summarize(self.lines())
+
+
+class CookieCartStore(_AnonymousCartStore):
+    salt = 'cart.stores.CookieCartStore'
+
+    @property
+    def cookie_name(self) -> str:
+        return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+    def _load(self) -> dict:
+        raw = self.request.get_signed_cookie(self.cookie_name, default=None, salt=self.salt)
+        try:
+            data = json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+        return {k: int(v) for k, v in data.items() if str(k).isdigit() and int(v) > 0}
+
+    def _save(self, response) -> None:
+        if not self.quantities:
+            response.delete_cookie(self.cookie_name)
+            return
+        response.set_signed_cookie(
+            self.cookie_name, json.dumps(self.quantities, separators=(',', ':')), salt=self.salt,
+            max_age=getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 30),
+            httponly=True, samesite='Lax',
+        )
+
+
+class SessionCartStore(_AnonymousCartStore):
+    session_key = 'cart'
+
+    def _load(self) -> dict:
+        return dict(self.request.session.get(self.session_key, {}))
+
+    def _save(self, response) -> None:
+        if self.quantities:
+            self.request.session[self.session_key] = self.quantities
+        else:
+            self.request.session.pop(self.session_key, None)
+
+
+def anonymous_store(request):
+    """The request's anonymous cart store, created once per request."""
+    store = getattr(request, '_anonymous_cart', None)
+    if store is None:
+        cls = import_string(getattr(settings, 'CART_ANONYMOUS_STORE', 'cart.stores.CookieCartStore'))
+        store = request._anonymous_cart = cls(request)
+    return store
+
+
+def get_cart_store(request):
+    if request.user.is_authenticated:
+        return DatabaseCartStore(request.user)
+    return anonymous_store(request)
+
+
+def merge_into_cart(user, quantities: dict) -> None:
+    """Add anonymous ``{service_id: quantity}`` lines to ``user``'s cart in bulk."""
+    quantities = {int(k): v for k, v in quantities.items()}
+    valid = set(Service.objects.filter(id__in=quantities, is_active=True).values_list('id', flat=True))
+    quantities = {k: v for k, v in quantities.items() if k in valid}
+    if not quantities:
+        return
+    cart, _ = Cart.objects.get_or_create(user=user)
+    apply_quantities(cart, quantities)
+
+
+@receiver(user_logged_in)
+def _merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is None:
+        return
+    store = anonymous_store(request)
+    if store.quantities:
+        merge_into_cart(user, store.quantities)
+        store.clear()
@@ -0,0 +1,72 @@
+"""Per-user cart badge data (line count and total), cached until the cart changes.
+
+Summaries are keyed by cart id so ``CartItem`` signals can invalidate them
+without a query; a second entry maps each user to their cart id (0 when they
+have none yet). Signals only clear the cache of the process that saw the
+change, so with the default per-process cache both entries also expire after
+``CART_SUMMARY_TIMEOUT`` seconds (60 by default); configure a shared cache
+for the badge to follow changes made in other workers immediately.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Cart, CartItem
+
+EMPTY = {'count': 0, 'total': Decimal('0')}
+
+
+def _cart_key(user_id) -> str:
+    return f'cart-id:{user_id}'
+
+
+def _summary_key(cart_id) -> str:
+    return f'cart-summary:{cart_id}'
+
+
+def _timeout() -> int:
+    return getattr(settings, 'CART_SUMMARY_TIMEOUT', 60)
+
+
+def get_cart_summary(user_id) -> dict:
+    cart_id = cache.get(_cart_key(user_id))
+    if cart_id is None:
+        cart_id = Cart.objects.filter(user_id=user_id).values_list('id', flat=True).first() or 0
+        cache.set(_cart_key(user_id), cart_id, _timeout())
+    if not cart_id:
+        return EMPTY
+    summary = cache.get(_summary_key(cart_id))
+    if summary is None:
+        summary = CartItem.objects.filter(cart_id=cart_id).summary()
+        cache.set(_summary_key(cart_id), summary, _timeout())
+    return summary
+
+
+def summarize(lines) -> dict:
+    """Count and total of already loaded lines, for pages that also list them."""
+    return {'count': len(lines), 'total': sum((line.line_total() for line in lines), Decimal('0'))}
+
+
+def invalidate_cart_summary(cart_id) -> None:
+    cache.delete(_summary_key(cart_id))
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def _cart_item_changed(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.cart_id)
+
+
+@receiver(post_save, sender=Cart)
+def _cart_saved(sender, instance, created, **kwargs):
+    if created:
+        cache.set(_cart_key(instance.user_id), instance.id, _timeout())
+
+
+@receiver(post_delete, sender=Cart)
+def _cart_deleted(sender, instance, **kwargs):
+    cache.delete(_cart_key(instance.user_id))
+    invalidate_cart_summary(instance.id)
@@ -1,3 +1,191 @@
-from django.test import TestCase
+import threading
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from services.models import Service, ServiceCategory
+from .models import Cart, CartItem
+from .services import apply_quantities
+from .summary import get_cart_summary
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rider', password='pw')
+        category = ServiceCategory.objects.create(name='Cleaning')
+        self.service = Service.objects.create(name='Wash', description='', category=category,
+                                              base_price=Decimal('120.00'))
+
+    def test_cached_summary_costs_no_queries(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, service=self.service, quantity=2)
+        self.assertEqual(get_cart_summary(self.user.id), {'count': 1, 'total': Decimal('240.00')})
+        with self.assertNumQueries(0):
+            get_cart_summary(self.user.id)
+
+    def test_adding_to_cart_refreshes_badge(self):
+        self.client.force_login(self.user)
+        self.assertEqual(get_cart_summary(self.user.id)['count'], 0)
+        self.client.get(f'/cart/add/{self.service.id}/')
+        self.assertEqual(get_cart_summary(self.user.id)['count'], 1)
+        self.client.get(f'/cart/add/{self.service.id}/')
+        self.assertEqual(get_cart_summary(self.user.id)['total'], Decimal('240.00'))
+
+    @override_settings(CART_SUMMARY_TIMEOUT=1)
+    def test_entries_expire(self):
+        self.assertEqual(get_cart_summary(self.user.id)['count'], 0)
+        # Like a cart filled in another worker: no signal reaches this cache.
+        cart = Cart.objects.bulk_create([Cart(user=self.user)])[0]
+        CartItem.objects.bulk_create([CartItem(cart=cart, service=self.service, quantity=1)])
+        self.assertEqual(get_cart_summary(self.user.id)['count'], 0)
+        # Two seconds later, by the cache's clock.
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertEqual(get_cart_summary(self.user.id)['count'], 1)
+
+
+class CartQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rider', password='pw')
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = ServiceCategory.objects.create(name='Cleaning')
+
+    def _add_lines(self, n):
+        for i in range(n):
+            service = Service.objects.create(name=f'Wash {i}', description='', category=self.category,
+                                             base_price=Decimal('50.00'))
+            CartItem.objects.create(cart=self.cart, service=service, quantity=2)
+
+    def test_total_is_one_aggregate(self):
+        self._add_lines(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cart.total, Decimal('300.00'))
+
+    def test_view_cart_queries_do_not_grow_with_lines(self):
+        self.client.force_login(self.user)
+        self._add_lines(1)
+        with CaptureQueriesContext(connection) as one_line:
+            self.client.get('/cart/')
+        self._add_lines(9)
+        with CaptureQueriesContext(connection) as ten_lines:
+            response = self.client.get('/cart/')
+        self.assertEqual(len(one_line), len(ten_lines))
+        self.assertEqual(response.context['total'], Decimal('1000.00'))
+
+    def test_view_cart_total_matches_its_lines(self):
+        self.client.force_login(self.user)
+        self._add_lines(2)
+        # A badge summary cached before another worker changed the cart.
+        cache.set(f'cart-summary:{self.cart.id}', {'count': 1, 'total': Decimal('1.00')})
+        response = self.client.get('/cart/')
+        self.assertEqual(response.context['total'], sum(line.line_total() for line in response.context['lines']))
+        self.assertEqual(response.context['total'], Decimal('200.00'))
+
+
+class AnonymousCartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = ServiceCategory.objects.create(name='Cleaning')
+        self.wash = Service.objects.create(name='Wash', description='', category=category,
+                                           base_price=Decimal('120.00'))
+        self.polish = Service.objects.create(name='Polish', description='', category=category,
+                                             base_price=Decimal('80.00'))
+        self.user = User.objects.create_user('rider', password='pw')
+
+    def test_anonymous_add_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/cart/add/{self.wash.id}/')
+            self.client.get(f'/cart/add/{self.wash.id}/')
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries))
+        response = self.client.get('/cart/')
+        self.assertEqual(response.context['total'], Decimal('240.00'))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_login_merges_anonymous_cart(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, service=self.wash, quantity=1)
+        self.client.get(f'/cart/add/{self.wash.id}/')
+        self.client.get(f'/cart/add/{self.polish.id}/')
+        response = self.client.post('/accounts/login/', {'username': 'rider', 'password': 'pw'})
+        self.assertEqual(response.cookies['cart'].value, '')
+        quantities = dict(CartItem.objects.filter(cart=cart).values_list('service_id', 'quantity'))
+        self.assertEqual(quantities, {self.wash.id: 2, self.polish.id: 1})
+        self.assertEqual(get_cart_summary(self.user.id)['total'], Decimal('320.00'))
+
+
+class CartAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = ServiceCategory.objects.create(name='Cleaning')
+        self.wash = Service.objects.create(name='Wash', description='', category=category,
+                                           base_price=Decimal('120.00'))
+        self.polish = Service.objects.create(name='Polish', description='', category=category,
+                                             base_price=Decimal('80.00'))
+        self.user = User.objects.create_user('rider', password='pw')
+        self.client.force_login(self.user)
+
+    def post(self, operations):
+        return self.client.post('/cart/api/', {'operations': operations}, content_type='application/json')
+
+    def test_batch_upserts_and_removes(self):
+        response = self.post([
+            {'service_id': self.wash.id, 'quantity': 2},
+            {'service_id': self.polish.id},
+            {'service_id': self.wash.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total'], '440.00')
+        response = self.post([{'service_id': self.polish.id, 'quantity': -1}])
+        self.assertEqual([line['service_id'] for line in response.json()['lines']], [self.wash.id])
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_rejects_unknown_services(self):
+        response = self.post([{'service_id': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class ConcurrentCartTests(TransactionTestCase):
+    def test_concurrent_adds_lose_no_updates(self):
+        category = ServiceCategory.objects.create(name='Cleaning')
+        service = Service.objects.create(name='Wash', description='', category=category,
+                                         base_price=Decimal('10.00'))
+        user = User.objects.create_user('rider', password='pw')
+        cart = Cart.objects.create(user=user)
+        threads, rounds = 8, 25
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                for _ in range(rounds):
+                    # The shared-cache in-memory test database reports lock
+                    # contention instead of waiting; a failed call rolls
+                    # back entirely, so retrying cannot double count.
+                    while True:
+                        try:
+                            apply_quantities(cart, {service.id: 1})
+                            break
+                        except OperationalError as exc:
+                            if 'locked' not in str(exc):
+                                raise
+            except Exception as exc:  # pragma: no cover - reported below
+                errors.append(exc)
+            finally:
+                close_old_connections()
+
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(CartItem.objects.get(cart=cart, service=service).quantity, threads * rounds)
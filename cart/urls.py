@@ -5,5 +5,6 @@ urlpatterns = [
     path('', views.view_cart, name='view_cart'),
     path('add/<int:service_id>/', views.add_to_cart, name='add_to_cart'),
     path('remove/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
+    path('api/', views.CartAPIView.as_view(), name='cart_api'),
 ]
 
@@ -1,36 +1,70 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
 from .models import Cart, CartItem
+from .serializers import CartOperationSerializer, CartSerializer
+from .services import apply_quantities
+from .stores import get_cart_store
+from .summary import summarize
 from services.models import Service
 
 
-def _get_or_create_cart(user):
-    cart, _ = Cart.objects.get_or_create(user=user)
-    return cart
-
-
-@login_required
 def view_cart(request):
-    cart = _get_or_create_cart(request.user)
-    return render(request, 'cart/view_cart.html', {'cart': cart})
+    store = get_cart_store(request)
+    lines = store.lines()
+    # From the lines shown, not the cached badge summary, so they always add up.
+    total = summarize(lines)['total'] if lines else 0
+    return render(request, 'cart/view_cart.html', {'lines': lines, 'total': total})
 
 
-@login_required
 def add_to_cart(request, service_id: int):
-    cart = _get_or_create_cart(request.user)
     service = get_object_or_404(Service, pk=service_id, is_active=True)
-    item, created = CartItem.objects.get_or_create(cart=cart, service=service)
-    if not created:
-        item.quantity += 1
-        item.save()
+    get_cart_store(request).add(service.id)
     return redirect('view_cart')
 
 
-@login_required
 def remove_from_cart(request, item_id: int):
-    cart = _get_or_create_cart(request.user)
-    item = get_object_or_404(CartItem, pk=item_id, cart=cart)
-    item.delete()
+    get_cart_store(request).remove(item_id)
     return redirect('view_cart')
 
-# Create your views here.
+
+class CartAPIView(APIView):
+    """``GET`` the cart, or ``POST`` a batch of ``{service_id, quantity}`` operations.
+
+    The batch is either a bare list or ``{"operations": [...]}`` and is applied
+    atomically through ``apply_quantities``.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def _cart_response(self, user):
+        lines = list(CartItem.objects.for_user(user).with_services())
+        return Response(CartSerializer({'lines': lines, **summarize(lines)}).data)
+
+    def get(self, request):
+        return self._cart_response(request.user)
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get('operations')
+        serializer = CartOperationSerializer(data=data, many=True)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data
+        if len(operations) > getattr(settings, 'CART_API_MAX_OPERATIONS', 100):
+            return Response({'detail': 'Too many operations.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        deltas = {}
+        for op in operations:
+            deltas[op['service_id']] = deltas.get(op['service_id'], 0) + op['quantity']
+        additions = {service_id for service_id, delta in deltas.items() if delta > 0}
+        known = set(Service.objects.filter(id__in=additions, is_active=True).values_list('id', flat=True))
+        if additions - known:
+            return Response({'detail': 'Unknown or inactive services.', 'service_ids': sorted(additions - known)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        apply_quantities(cart, deltas)
+        return self._cart_response(request.user)
@@ -0,0 +1,16 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('centers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicecenter',
+            index=models.Index(fields=['latitude', 'longitude'], name='center_lat_lng_idx'),
+        ),
+    ]
@@ -1,5 +1,13 @@
 from django.db import models
 
+from core.geo import bounding_box
+
+
+class ServiceCenterQuerySet(models.QuerySet):
+    def near(self, lat: float, lng: float, radius_km: float):
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        return self.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lng, max_lng))
+
 
 class ServiceCenter(models.Model):
     name = models.CharField(max_length=150)
@@ -9,6 +17,13 @@ class ServiceCenter(models.Model):
     longitude = models.FloatField()
     is_active = models.BooleanField(default=True)
 
+    objects = ServiceCenterQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['latitude', 'longitude'], name='center_lat_lng_idx'),
+        ]
+
     def __str__(self) -> str:
         return self.name
 
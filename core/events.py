@@ -0,0 +1,177 @@
+"""Live status updates pushed to browsers as Server-Sent Events.
+
+``broker`` is an in-process publish/subscribe hub. Pages that show an order
+or a problem report open an ``EventSource`` on that object's ``events/`` URL;
+the async view subscribes to its channel (``order:<id>``, ``problem:<id>``)
+and then sits idle on an ``asyncio.Queue`` until something is published, so
+a watcher costs one open connection and no queries or renders.
+
+Publishing is thread-safe and never blocks: messages are handed to each
+subscriber's event loop, and a subscriber that falls more than
+``SSE_QUEUE_SIZE`` messages behind loses the oldest ones. Streams end after
+``SSE_MAX_AGE`` seconds and the browser reconnects. ``track_status``
+(called from ``AppConfig.ready``) publishes status changes saved through
+the ORM once the transaction commits; writes that bypass signals (queryset
+``update()``, raw SQL) call ``publish_status`` themselves.
+
+The broker only reaches clients connected to the same process, and
+streaming needs an ASGI server. Under WSGI (e.g. ``runserver``) the view
+sends the current state and closes, and ``EventSource`` reconnects after
+``SSE_RETRY`` milliseconds.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import StreamingHttpResponse
+
+from .tracking import loaded, track
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def channel(kind: str, pk) -> str:
+    return f'{kind}:{pk}'
+
+
+class Subscription:
+    """One client's queue on one channel; use as a context manager."""
+
+    def __init__(self, broker, name: str, loop=None):
+        self.broker = broker
+        self.channel = name
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=_setting('SSE_QUEUE_SIZE', 100))
+
+    def _deliver(self, message) -> None:
+        # Runs on the subscriber's loop.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: float):
+        """Next ``(id, event, data)`` message, or None after ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker._remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Broker:
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, name: str, loop=None) -> Subscription:
+        subscription = Subscription(self, name, loop)
+        with self._lock:
+            self._channels[name].add(subscription)
+        return subscription
+
+    def _remove(self, subscription) -> None:
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def subscriber_count(self, name: str) -> int:
+        with self._lock:
+            return len(self._channels.get(name, ()))
+
+    def publish(self, name: str, event: str, data) -> int:
+        """Send ``data`` to every subscriber of ``name``; returns how many there were."""
+        with self._lock:
+            subscribers = list(self._channels.get(name, ()))
+            message = (next(self._ids), event, data)
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down.
+                subscription.close()
+        return len(subscribers)
+
+
+broker = Broker()
+
+
+def publish_on_commit(name: str, event: str, data) -> None:
+    transaction.on_commit(lambda: broker.publish(name, event, data))
+
+
+def status_payload(model, status: str) -> dict:
+    return {'status': status, 'label': str(dict(model.STATUS_CHOICES).get(status, status))}
+
+
+def publish_status(model, kind: str, pk, status: str) -> None:
+    """Announce that ``pk`` moved to ``status``, after the transaction commits."""
+    publish_on_commit(channel(kind, pk), 'status', status_payload(model, status))
+
+
+def track_status(model, kind: str) -> None:
+    """Publish ``model.status`` changes made through ``save()`` on ``kind:<pk>``."""
+
+    def saved(instance, created):
+        if created or instance.status != loaded(instance, 'status'):
+            publish_status(model, kind, instance.pk, instance.status)
+
+    track(model, ['status'], saved, uid='core.events')
+
+
+def format_event(message) -> str:
+    event_id, event, data = message
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
+
+
+async def _stream(subscription, snapshot):
+    with subscription:
+        yield f"retry: {_setting('SSE_RETRY', 3000)}\n\n"
+        for event, data in snapshot:
+            yield format_event((0, event, data))
+        heartbeat = _setting('SSE_HEARTBEAT', 15)
+        # Ending now and then lets the client reconnect and bounds how long a
+        # stream outlives a client whose disconnect the server never noticed.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _setting('SSE_MAX_AGE', 600)
+        while loop.time() < deadline:
+            message = await subscription.get(min(heartbeat, max(deadline - loop.time(), 0)))
+            # A comment line keeps proxies from timing out an idle stream.
+            yield ': ping\n\n' if message is None else format_event(message)
+
+
+def event_stream(request, subscription, snapshot) -> StreamingHttpResponse:
+    """Stream ``snapshot`` (``[(event, data)]``), then whatever ``subscription`` receives.
+
+    Subscribe before reading the snapshot so no update falls in between.
+    """
+    if isinstance(request, ASGIRequest):
+        content = _stream(subscription, snapshot)
+    else:
+        subscription.close()
+        content = [f"retry: {_setting('SSE_RETRY', 3000)}\n\n"]
+        content += [format_event((0, event, data)) for event, data in snapshot]
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
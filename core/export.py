@@ -0,0 +1,116 @@
+"""Streaming CSV / JSON Lines export of orders and problem reports.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and encoded
+one chunk at a time, optionally through a streaming gzip compressor, so
+memory stays flat however many rows match.
+"""
+import csv
+import json
+import zlib
+from datetime import date, datetime, time
+
+from django.utils import timezone
+
+CHUNK_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _datasets():
+    from orders.models import Order, OrderItem
+    from reports.models import ProblemReport
+
+    return {
+        'orders': {
+            'queryset': Order.objects.all(),
+            'fields': ['id', 'user_id', 'center_id', 'assigned_agent_id', 'status', 'total_amount',
+                       'item_count', 'scheduled_time', 'created_at'],
+            'created': 'created_at',
+            'status': 'status',
+        },
+        'order_items': {
+            'queryset': OrderItem.objects.all(),
+            'fields': ['id', 'order_id', 'service_id', 'service__name', 'quantity', 'price',
+                       'order__status', 'order__created_at'],
+            'created': 'order__created_at',
+            'status': 'order__status',
+        },
+        'problem_reports': {
+            'queryset': ProblemReport.objects.all(),
+            'fields': ['id', 'user_id', 'title', 'problem_type', 'priority', 'status', 'location',
+                       'latitude', 'longitude', 'assigned_agent_id', 'assigned_center_id',
+                       'created_at', 'updated_at'],
+            'created': 'created_at',
+            'status': 'status',
+        },
+    }
+
+
+def dataset_names():
+    return sorted(_datasets())
+
+
+def _day_bound(value, end: bool = False):
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return timezone.make_aware(datetime.combine(value, time.max if end else time.min))
+
+
+def export_rows(name: str, since=None, until=None, statuses=None):
+    """``(header, rows)`` for dataset ``name``; ``rows`` is a lazy iterator.
+
+    ``since``/``until`` are inclusive dates (``date`` or ``YYYY-MM-DD``).
+    """
+    spec = _datasets()[name]
+    qs = spec['queryset']
+    if since:
+        qs = qs.filter(**{f"{spec['created']}__gte": _day_bound(since)})
+    if until:
+        qs = qs.filter(**{f"{spec['created']}__lte": _day_bound(until, end=True)})
+    if statuses:
+        qs = qs.filter(**{f"{spec['status']}__in": statuses})
+    rows = qs.order_by('pk').values_list(*spec['fields']).iterator(chunk_size=CHUNK_SIZE)
+    return spec['fields'], rows
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode(header, rows, fmt: str = 'csv'):
+    """Yield encoded byte chunks of roughly ``CHUNK_SIZE`` rows each."""
+    buffer = []
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(header).encode()
+        for row in rows:
+            buffer.append(writer.writerow(row))
+            if len(buffer) >= CHUNK_SIZE:
+                yield ''.join(buffer).encode()
+                buffer = []
+    elif fmt == 'jsonl':
+        for row in rows:
+            buffer.append(json.dumps(dict(zip(header, row)), default=_json_value))
+            buffer.append('\n')
+            if len(buffer) >= 2 * CHUNK_SIZE:
+                yield ''.join(buffer).encode()
+                buffer = []
+    else:
+        raise ValueError(f"Unknown export format {fmt!r}")
+    if buffer:
+        yield ''.join(buffer).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
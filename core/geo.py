@@ -0,0 +1,108 @@
+"""Great-circle distance helpers shared by agent lookup and dispatch, and
+geohash cells for the problem heatmap.
+
+``haversine_many`` is vectorized with NumPy when it is installed and falls
+back to a plain Python loop otherwise, so callers never need to care which
+one they got.
+"""
+from math import asin, cos, pi, sin, sqrt
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised when NumPy is absent
+    np = None
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * pi / 180.0
+
+
+def haversine_km(a_lat: float, a_lng: float, b_lat: float, b_lng: float) -> float:
+    d_lat = (b_lat - a_lat) * pi / 180.0
+    d_lng = (b_lng - a_lng) * pi / 180.0
+    la1 = a_lat * pi / 180.0
+    la2 = b_lat * pi / 180.0
+    x = sin(d_lat/2)**2 + sin(d_lng/2)**2 * cos(la1) * cos(la2)
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(min(1.0, x)))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float):
+    """``(min_lat, max_lat, min_lng, max_lng)`` enclosing a circle of ``radius_km``.
+
+    The box is slightly generous so it can be used as a cheap index prefilter
+    before the exact haversine check.
+    """
+    d_lat = radius_km / KM_PER_DEG_LAT
+    cos_lat = cos(min(89.9, abs(lat) + d_lat) * pi / 180.0)
+    d_lng = min(180.0, d_lat / max(cos_lat, 1e-6))
+    return lat - d_lat, lat + d_lat, lng - d_lng, lng + d_lng
+
+
+def _haversine_many_py(lat, lng, lats, lngs):
+    return [haversine_km(lat, lng, b_lat, b_lng) for b_lat, b_lng in zip(lats, lngs)]
+
+
+def _haversine_many_np(lat, lng, lats, lngs):
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lngs = np.radians(np.asarray(lngs, dtype=float))
+    la1 = np.radians(np.asarray(lat, dtype=float))
+    lo1 = np.radians(np.asarray(lng, dtype=float))
+    x = np.sin((lats - la1) / 2) ** 2 + np.sin((lngs - lo1) / 2) ** 2 * np.cos(la1) * np.cos(lats)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, x)))
+
+
+def haversine_many(lat, lng, lats, lngs):
+    """Distances in km from ``(lat, lng)`` to each point of ``lats``/``lngs``.
+
+    With NumPy, ``lat``/``lng`` may also be arrays that broadcast against the
+    candidates (e.g. a column of jobs against a row of agents) and the result
+    is an ``ndarray``; otherwise a list is returned.
+    """
+    if np is not None:
+        return _haversine_many_np(lat, lng, lats, lngs)
+    return _haversine_many_py(lat, lng, lats, lngs)
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+_GEOHASH_BITS = {c: i for i, c in enumerate(GEOHASH_ALPHABET)}
+
+
+def geohash_encode(lat: float, lng: float, precision: int = 6) -> str:
+    """Geohash of ``(lat, lng)``; each extra character narrows the cell 32-fold."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash: str):
+    """``(min_lat, max_lat, min_lng, max_lng)`` of a geohash cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _GEOHASH_BITS[char]
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def is_geohash(value: str) -> bool:
+    return all(c in _GEOHASH_BITS for c in value)
@@ -0,0 +1,106 @@
+"""Replay the first response of a request for every retry with the same key.
+
+Clients send an ``Idempotency-Key`` header (or an ``idempotency_key`` form
+field; never a query parameter, since these views change state). The first
+request with a given key runs the view and stores its response; retries within
+``IDEMPOTENCY_KEY_TTL`` seconds get the stored response back without running
+the view again. A retry that arrives while the first request is still running
+gets ``409 Conflict``, unless that placeholder is older than
+``IDEMPOTENCY_LEASE`` seconds: its worker is then presumed dead and the retry
+takes the key over.
+"""
+import uuid
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+
+
+def new_key() -> str:
+    return uuid.uuid4().hex
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _lease() -> timedelta:
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LEASE', 60))
+
+
+def _request_key(request):
+    key = request.headers.get(HEADER) or request.POST.get(FIELD)
+    return key.strip()[:64] if key else None
+
+
+def _replay(record):
+    if record is None or record.status_code is None:
+        return HttpResponse('A request with this idempotency key is still being processed.', status=409)
+    if record.location:
+        response = HttpResponseRedirect(record.location)
+        response.status_code = record.status_code
+        return response
+    return HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+
+
+def _claim(user, scope: str, key: str):
+    """Return ``(record, created)``; a new record is an in-flight placeholder."""
+    lookup = {'user': user, 'scope': scope, 'key': key}
+    record = IdempotencyKey.objects.filter(**lookup).first()
+    if record is not None:
+        expiry = _lease() if record.status_code is None else _ttl()
+        if record.created_at >= timezone.now() - expiry:
+            return record, False
+        # An expired response, or a placeholder whose worker died mid-request.
+        record.delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(**lookup), True
+    except IntegrityError:
+        # Lost the race against a concurrent retry of the same request.
+        return IdempotencyKey.objects.filter(**lookup).first(), False
+
+
+def idempotent(scope: str):
+    """Make a view safe to retry with a client-supplied idempotency key."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = _request_key(request)
+            if not key or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            record, created = _claim(request.user, scope, key)
+            if not created:
+                return _replay(record)
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                record.delete()
+                raise
+            if response.streaming or response.status_code >= 500:
+                record.delete()
+                return response
+            record.status_code = response.status_code
+            if response.has_header('Location'):
+                record.location = response['Location']
+            else:
+                record.content_type = response.get('Content-Type', '')
+                record.content = response.content
+            record.save(update_fields=['status_code', 'location', 'content_type', 'content'])
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired() -> int:
+    cutoff = timezone.now() - _ttl()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
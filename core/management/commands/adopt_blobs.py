@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from core.storage import BLOB_PREFIX, adopt, tracked_fields
+
+
+class Command(BaseCommand):
+    help = "Move photos uploaded before content-addressed storage into deduplicated blobs"
+
+    def handle(self, *args, **options):
+        for model, field_name in tracked_fields:
+            rows = (model.objects.exclude(**{field_name: ''}).exclude(**{field_name: None})
+                    .exclude(**{f'{field_name}__startswith': BLOB_PREFIX + '/'}))
+            # Variants are named after the original, so adopted photos need new ones.
+            has_variants = any(f.name == 'variants_ready' for f in model._meta.get_fields())
+            moved = missing = 0
+            for instance in rows.iterator(chunk_size=200):
+                try:
+                    adopt(instance, field_name)
+                    if has_variants:
+                        model.objects.filter(pk=instance.pk).update(variants_ready=False)
+                except FileNotFoundError:
+                    missing += 1
+                else:
+                    moved += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"{model._meta.label}.{field_name}: {moved} adopted, {missing} missing on disk."
+            ))
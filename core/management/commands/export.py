@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import FORMATS, dataset_names, encode, export_rows, gzipped
+
+
+class Command(BaseCommand):
+    help = "Stream orders, order items or problem reports to a CSV/JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=dataset_names())
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--since', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--until', help='Last day to include (YYYY-MM-DD)')
+        parser.add_argument('--status', action='append', help='Only rows with this status (repeatable)')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            header, rows = export_rows(options['dataset'], options['since'], options['until'], options['status'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        chunks = encode(header, rows, options['format'])
+        if options['gzip']:
+            chunks = gzipped(chunks)
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options['output']:
+                out.close()
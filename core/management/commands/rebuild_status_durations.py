@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from core.models import StatusDuration
+from core.transitions import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the StatusDuration SLA totals from the StatusEvent log"
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {StatusDuration.objects.count()} duration totals."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.storage import sweep
+
+
+class Command(BaseCommand):
+    help = "Remove unreferenced photo blobs and files left behind by rolled-back uploads"
+
+    def handle(self, *args, **options):
+        blobs, files = sweep()
+        self.stdout.write(self.style.SUCCESS(f"Removed {blobs} unreferenced blobs and {files} orphaned files."))
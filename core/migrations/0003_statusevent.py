@@ -0,0 +1,42 @@
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('centers', '0002_servicecenter_lat_lng_index'),
+        ('core', '0002_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=60, unique=True)),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('problem', 'Problem report')], max_length=10)),
+                ('metric', models.CharField(max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('center', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='centers.servicecenter')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatusEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('problem', 'Problem report')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('center', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='centers.servicecenter')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'object_id', 'at'], name='status_event_object_idx'), models.Index(fields=['kind', 'to_status', 'at'], name='status_event_status_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_statusevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='referenced_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='saved_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,87 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class IdempotencyKey(models.Model):
+    """First response to a client-keyed request, replayed for retries."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    location = models.CharField(max_length=500, blank=True)
+    content = models.BinaryField(blank=True, default=b'')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='idempotency_key_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope}:{self.key}"
+
+
+class Blob(models.Model):
+    """A content-addressed file in ``core.storage`` and how many rows use it."""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(default=0)
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last upload of these bytes and last new reference; an upload newer than
+    # the last reference may still be about to reference the blob.
+    saved_at = models.DateTimeField(null=True, blank=True)
+    referenced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.refcount})"
+
+
+class StatusEvent(models.Model):
+    """One status change of an order or problem report (see ``core.transitions``).
+
+    Rows are only ever inserted. ``from_status`` is empty for the row written
+    when the object is created; ``center`` is the object's center at the time.
+    """
+    KINDS = [('order', 'Order'), ('problem', 'Problem report')]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    # No database constraint: deleting a center must not rewrite history.
+    center = models.ForeignKey('centers.ServiceCenter', on_delete=models.DO_NOTHING, db_constraint=False,
+                               null=True, blank=True, related_name='+')
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id', 'at'], name='status_event_object_idx'),
+            models.Index(fields=['kind', 'to_status', 'at'], name='status_event_status_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.object_id}: {self.from_status or '-'} -> {self.to_status}"
+
+
+class StatusDuration(models.Model):
+    """Running count and total of one SLA duration for one kind and center.
+
+    ``key`` is ``<kind>:<metric>:<center id or ->``; rows are adjusted in
+    the same transaction as the ``StatusEvent`` they come from.
+    """
+    key = models.CharField(max_length=60, unique=True)
+    kind = models.CharField(max_length=10, choices=StatusEvent.KINDS)
+    metric = models.CharField(max_length=20)
+    center = models.ForeignKey('centers.ServiceCenter', on_delete=models.DO_NOTHING, db_constraint=False,
+                               null=True, blank=True, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.count if self.count else None
+
+    def __str__(self) -> str:
+        return f"{self.key}: {self.count}"
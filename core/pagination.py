@@ -0,0 +1,111 @@
+"""Keyset (cursor) pagination over ``(created_at, id)``.
+
+Unlike ``django.core.paginator.Paginator`` this never runs ``COUNT(*)`` and
+never uses ``OFFSET``: each page is a range scan starting right after the
+last row of the previous one, so page N costs the same as page 1. Cursors
+are signed, opaque strings carrying the boundary row's key and a direction.
+"""
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.core import signing
+from django.db.models import Q
+
+_SALT = 'core.pagination'
+
+
+def encode_cursor(created_at, pk, direction: str) -> str:
+    return signing.dumps([created_at.isoformat(), pk, direction], salt=_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """``(created_at, pk, direction)`` or None for a missing/tampered cursor."""
+    if not cursor:
+        return None
+    try:
+        created_at, pk, direction = signing.loads(cursor, salt=_SALT)
+        return datetime.fromisoformat(created_at), int(pk), direction
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, params):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def __bool__(self) -> bool:
+        return bool(self.object_list)
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def _querystring(self, cursor) -> str:
+        params = [(k, v) for k, v in self._params if k != 'cursor']
+        params.append(('cursor', cursor))
+        return urlencode(params)
+
+    @property
+    def next_querystring(self) -> str:
+        return self._querystring(self.next_cursor) if self.next_cursor else ''
+
+    @property
+    def previous_querystring(self) -> str:
+        return self._querystring(self.previous_cursor) if self.previous_cursor else ''
+
+    def as_json(self, serialize) -> dict:
+        return {
+            'results': [serialize(obj) for obj in self.object_list],
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+        }
+
+
+def paginate(queryset, request, per_page: int) -> KeysetPage:
+    """Page of ``queryset`` (newest first) selected by ``request.GET['cursor']``."""
+    position = decode_cursor(request.GET.get('cursor'))
+    params = list(request.GET.lists())
+    params = [(k, v) for k, values in params for v in values]
+    if position is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+        backwards, has_more, came_from_cursor = False, len(rows) > per_page, False
+    else:
+        created_at, pk, direction = position
+        backwards = direction == 'prev'
+        if backwards:
+            after = Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            rows = list(queryset.filter(after).order_by('created_at', 'id')[:per_page + 1])
+        else:
+            after = Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            rows = list(queryset.filter(after).order_by('-created_at', '-id')[:per_page + 1])
+        has_more, came_from_cursor = len(rows) > per_page, True
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = came_from_cursor, has_more
+    else:
+        has_next, has_previous = has_more, came_from_cursor
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].pk, 'next') if rows and has_next else None
+    previous_cursor = encode_cursor(rows[0].created_at, rows[0].pk, 'prev') if rows and has_previous else None
+    return KeysetPage(rows, next_cursor, previous_cursor, params)
+
+
+def wants_json(request) -> bool:
+    return request.GET.get('format') == 'json' or 'application/json' in request.headers.get('Accept', '')
@@ -0,0 +1,105 @@
+"""Who a user is, resolved once per request.
+
+``get_roles(user)`` memoizes on the user object (so ``user_passes_test`` and
+the view share one lookup) and caches group names per user. The cache entry
+is dropped when ``User.groups`` changes, and every entry is retired when a
+group is renamed or deleted. ``RolesMiddleware`` exposes the result lazily
+as ``request.roles``.
+
+Invalidation only reaches the cache the change was made through; with the
+default per-process cache other workers keep their entries until they expire,
+so entries live at most ``ROLES_CACHE_TIMEOUT`` seconds (30 by default).
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+
+AGENTS_GROUP = 'Agents'
+_VERSION_KEY = 'roles:version'
+
+
+class Roles:
+    def __init__(self, groups=(), is_staff=False, is_superuser=False):
+        self.groups = frozenset(groups)
+        self.is_staff = is_staff
+        self.is_superuser = is_superuser
+
+    def __contains__(self, group_name) -> bool:
+        return group_name in self.groups
+
+    def __repr__(self) -> str:
+        return f"<Roles groups={sorted(self.groups)} staff={self.is_staff}>"
+
+    @property
+    def is_agent(self) -> bool:
+        return AGENTS_GROUP in self.groups
+
+    @property
+    def is_admin(self) -> bool:
+        return self.is_staff or self.is_superuser
+
+    @property
+    def agent_or_admin(self) -> bool:
+        return self.is_admin or self.is_agent
+
+
+ANONYMOUS = Roles()
+
+
+def _key(user_id, version) -> str:
+    return f'roles:{version}:{user_id}'
+
+
+def get_roles(user) -> Roles:
+    if not getattr(user, 'is_authenticated', False):
+        return ANONYMOUS
+    roles = getattr(user, '_roles', None)
+    if roles is None:
+        version = cache.get_or_set(_VERSION_KEY, 1, None)
+        key = _key(user.pk, version)
+        groups = cache.get(key)
+        if groups is None:
+            groups = list(user.groups.values_list('name', flat=True))
+            cache.set(key, groups, getattr(settings, 'ROLES_CACHE_TIMEOUT', 30))
+        roles = user._roles = Roles(groups, user.is_staff, user.is_superuser)
+    return roles
+
+
+def invalidate_roles(*user_ids) -> None:
+    version = cache.get(_VERSION_KEY)
+    if version is not None:
+        cache.delete_many([_key(user_id, version) for user_id in user_ids])
+
+
+class RolesMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request.user))
+        return self.get_response(request)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # pk_set is not provided for clear; capture the members first.
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            invalidate_roles(instance.pk)
+            instance.__dict__.pop('_roles', None)
+        elif pk_set:
+            invalidate_roles(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def _group_changed(sender, **kwargs):
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        pass
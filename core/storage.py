@@ -0,0 +1,247 @@
+"""Content-addressed, reference-counted storage for uploaded photos.
+
+``ContentAddressedStorage`` ignores the upload's own name: the file is
+streamed once into a temporary file while being hashed, then moved to
+``blobs/<aa>/<bb>/<sha256><ext>``. Uploading the same bytes again reuses the
+existing blob instead of writing a suffixed copy, and because a name always
+means the same bytes, URLs under ``blobs/`` can be cached forever.
+
+Files derived from a blob are written with ``save_derived``, which keeps the
+name it is given, so they stay beside the blob instead of becoming blobs.
+
+``Blob`` rows count how many model rows point at each blob. Call
+``track_references(Model, 'field')`` once (from ``AppConfig.ready``) for every
+field using this storage; saves and deletes then adjust the counts, and a
+blob whose count drops to zero is removed after the transaction commits,
+together with any derived files named ``<sha256>.*`` (e.g. photo variants).
+Files saved before the switch keep their old names and are not counted
+until ``manage.py adopt_blobs`` moves them into blobs.
+
+The count is re-checked under a row lock before anything is unlinked, and a
+blob uploaded again since its last new reference is left alone, since that
+upload's row may not be saved yet. Files whose transaction rolled back (no
+``Blob`` row) and blobs skipped that way are removed by ``sweep``
+(``manage.py sweep_blobs``) once they are ``BLOB_SWEEP_GRACE`` seconds old.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from .tracking import loaded, set_loaded, track
+
+BLOB_PREFIX = 'blobs'
+_TMP_PREFIX = '.upload-'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def blob_name(self, digest: str, ext: str) -> str:
+        return '/'.join([BLOB_PREFIX, digest[:2], digest[2:4], digest + ext])
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same content, so an existing file is never clobbered.
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        ext = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        size = 0
+        os.makedirs(self.location, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix=_TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    size += len(chunk)
+                    tmp.write(chunk)
+            name = self.blob_name(digest.hexdigest(), ext)
+            path = self.path(name)
+            with transaction.atomic():
+                # Holding the row means _collect cannot unlink the file between
+                # the check below and this upload being recorded.
+                now = timezone.now()
+                if not Blob.objects.select_for_update().filter(name=name).update(saved_at=now):
+                    Blob.objects.get_or_create(name=name, defaults={'size': size, 'saved_at': now})
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    file_move_safe(tmp_path, path, allow_overwrite=True)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def save_derived(self, name: str, content) -> str:
+        """Write ``content`` under exactly ``name``, replacing any existing file."""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.location, prefix=_TMP_PREFIX)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    tmp.write(chunk)
+            # Replaced in one rename, so concurrent builders never see half a file.
+            file_move_safe(tmp_path, path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return name
+
+    def delete_blob(self, name: str) -> None:
+        """Remove ``name`` and every derived ``<stem>.*`` file beside it."""
+        self.delete(name)
+        directory, filename = os.path.split(name)
+        stem = os.path.splitext(filename)[0] + '.'
+        try:
+            _, files = self.listdir(directory)
+        except FileNotFoundError:
+            return
+        for other in files:
+            if other.startswith(stem):
+                self.delete(f'{directory}/{other}')
+
+
+photo_storage = ContentAddressedStorage()
+
+# (model, field_name) pairs registered through ``track_references``.
+tracked_fields = []
+
+
+def _adjust(name: str, delta: int) -> None:
+    from .models import Blob
+
+    if not name or not name.startswith(BLOB_PREFIX + '/'):
+        return
+    if delta > 0:
+        Blob.objects.filter(name=name).update(refcount=F('refcount') + delta, referenced_at=timezone.now())
+    else:
+        Blob.objects.filter(name=name).update(refcount=F('refcount') + delta)
+        transaction.on_commit(lambda: _collect(name))
+
+
+def _is_referenced(name: str) -> bool:
+    return any(model._default_manager.filter(**{field_name: name}).exists()
+               for model, field_name in tracked_fields)
+
+
+def adopt(instance, field_name: str) -> str:
+    """Move a file saved before the switch into a blob and repoint ``instance``.
+
+    Returns the new name. The row is updated without signals and the old
+    file is removed once no row refers to it; identical legacy files
+    collapse into one blob.
+    """
+    field_file = getattr(instance, field_name)
+    old = field_file.name
+    with field_file.storage.open(old, 'rb') as f:
+        new = photo_storage.save(old, f)
+    with transaction.atomic():
+        type(instance).objects.filter(pk=instance.pk).update(**{field_name: new})
+        _adjust(new, 1)
+    set_loaded(instance, **{field_name: new})
+    if not _is_referenced(old):
+        field_file.storage.delete(old)
+    return new
+
+
+def _collect(name: str, grace=None) -> bool:
+    """Delete ``name`` if nothing references it and no upload may be about to.
+
+    With ``grace`` (a datetime), uploads older than it no longer hold the blob.
+    """
+    from .models import Blob
+
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(name=name).first()
+        if blob is None or blob.refcount > 0:
+            return False
+        pending = blob.saved_at and (blob.referenced_at is None or blob.saved_at > blob.referenced_at)
+        if pending and (grace is None or blob.saved_at > grace):
+            return False
+        blob.delete()
+        photo_storage.delete_blob(name)
+    return True
+
+
+def _grace_seconds() -> int:
+    return getattr(settings, 'BLOB_SWEEP_GRACE', 24 * 3600)
+
+
+def sweep() -> tuple:
+    """Remove unreferenced blobs and orphaned files older than ``BLOB_SWEEP_GRACE``.
+
+    Returns ``(blobs, files)`` removed.
+    """
+    from .models import Blob
+
+    cutoff = timezone.now() - timedelta(seconds=_grace_seconds())
+    blobs = 0
+    stale = Blob.objects.filter(refcount__lte=0).filter(Q(saved_at__isnull=True) | Q(saved_at__lt=cutoff))
+    for name in stale.values_list('name', flat=True).iterator():
+        blobs += _collect(name, grace=cutoff)
+
+    files = 0
+    too_new = time.time() - _grace_seconds()
+    root = photo_storage.path(BLOB_PREFIX)
+    for directory, _, filenames in os.walk(root):
+        if not filenames:
+            continue
+        relative = os.path.relpath(directory, photo_storage.location).replace(os.sep, '/')
+        known = {os.path.basename(name)[:64] for name in
+                 Blob.objects.filter(name__startswith=relative + '/').values_list('name', flat=True)}
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            # A missing row means the upload's transaction rolled back; derived
+            # files share the digest of the blob they came from.
+            if filename[:64] not in known and os.path.getmtime(path) < too_new:
+                os.remove(path)
+                files += 1
+    if os.path.isdir(photo_storage.location):
+        for filename in os.listdir(photo_storage.location):
+            path = os.path.join(photo_storage.location, filename)
+            if filename.startswith(_TMP_PREFIX) and os.path.getmtime(path) < too_new:
+                os.remove(path)
+                files += 1
+    return blobs, files
+
+
+def track_references(model, field_name: str) -> None:
+    """Keep ``Blob.refcount`` in step with ``model.field_name``."""
+
+    def current(instance):
+        value = instance.__dict__.get(field_name)
+        return getattr(value, 'name', value) or ''
+
+    def saved(instance, created):
+        old = '' if created else loaded(instance, field_name) or ''
+        new = current(instance)
+        if old != new:
+            _adjust(new, 1)
+            _adjust(old, -1)
+
+    def deleted(sender, instance, **kwargs):
+        _adjust(loaded(instance, field_name) or current(instance), -1)
+
+    if (model, field_name) not in tracked_fields:
+        tracked_fields.append((model, field_name))
+    uid = f'core.storage:{field_name}'
+    track(model, [field_name], saved, uid=uid)
+    post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f'{uid}:{model._meta.label}')
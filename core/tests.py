@@ -1,3 +1,408 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.signals import post_init
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from centers.models import ServiceCenter
+
+from orders.models import Order
+from reports.models import ProblemPhoto, ProblemReport, ProblemResponse
+from reports.stats import reconcile
+from . import events
+from .models import Blob, StatusDuration, StatusEvent
+from .pagination import paginate
+from .roles import AGENTS_GROUP, get_roles
+from .storage import adopt, photo_storage, sweep
+from .transitions import InvalidTransition, rebuild, record, transition
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='rider', password='x')
+        ProblemReport.objects.bulk_create([
+            ProblemReport(user=user, title=f'p{i}', description='d', location='x', phone_number='1')
+            for i in range(25)
+        ])
+        # bulk_create gives every row the same created_at; the id tiebreak
+        # must still produce a total order.
+        cls.expected = list(ProblemReport.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def _page(self, **params):
+        request = RequestFactory().get('/', params)
+        with CaptureQueriesContext(connection) as ctx:
+            page = paginate(ProblemReport.objects.all(), request, 10)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+        return page
+
+    def test_walks_forward_and_back_without_gaps(self):
+        seen = []
+        page = self._page(status='pending')
+        self.assertFalse(page.has_previous)
+        pages = [page]
+        while page.has_next:
+            self.assertIn('status=pending', page.next_querystring)
+            page = self._page(status='pending', cursor=page.next_cursor)
+            pages.append(page)
+        for page in pages:
+            seen.extend(obj.id for obj in page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+
+        back = self._page(cursor=pages[-1].previous_cursor)
+        self.assertEqual([obj.id for obj in back], [obj.id for obj in pages[1]])
+        first = self._page(cursor=back.previous_cursor)
+        self.assertEqual([obj.id for obj in first], self.expected[:10])
+        self.assertFalse(first.has_previous)
+
+    def test_tampered_cursor_falls_back_to_first_page(self):
+        page = self._page(cursor='garbage')
+        self.assertEqual([obj.id for obj in page], self.expected[:10])
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='analyst', password='x', is_staff=True)
+        ProblemReport.objects.create(user=cls.staff, title='Flat, rear', description='d', location='x',
+                                     phone_number='1', status='pending')
+        ProblemReport.objects.create(user=cls.staff, title='Battery', description='d', location='x',
+                                     phone_number='1', status='resolved')
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def _get(self, **params):
+        response = self.client.get('/export/problem_reports/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_with_status_filter(self):
+        lines = self._get(status='pending').decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_id', 'title'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('"Flat, rear"', lines[1])
+
+    def test_gzipped_jsonl(self):
+        rows = [json.loads(line) for line in gzip.decompress(self._get(format='jsonl', gzip=1)).splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Flat, rear', 'Battery'])
+
+    def test_date_range_and_access(self):
+        self.assertEqual(self._get(until='2000-01-01').decode().count('\n'), 1)
+        self.client.logout()
+        self.assertEqual(self.client.get('/export/orders/').status_code, 302)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media, IMAGE_VARIANT_WORKERS=0))
+        self.user = User.objects.create_user(username='rider', password='x')
+        self.report = ProblemReport.objects.create(user=self.user, title='t', description='d',
+                                                   location='x', phone_number='1')
+
+    def upload(self, name, color='red'):
+        buf = io.BytesIO()
+        Image.new('RGB', (40, 40), color).save(buf, 'PNG')
+        return SimpleUploadedFile(name, buf.getvalue(), content_type='image/png')
+
+    def refcount(self, name):
+        return Blob.objects.get(name=name).refcount
+
+    def test_duplicate_uploads_share_one_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = ProblemPhoto.objects.create(problem_report=self.report, photo=self.upload('a.png'))
+            second = ProblemPhoto.objects.create(problem_report=self.report, photo=self.upload('copy of a.PNG'))
+        name = first.photo.name
+        self.assertEqual(second.photo.name, name)
+        self.assertRegex(name, r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.refcount(name), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(photo_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            ProblemPhoto.objects.get(pk=second.pk).delete()
+        self.assertFalse(photo_storage.exists(name))
+        self.assertFalse(photo_storage.exists(name.replace('.png', '.thumb.webp')))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_replacing_profile_photo_releases_old_blob(self):
+        profile = self.user.profile
+        profile.photo = self.upload('me.png')
+        profile.save()
+        old = profile.photo.name
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = User.objects.get(pk=self.user.pk).profile
+            profile.photo = self.upload('me2.png', color='blue')
+            profile.save()
+        self.assertFalse(photo_storage.exists(old))
+        self.assertEqual(self.refcount(profile.photo.name), 1)
+
+    def test_adopt_collapses_legacy_duplicates(self):
+        legacy = FileSystemStorage()
+        photos = []
+        for name in ('problem_photos/gear.png', 'problem_photos/gear_5Wmsm29.png', 'problem_photos/gear.png'):
+            if not legacy.exists(name):
+                legacy.save(name, self.upload(name))
+            photos.append(ProblemPhoto(problem_report=self.report, photo=name))
+        ProblemPhoto.objects.bulk_create(photos)
+        first = ProblemPhoto.objects.get(pk=photos[0].pk)
+        adopt(first, 'photo')
+        # Another row still points at the legacy file.
+        self.assertTrue(legacy.exists('problem_photos/gear.png'))
+        call_command('adopt_blobs', stdout=io.StringIO())
+        names = set(ProblemPhoto.objects.values_list('photo', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.refcount(names.pop()), 3)
+        self.assertFalse(legacy.exists('problem_photos/gear.png'))
+
+    def test_reupload_keeps_blob_until_its_row_is_saved(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = ProblemPhoto.objects.create(problem_report=self.report, photo=self.upload('a.png'))
+        name = photo.photo.name
+        # A concurrent upload of the same bytes whose row is not saved yet.
+        self.assertEqual(photo_storage.save('again.png', self.upload('again.png')), name)
+        with self.captureOnCommitCallbacks(execute=True):
+            photo.delete()
+        self.assertTrue(photo_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            ProblemPhoto.objects.create(problem_report=self.report, photo=name).delete()
+        self.assertFalse(photo_storage.exists(name))
+
+    def test_sweep_removes_rolled_back_and_abandoned_uploads(self):
+        abandoned = photo_storage.save('abandoned.png', self.upload('abandoned.png', color='green'))
+        try:
+            with transaction.atomic():
+                rolled_back = ProblemPhoto.objects.create(problem_report=self.report,
+                                                          photo=self.upload('b.png', color='blue')).photo.name
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertTrue(photo_storage.exists(rolled_back))
+        self.assertFalse(Blob.objects.filter(name=rolled_back).exists())
+        self.assertEqual(sweep(), (0, 0))
+        with self.settings(BLOB_SWEEP_GRACE=0):
+            self.assertEqual(sweep(), (1, 1))
+        self.assertFalse(photo_storage.exists(rolled_back))
+        self.assertFalse(photo_storage.exists(abandoned))
+
+
+class RolesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agents = Group.objects.create(name=AGENTS_GROUP)
+        self.owner = User.objects.create_user(username='rider', password='x')
+        self.agent = User.objects.create_user(username='agent', password='x')
+        self.agent.groups.add(self.agents)
+        self.report = ProblemReport.objects.create(user=self.owner, title='t', description='d',
+                                                   location='x', phone_number='1')
+
+    def group_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, sum('auth_user_groups' in q['sql'] for q in ctx.captured_queries)
+
+    def test_roles_resolved_once_then_cached(self):
+        self.client.force_login(self.agent)
+        response, queries = self.group_queries(f'/reports/problem/{self.report.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Update Status')
+        self.assertEqual(queries, 1)
+        _, queries = self.group_queries('/reports/all-problems/')
+        self.assertEqual(queries, 0)
+
+    def test_group_changes_invalidate(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get('/reports/all-problems/').status_code, 302)
+        self.owner.groups.add(self.agents)
+        self.assertEqual(self.client.get('/reports/all-problems/').status_code, 200)
+        self.agents.user_set.remove(self.owner)
+        self.assertEqual(self.client.get('/reports/all-problems/').status_code, 302)
+
+        self.client.force_login(self.agent)
+        self.assertTrue(get_roles(User.objects.get(pk=self.agent.pk)).is_agent)
+        self.agents.name = 'Former agents'
+        self.agents.save()
+        self.assertFalse(get_roles(User.objects.get(pk=self.agent.pk)).is_agent)
+
+    @override_settings(ROLES_CACHE_TIMEOUT=1)
+    def test_entries_expire(self):
+        self.assertTrue(get_roles(User.objects.get(pk=self.agent.pk)).is_agent)
+        # Like a removal made in another worker: no signal reaches this cache.
+        User.groups.through.objects.filter(user=self.agent).delete()
+        self.assertTrue(get_roles(User.objects.get(pk=self.agent.pk)).is_agent)
+        # Two seconds later, by the cache's clock.
+        with mock.patch('time.time', return_value=time.time() + 2):
+            self.assertFalse(get_roles(User.objects.get(pk=self.agent.pk)).is_agent)
+
+
+class LiveEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = User.objects.create_user(username='rider', password='x')
+        cls.problem = ProblemReport.objects.create(user=cls.rider, title='Flat tyre', description='d',
+                                                   location='x', phone_number='1')
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def test_broker_delivers_across_threads_and_drops_oldest(self):
+        with override_settings(SSE_QUEUE_SIZE=2), \
+                events.broker.subscribe('test:1', loop=self.loop) as subscription:
+            for i in range(3):
+                thread = threading.Thread(target=events.broker.publish, args=('test:1', 'tick', i))
+                thread.start()
+                thread.join()
+            self.assertEqual(events.broker.publish('test:2', 'tick', 0), 0)
+            received = [self.loop.run_until_complete(subscription.get(1)) for _ in range(2)]
+            self.assertEqual([data for _, _, data in received], [1, 2])
+            self.assertIsNone(self.loop.run_until_complete(subscription.get(0.01)))
+        self.assertEqual(events.broker.subscriber_count('test:1'), 0)
+
+    def test_saves_publish_after_commit(self):
+        order = Order.objects.create(user=self.rider, total_amount=100)
+        with events.broker.subscribe('order:%s' % order.id, loop=self.loop) as orders, \
+                events.broker.subscribe('problem:%s' % self.problem.id, loop=self.loop) as problems:
+            with self.captureOnCommitCallbacks(execute=True):
+                order.total_amount = 120
+                order.save()  # status unchanged: nothing published
+                order.status = 'confirmed'
+                order.save()
+                ProblemResponse.objects.create(problem_report=self.problem, responder=self.rider,
+                                               message='On the way', is_solution=True)
+                self.problem.status = 'resolved'
+                self.problem.save()
+                self.assertIsNone(self.loop.run_until_complete(orders.get(0.01)))
+            _, event, data = self.loop.run_until_complete(orders.get(1))
+            self.assertEqual((event, data), ('status', {'status': 'confirmed', 'label': 'Confirmed'}))
+            self.assertIsNone(self.loop.run_until_complete(orders.get(0.01)))
+            received = [self.loop.run_until_complete(problems.get(1))[1:] for _ in range(2)]
+        self.assertEqual(received[0][0], 'response')
+        self.assertEqual((received[0][1]['message'], received[0][1]['is_solution']), ('On the way', True))
+        self.assertEqual(received[1], ('status', {'status': 'resolved', 'label': 'Resolved'}))
+
+    async def test_stream_sends_snapshot_then_updates(self):
+        await sync_to_async(self.async_client.force_login)(self.rider)
+        response = await self.async_client.get(f'/reports/problem/{self.problem.id}/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        chunks = [await anext(content) for _ in range(3)]
+        self.assertTrue(chunks[0].startswith(b'retry:'))
+        self.assertIn(b'event: status\ndata: {"status": "pending", "label": "Pending"}', chunks[1])
+        self.assertIn(b'event: responses\ndata: {"count": 0}', chunks[2])
+
+        events.broker.publish(events.channel('problem', self.problem.id), 'status',
+                              {'status': 'assigned', 'label': 'Assigned'})
+        self.assertIn(b'"status": "assigned"', await asyncio.wait_for(anext(content), 1))
+        await content.aclose()
+
+    def test_stream_is_private_and_falls_back_to_a_snapshot_under_wsgi(self):
+        other = User.objects.create_user(username='other', password='x')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/reports/problem/{self.problem.id}/events/').status_code, 404)
+        order = Order.objects.create(user=other, total_amount=100)
+        response = self.client.get(f'/orders/{order.id}/events/')
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'"status": "pending"', body)
+        self.assertEqual(events.broker.subscriber_count(events.channel('order', order.id)), 0)
+
+
+class StatusTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = User.objects.create_user(username='rider', password='x')
+        cls.agent = User.objects.create_user(username='agent', password='x', is_staff=True)
+        cls.center = ServiceCenter.objects.create(name='Banani', phone='1', address='Banani',
+                                                  latitude=23.7925, longitude=90.4078)
+
+    def log(self, kind, pk):
+        return list(StatusEvent.objects.filter(kind=kind, object_id=pk).order_by('id')
+                    .values_list('from_status', 'to_status'))
+
+    def aged_problem(self, hours):
+        problem = ProblemReport.objects.create(user=self.rider, title='Brakes', description='d', location='x',
+                                               phone_number='1', assigned_center=self.center)
+        ProblemReport.objects.filter(pk=problem.pk).update(created_at=timezone.now() - timedelta(hours=hours))
+        return ProblemReport.objects.get(pk=problem.pk)
+
+    def test_transitions_are_checked_and_logged(self):
+        order = Order.objects.create(user=self.rider, center=self.center, total_amount=100)
+        transition(order, 'confirmed')
+        transition(order, 'completed')
+        with self.assertRaises(InvalidTransition):
+            transition(order, 'pending')
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'completed')
+        self.assertEqual(self.log('order', order.id), [('', 'pending'), ('pending', 'confirmed'),
+                                                       ('confirmed', 'completed')])
+
+    def test_one_tracker_serves_log_events_and_rollup(self):
+        self.assertEqual(len(post_init._live_receivers(ProblemReport)), 1)
+        reconcile()
+        problem = ProblemReport.objects.create(user=self.rider, title='Brakes', description='d', location='x',
+                                               phone_number='1')
+        problem = ProblemReport.objects.get(pk=problem.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            transition(problem, 'assigned', priority='high')
+        self.assertEqual(len(callbacks), 1)  # the live status event
+        self.assertEqual(self.log('problem', problem.pk), [('', 'pending'), ('pending', 'assigned')])
+        self.assertEqual(reconcile(repair=False), {})
+
+    def test_first_arrival_feeds_durations_per_center(self):
+        problem = self.aged_problem(hours=2)
+        transition(problem, 'assigned')
+        transition(problem, 'resolved')
+        transition(problem, 'in_progress')  # reopened: resolving again is not a new sample
+        transition(problem, 'resolved')
+        record(ProblemReport, [(self.aged_problem(hours=4).pk, 'pending', 'assigned')])
+
+        assign = StatusDuration.objects.get(key=f'problem:assign:{self.center.id}')
+        resolve = StatusDuration.objects.get(key=f'problem:resolve:{self.center.id}')
+        self.assertEqual((assign.count, resolve.count), (2, 1))
+        self.assertAlmostEqual(assign.mean_seconds, 3 * 3600, delta=5)
+        self.assertAlmostEqual(resolve.mean_seconds, 2 * 3600, delta=5)
+
+        StatusDuration.objects.update(count=0, total_seconds=0)
+        rebuild()
+        rebuilt = {d.key: (d.count, round(d.total_seconds)) for d in StatusDuration.objects.all()}
+        self.assertEqual(rebuilt, {assign.key: (2, round(assign.total_seconds)),
+                                   resolve.key: (1, round(resolve.total_seconds))})
+
+        self.client.force_login(self.agent)
+        response = self.client.get('/reports/stats/')
+        self.assertEqual(response.context['response_times'][0]['assign'], timedelta(hours=3))
+
+    def test_update_form_rejects_invalid_moves(self):
+        problem = self.aged_problem(hours=1)
+        transition(problem, 'closed')
+        self.client.force_login(self.agent)
+        response = self.client.post(f'/reports/problem/{problem.id}/update/',
+                                    {'status': 'pending', 'priority': 'medium'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('status', response.context['form'].errors)
+        self.assertEqual(self.log('problem', problem.id), [('', 'pending'), ('pending', 'closed')])
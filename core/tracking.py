@@ -0,0 +1,65 @@
+"""Field values as loaded from the database, shared by every receiver that diffs them.
+
+The status log and live events (``status``), the problem rollup (status,
+type and priority) and blob reference counts (file fields) all react to a
+field changing between load and save. ``track(model, fields, on_save)``
+(called from ``AppConfig.ready`` or a signals module) adds ``fields`` to what
+one ``post_init`` receiver per model copies out of ``instance.__dict__``, and
+registers ``on_save(instance, created)`` with one ``post_save`` receiver.
+Callbacks read the old values with ``loaded``; the snapshot is refreshed only
+after all of them have run, so each sees the same values.
+"""
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_init, post_save
+
+_KEY = '_loaded'
+# model -> tracked field names, and model -> {uid: on_save}.
+_fields = {}
+_callbacks = {}
+
+
+def _value(value):
+    # FieldFile.save() renames the file in place; remember the name.
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def _snapshot(instance, fields) -> dict:
+    values = instance.__dict__
+    # Deferred fields are not in __dict__ and are never fetched here.
+    return {field: _value(values[field]) for field in fields if field in values}
+
+
+def _initialized(sender, instance, **kwargs):
+    instance.__dict__[_KEY] = _snapshot(instance, _fields[sender])
+
+
+def _saved(sender, instance, created, **kwargs):
+    for on_save in _callbacks[sender].values():
+        on_save(instance, created)
+    instance.__dict__[_KEY] = _snapshot(instance, _fields[sender])
+
+
+def track(model, fields, on_save=None, uid: str = None) -> None:
+    """Remember ``fields`` of ``model`` as loaded and call ``on_save`` after saves.
+
+    ``uid`` (default: ``on_save``'s qualified name) keeps repeated calls from
+    registering a callback twice.
+    """
+    if model not in _fields:
+        _fields[model], _callbacks[model] = [], {}
+        dispatch_uid = f'core.tracking:{model._meta.label}'
+        post_init.connect(_initialized, sender=model, dispatch_uid=dispatch_uid)
+        post_save.connect(_saved, sender=model, dispatch_uid=dispatch_uid)
+    _fields[model] += [field for field in fields if field not in _fields[model]]
+    if on_save is not None:
+        _callbacks[model][uid or f'{on_save.__module__}.{on_save.__qualname__}'] = on_save
+
+
+def loaded(instance, field: str, default=None):
+    """``field`` as it was loaded (or last saved), or ``default`` if unknown."""
+    return instance.__dict__.get(_KEY, {}).get(field, default)
+
+
+def set_loaded(instance, **values) -> None:
+    """Record ``values`` as stored, for writes made without ``save()``."""
+    instance.__dict__.setdefault(_KEY, {}).update(values)
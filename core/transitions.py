@@ -0,0 +1,173 @@
+"""Status state machines for orders and problem reports, with an event log.
+
+``register(model, kind, allowed, ...)`` (called from ``AppConfig.ready``)
+declares which status changes are valid and starts logging them: every save
+that creates the object or changes its status appends a ``StatusEvent``, in
+the same transaction when the save runs inside one. ``transition`` is the
+way to change a status: it checks the move against the machine and saves
+inside ``atomic()``. Writes that bypass signals (queryset ``update()``, raw
+SQL, ``bulk_create``) call ``record`` or ``record_created`` themselves.
+
+The first time an object reaches one of its SLA statuses (e.g. ``assigned``),
+the time since it was created is added to the ``StatusDuration`` row for its
+kind, metric and center, so dashboards read means from a handful of rows
+instead of scanning the log. ``rebuild`` recomputes them from the log.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import StatusDuration, StatusEvent
+from .tracking import loaded, track
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class Machine:
+    def __init__(self, model, kind: str, allowed: dict, center_field: str, sla: dict):
+        self.model = model
+        self.kind = kind
+        self.allowed = allowed
+        self.center_attname = model._meta.get_field(center_field).attname
+        # Status reached -> metric name.
+        self.sla = {status: metric for metric, status in sla.items()}
+
+    def allows(self, old: str, new: str) -> bool:
+        return old == new or new in self.allowed.get(old, ())
+
+
+_machines = {}
+
+
+def register(model, kind: str, allowed: dict, center_field: str, sla: dict) -> None:
+    """Enforce ``allowed`` (``{status: {next statuses}}``) and log ``model``'s changes.
+
+    ``sla`` maps a metric name to the status that ends it, e.g.
+    ``{'assign': 'assigned'}``.
+    """
+    machine = _machines[model] = Machine(model, kind, allowed, center_field, sla)
+
+    def saved(instance, created):
+        old = '' if created else loaded(instance, 'status') or ''
+        if old != instance.status:
+            _log(machine, [(instance.pk, old, instance.status, getattr(instance, machine.center_attname),
+                            instance.created_at)], timezone.now())
+
+    track(model, ['status'], saved, uid='core.transitions')
+
+
+def can_transition(instance, status: str) -> bool:
+    """Whether ``instance`` may move from its status as loaded to ``status``."""
+    old = loaded(instance, 'status', instance.status)
+    return _machines[type(instance)].allows(old, status)
+
+
+def transition(instance, status: str, **fields) -> None:
+    """Set ``status`` (and ``fields``) on ``instance`` and save it with its event.
+
+    Raises ``InvalidTransition`` if the machine does not allow the move.
+    """
+    if not can_transition(instance, status):
+        old = loaded(instance, 'status', instance.status)
+        raise InvalidTransition(f"{type(instance).__name__} {instance.pk}: {old} -> {status}")
+    instance.status = status
+    for name, value in fields.items():
+        setattr(instance, name, value)
+    with transaction.atomic():
+        instance.save()
+
+
+def record(model, changes, at=None) -> None:
+    """Log ``(pk, old_status, new_status)`` changes written without ``save()``.
+
+    Call it in the transaction that made the changes.
+    """
+    machine = _machines[model]
+    changes = [(pk, old, new) for pk, old, new in changes if old != new]
+    if not changes:
+        return
+    rows = model.objects.filter(pk__in=[pk for pk, _, _ in changes])
+    objects = {pk: (center_id, created_at)
+               for pk, center_id, created_at in rows.values_list('pk', machine.center_attname, 'created_at')}
+    _log(machine, [(pk, old, new, *objects[pk]) for pk, old, new in changes if pk in objects],
+         at or timezone.now())
+
+
+def record_created(model, instances, at=None) -> None:
+    """Log the creation of ``instances`` inserted without ``save()``, e.g. by ``bulk_create``."""
+    machine = _machines[model]
+    _log(machine, [(obj.pk, '', obj.status, getattr(obj, machine.center_attname), obj.created_at)
+                   for obj in instances], at or timezone.now())
+
+
+def _log(machine, rows, at) -> None:
+    """Insert events for ``(pk, old, new, center_id, created_at)`` rows and feed SLA totals."""
+    reached = {(pk, new) for pk, _, new, _, _ in rows if new in machine.sla}
+    existing = {pk for pk, old, _, _, _ in rows if old}
+    revisits = {pk for pk, _ in reached if pk in existing}
+    if revisits:
+        # Only the first arrival in an SLA status counts; new objects have no history.
+        reached -= set(StatusEvent.objects.filter(
+            kind=machine.kind, object_id__in=revisits, to_status__in=machine.sla,
+        ).values_list('object_id', 'to_status'))
+    samples = defaultdict(lambda: [0, 0.0])
+    for pk, _, new, center_id, created_at in rows:
+        if (pk, new) in reached:
+            reached.discard((pk, new))
+            sample = samples[(machine.sla[new], center_id)]
+            sample[0] += 1
+            sample[1] += max((at - created_at).total_seconds(), 0.0)
+    StatusEvent.objects.bulk_create([
+        StatusEvent(kind=machine.kind, object_id=pk, from_status=old, to_status=new, center_id=center_id, at=at)
+        for pk, old, new, center_id, _ in rows
+    ])
+    for (metric, center_id), (count, seconds) in samples.items():
+        _add(machine.kind, metric, center_id, count, seconds)
+
+
+def _key(kind: str, metric: str, center_id) -> str:
+    return f"{kind}:{metric}:{center_id or '-'}"
+
+
+def _add(kind: str, metric: str, center_id, count: int, seconds: float) -> None:
+    key = _key(kind, metric, center_id)
+    # Make sure the row exists (a no-op after the first time), then add in the
+    # database so concurrent writers never lose an increment.
+    StatusDuration.objects.bulk_create([StatusDuration(key=key, kind=kind, metric=metric, center_id=center_id)],
+                                       ignore_conflicts=True)
+    StatusDuration.objects.filter(key=key).update(count=F('count') + count,
+                                                  total_seconds=F('total_seconds') + seconds)
+
+
+def durations(kind: str) -> dict:
+    """``{center_id: {metric: StatusDuration}}`` for ``kind``; ``None`` is the no-center bucket."""
+    result = defaultdict(dict)
+    for row in StatusDuration.objects.filter(kind=kind).select_related('center'):
+        result[row.center_id][row.metric] = row
+    return dict(result)
+
+
+def rebuild() -> None:
+    """Recompute every ``StatusDuration`` from the event log."""
+    with transaction.atomic():
+        StatusDuration.objects.all().delete()
+        for machine in _machines.values():
+            first = {}
+            events = (StatusEvent.objects.filter(kind=machine.kind, to_status__in=machine.sla)
+                      .order_by('at', 'id').values_list('object_id', 'to_status', 'center_id', 'at'))
+            for pk, status, center_id, at in events.iterator():
+                first.setdefault((pk, status), (center_id, at))
+            created = dict(machine.model.objects.filter(pk__in={pk for pk, _ in first})
+                           .values_list('pk', 'created_at'))
+            samples = defaultdict(lambda: [0, 0.0])
+            for (pk, status), (center_id, at) in first.items():
+                if pk in created:
+                    sample = samples[(machine.sla[status], center_id)]
+                    sample[0] += 1
+                    sample[1] += max((at - created[pk]).total_seconds(), 0.0)
+            for (metric, center_id), (count, seconds) in samples.items():
+                _add(machine.kind, metric, center_id, count, seconds)
@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('about/', views.about, name='about'),
+    path('export/<slug:dataset>/', views.export_data, name='export_data'),
 ]
 
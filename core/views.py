@@ -1,5 +1,9 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
 
+from .export import FORMATS, dataset_names, encode, export_rows, gzipped
+
 
 def home(request):
     return render(request, 'core/home.html')
@@ -8,4 +12,26 @@ def home(request):
 def about(request):
     return render(request, 'core/about.html')
 
+
+@staff_member_required
+def export_data(request, dataset: str):
+    if dataset not in dataset_names():
+        raise Http404
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest('format must be one of: ' + ', '.join(FORMATS))
+    try:
+        header, rows = export_rows(dataset, request.GET.get('since'), request.GET.get('until'),
+                                   request.GET.getlist('status'))
+    except ValueError:
+        return HttpResponseBadRequest('since/until must be YYYY-MM-DD dates')
+    chunks = encode(header, rows, fmt)
+    filename = f'{dataset}.{fmt}'
+    content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if request.GET.get('gzip'):
+        chunks, filename, content_type = gzipped(chunks), filename + '.gz', 'application/gzip'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 # Create your views here.
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
+
+    def ready(self):
+        from core import transitions
+        from core.events import track_status
+        from .models import Order
+
+        track_status(Order, 'order')
+        transitions.register(Order, 'order', Order.STATUS_TRANSITIONS, 'center',
+                             {'assign': 'assigned', 'complete': 'completed'})
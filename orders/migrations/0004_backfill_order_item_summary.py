@@ -0,0 +1,49 @@
+
+from django.db import migrations
+
+ITEM_SUMMARY_LENGTH = 255
+
+
+def summarize_items(lines) -> str:
+    # Frozen copy of orders.models.summarize_items as of this migration.
+    parts = [f"{name} x{qty}" if qty > 1 else name for name, qty in lines]
+    summary = ', '.join(parts)
+    while len(summary) > ITEM_SUMMARY_LENGTH and len(parts) > 1:
+        parts.pop()
+        summary = f"{', '.join(parts)} +{len(lines) - len(parts)} more"
+    return summary[:ITEM_SUMMARY_LENGTH]
+
+
+def backfill(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    rows = (OrderItem.objects.order_by('order_id', 'id')
+            .values_list('order_id', 'service__name', 'quantity').iterator(chunk_size=2000))
+    batch, current, lines = [], None, []
+
+    def add(order_id, lines):
+        batch.append(Order(id=order_id, item_count=len(lines), item_summary=summarize_items(lines)))
+
+    for order_id, name, quantity in rows:
+        if order_id != current:
+            if current is not None:
+                add(current, lines)
+            current, lines = order_id, []
+        lines.append((name, quantity))
+        if len(batch) >= 500:
+            Order.objects.bulk_update(batch, ['item_count', 'item_summary'])
+            batch = []
+    if current is not None:
+        add(current, lines)
+    Order.objects.bulk_update(batch, ['item_count', 'item_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_item_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_backfill_order_item_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -6,6 +6,18 @@ from services.models import Service
 
 User = get_user_model()
 
+ITEM_SUMMARY_LENGTH = 255
+
+
+def summarize_items(lines) -> str:
+    """Short human-readable summary of ``(service_name, quantity)`` pairs."""
+    parts = [f"{name} x{qty}" if qty > 1 else name for name, qty in lines]
+    summary = ', '.join(parts)
+    while len(summary) > ITEM_SUMMARY_LENGTH and len(parts) > 1:
+        parts.pop()
+        summary = f"{', '.join(parts)} +{len(lines) - len(parts)} more"
+    return summary[:ITEM_SUMMARY_LENGTH]
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -15,6 +27,12 @@ class Order(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
+    # Allowed status changes; enforced by core.transitions.
+    STATUS_TRANSITIONS = {
+        'pending': {'confirmed', 'assigned', 'cancelled'},
+        'confirmed': {'assigned', 'completed', 'cancelled'},
+        'assigned': {'completed', 'cancelled'},
+    }
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     center = models.ForeignKey(ServiceCenter, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
@@ -23,10 +41,24 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     scheduled_time = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized from OrderItem at checkout so order lists need no joins.
+    item_count = models.PositiveIntegerField(default=0)
+    item_summary = models.CharField(max_length=ITEM_SUMMARY_LENGTH, blank=True)
+    # Set while an agent holds a queue claim it has not acknowledged yet.
+    lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self) -> str:
         return f"Order #{self.id} - {self.user.get_username()}"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of my_orders walks (created_at, id) per user.
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+            # Dispatch: unassigned orders of one status oldest first, and open
+            # loads per agent, both without reading finished orders.
+            models.Index(fields=['status', 'assigned_agent', 'created_at'], name='order_dispatch_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
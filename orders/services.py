@@ -0,0 +1,52 @@
+from django.db import transaction
+
+from agents.dispatch import pick_agent
+from agents.models import Agent
+from cart.models import CartItem
+from .models import Order, OrderItem, summarize_items
+
+
+def _cart_lines(user):
+    lines = CartItem.objects.for_user(user)
+    if transaction.get_connection().features.has_select_for_update_of:
+        return lines.select_for_update(of=('self',))
+    return lines.select_for_update()
+
+
+def place_order(user, center, payment_method: str = 'cash', lat=None, lng=None):
+    """Turn ``user``'s cart into an ``Order`` and empty the cart.
+
+    The cart rows are locked for the duration, the total comes from a single
+    aggregate, the order row is written once with its final status and agent,
+    and all lines go in with one ``bulk_create``. The number of statements does
+    not depend on the number of cart lines. Returns None for an empty cart.
+    """
+    with transaction.atomic():
+        lines = list(_cart_lines(user).select_related('service'))
+        if not lines:
+            return None
+        total = CartItem.objects.filter(id__in=[line.id for line in lines]).total()
+
+        status = 'confirmed' if payment_method == 'cash' else 'pending'
+        agent = None
+        try:
+            lat_f, lng_f = float(lat), float(lng)
+        except (TypeError, ValueError):
+            pass
+        else:
+            candidates = Agent.objects.filter(is_active=True, center=center).select_related('center', 'location')
+            agent = pick_agent(candidates, lat_f, lng_f)
+            if agent is not None and payment_method == 'cash':
+                status = 'assigned'
+
+        order = Order.objects.create(
+            user=user, center=center, total_amount=total, status=status, assigned_agent=agent,
+            item_count=len(lines),
+            item_summary=summarize_items([(line.service.name, line.quantity) for line in lines]),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, service=line.service, quantity=line.quantity, price=line.service.base_price)
+            for line in lines
+        ])
+        CartItem.objects.filter(id__in=[line.id for line in lines]).delete()
+    return order
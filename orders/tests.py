@@ -1,3 +1,142 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import IdempotencyKey
+
+from agents.models import Agent
+from cart.models import Cart, CartItem
+from centers.models import ServiceCenter
+from services.models import Service, ServiceCategory
+from .models import Order
+
+
+class BookServicesTests(TestCase):
+    # Session + user, center, savepoint pair, locked cart lines, total
+    # aggregate, agent candidates + two load counts, order insert, item
+    # bulk insert, the cart lines fetched for delete signals then deleted, and
+    # the order's status event plus its time-to-assign total (ensure row, add).
+    CHECKOUT_QUERIES = 17
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.center = ServiceCenter.objects.create(name='Dhaka', phone='1', address='Banani',
+                                                  latitude=23.7925, longitude=90.4078)
+        agent_user = User.objects.create_user(username='agent', password='x')
+        cls.agent = Agent.objects.create(user=agent_user, center=cls.center, phone='1')
+        category = ServiceCategory.objects.create(name='Basic')
+        cls.services = [
+            Service.objects.create(name=f'Service {i}', description='', category=category, base_price=100 + i)
+            for i in range(10)
+        ]
+
+    def _book(self, username: str, lines: int):
+        user = User.objects.create_user(username=username, password='x')
+        cart = Cart.objects.create(user=user)
+        for service in self.services[:lines]:
+            CartItem.objects.create(cart=cart, service=service, quantity=2)
+        self.client.force_login(user)
+        post = {'center_id': self.center.id, 'payment_method': 'cash', 'lat': 23.79, 'lng': 90.40}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/orders/book/', post)
+        self.assertRedirects(response, '/orders/my/', fetch_redirect_response=False)
+        return user, len(ctx.captured_queries)
+
+    def test_checkout_creates_order_and_empties_cart(self):
+        user, _ = self._book('rider', 3)
+        order = Order.objects.get(user=user)
+        self.assertEqual(order.total_amount, Decimal('606.00'))
+        self.assertEqual(order.status, 'assigned')
+        self.assertEqual(order.assigned_agent, self.agent)
+        self.assertEqual(order.items.count(), 3)
+        self.assertFalse(CartItem.objects.filter(cart__user=user).exists())
+
+    def test_query_count_does_not_grow_with_cart_lines(self):
+        _, one_line = self._book('rider1', 1)
+        _, ten_lines = self._book('rider10', 10)
+        self.assertEqual(one_line, self.CHECKOUT_QUERIES)
+        self.assertEqual(ten_lines, self.CHECKOUT_QUERIES)
+
+    def test_retried_booking_with_same_key_replays_first_response(self):
+        user = User.objects.create_user(username='double-tap', password='x')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, service=self.services[0])
+        self.client.force_login(user)
+        post = {'center_id': self.center.id, 'payment_method': 'cash', 'idempotency_key': 'k1'}
+        first = self.client.post('/orders/book/', post)
+        CartItem.objects.create(cart=cart, service=self.services[1])
+        second = self.client.post('/orders/book/', post)
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second['Location'], first['Location'])
+        self.assertEqual(Order.objects.filter(user=user).count(), 1)
+        self.assertTrue(CartItem.objects.filter(cart=cart).exists())
+
+    def test_payment_success_replay_does_not_touch_orders(self):
+        user = User.objects.create_user(username='payer', password='x')
+        Order.objects.create(user=user, center=self.center, total_amount=100, status='pending')
+        self.client.force_login(user)
+        first = self.client.post('/orders/payment-success/', {'idempotency_key': 'pay-1'})
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(3):  # session, user, stored response
+            second = self.client.post('/orders/payment-success/', {'idempotency_key': 'pay-1'})
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(IdempotencyKey.objects.filter(user=user).count(), 1)
+
+    def test_payment_success_is_not_confirmed_by_a_get(self):
+        user = User.objects.create_user(username='linked', password='x')
+        order = Order.objects.create(user=user, center=self.center, total_amount=100, status='pending')
+        self.client.force_login(user)
+        response = self.client.get('/orders/payment-success/', {'idempotency_key': 'pay-1'})
+        self.assertRedirects(response, '/orders/payment/', fetch_redirect_response=False)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'pending')
+        self.assertFalse(IdempotencyKey.objects.filter(user=user).exists())
+
+    def test_placeholder_left_by_a_dead_worker_is_reclaimed_after_its_lease(self):
+        user = User.objects.create_user(username='crashed', password='x')
+        Order.objects.create(user=user, center=self.center, total_amount=100, status='pending')
+        placeholder = IdempotencyKey.objects.create(user=user, scope='payment_success', key='pay-1')
+        self.client.force_login(user)
+        with self.settings(IDEMPOTENCY_LEASE=60):
+            self.assertEqual(self.client.post('/orders/payment-success/', {'idempotency_key': 'pay-1'}).status_code, 409)
+            IdempotencyKey.objects.filter(pk=placeholder.pk).update(
+                created_at=timezone.now() - timedelta(seconds=61))
+            response = self.client.post('/orders/payment-success/', {'idempotency_key': 'pay-1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Order.objects.get(user=user).status, 'confirmed')
+        self.assertEqual(IdempotencyKey.objects.get(user=user).status_code, 200)
+
+    def test_my_orders_renders_from_denormalized_fields(self):
+        user, _ = self._book('history', 3)
+        order = Order.objects.get(user=user)
+        self.assertEqual(order.item_count, 3)
+        self.assertEqual(order.item_summary, 'Service 0 x2, Service 1 x2, Service 2 x2')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/orders/my/')
+        self.assertContains(response, order.item_summary)
+        order_queries = [q['sql'] for q in ctx.captured_queries if 'orders_' in q['sql']]
+        self.assertEqual(len(order_queries), 1)
+        self.assertNotIn('orders_orderitem', order_queries[0])
 
-# Create your tests here.
+    def test_my_orders_pages_follow_an_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan text is SQLite specific')
+        user = User.objects.create_user(username='regular', password='x')
+        Order.objects.bulk_create([Order(user=user, center=self.center, total_amount=100) for _ in range(30)])
+        self.client.force_login(user)
+        cursor = self.client.get('/orders/my/', {'format': 'json'}).json()['next_cursor']
+        for params in ({}, {'cursor': cursor}):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/orders/my/', params)
+            sql = next(q['sql'] for q in ctx.captured_queries if 'FROM "orders_order"' in q['sql'])
+            with connection.cursor() as db:
+                db.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in db.fetchall())
+            with self.subTest(params=params):
+                self.assertIn('order_user_created_idx', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
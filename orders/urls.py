@@ -8,5 +8,6 @@ urlpatterns = [
     path('payment-success/', views.payment_success, name='payment_success'),
     path('my/', views.my_orders, name='my_orders'),
     path('<int:order_id>/', views.order_detail, name='order_detail'),
+    path('<int:order_id>/events/', views.order_events, name='order_events'),
 ]
 
@@ -1,72 +1,44 @@
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
 from django.contrib import messages
 from cart.models import CartItem
-from agents.models import Agent
-from math import asin, sqrt, sin, cos, pi
-from .models import Order, OrderItem
+from core import events
+from core.idempotency import idempotent, new_key
+from core.transitions import transition
+from core.pagination import paginate, wants_json
+from .models import Order
+from .services import place_order
 from centers.models import ServiceCenter
 
+logger = logging.getLogger(__name__)
+
 
 @login_required
 def checkout(request):
-    items = CartItem.objects.filter(cart__user=request.user).select_related('service')
-    total = sum([it.quantity * it.service.base_price for it in items])
+    items = CartItem.objects.for_user(request.user).with_services()
+    total = items.total()
     centers = ServiceCenter.objects.filter(is_active=True)
-    return render(request, 'orders/checkout.html', {'items': items, 'total': total, 'centers': centers})
+    return render(request, 'orders/checkout.html', {
+        'items': items, 'total': total, 'centers': centers, 'idempotency_key': new_key(),
+    })
 
 
 @login_required
-@transaction.atomic
+@idempotent('book_services')
 def book_services(request):
     if request.method != 'POST':
         return redirect('checkout')
-    center_id = request.POST.get('center_id')
-    lat = request.POST.get('lat')
-    lng = request.POST.get('lng')
+    center = ServiceCenter.objects.filter(pk=request.POST.get('center_id')).first()
     payment_method = request.POST.get('payment_method', 'cash')
-    center = ServiceCenter.objects.filter(pk=center_id).first()
-    items = CartItem.objects.filter(cart__user=request.user).select_related('service')
-    total = sum([it.quantity * it.service.base_price for it in items])
-    
-
-    status = 'confirmed' if payment_method == 'cash' else 'pending'
-    order = Order.objects.create(user=request.user, center=center, total_amount=total, status=status)
-
-    try:
-        lat_f = float(lat)
-        lng_f = float(lng)
-        agents = Agent.objects.filter(is_active=True, center=center).select_related('center')
-        def dist(a_lat, a_lng, b_lat, b_lng):
-            d_lat = (b_lat - a_lat) * pi / 180.0
-            d_lng = (b_lng - a_lng) * pi / 180.0
-            la1 = a_lat * pi / 180.0
-            la2 = b_lat * pi / 180.0
-            x = sin(d_lat/2)**2 + sin(d_lng/2)**2 * cos(la1) * cos(la2)
-            return 2 * 6371.0 * asin(sqrt(x))
-        best = None
-        best_d = 1e9
-        for ag in agents:
-            c = ag.center
-            d = dist(lat_f, lng_f, c.latitude, c.longitude)
-            if d < best_d:
-                best_d = d
-                best = ag
-        if best:
-            order.assigned_agent = best
-
-            if payment_method == 'cash':
-                order.status = 'assigned'
-                order.save()
-    except (TypeError, ValueError):
-        pass
-    for it in items:
-        OrderItem.objects.create(order=order, service=it.service, quantity=it.quantity, price=it.service.base_price)
-    
-
-    items.delete()
-    
+    order = place_order(request.user, center, payment_method,
+                        request.POST.get('lat'), request.POST.get('lng'))
+    if order is None:
+        messages.error(request, 'Your cart is empty.')
+        return redirect('view_cart')
 
     if payment_method == 'cash':
         messages.success(request, 'Service booked successfully! You will pay cash when the service is provided.')
@@ -74,10 +46,25 @@ def book_services(request):
     else:
         return redirect('payment')
 
+def _order_summary_json(order):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'total_amount': str(order.total_amount),
+        'center': order.center.name if order.center else None,
+        'item_count': order.item_count,
+        'item_summary': order.item_summary,
+        'created_at': order.created_at.isoformat(),
+    }
+
+
 @login_required
 def my_orders(request):
-    orders = Order.objects.filter(user=request.user).order_by('-created_at').prefetch_related('items__service', 'center', 'assigned_agent')
-    return render(request, 'orders/my_orders.html', {'orders': orders})
+    orders = Order.objects.filter(user=request.user).select_related('center')
+    page = paginate(orders, request, 12)
+    if wants_json(request):
+        return JsonResponse(page.as_json(_order_summary_json))
+    return render(request, 'orders/my_orders.html', {'orders': page})
 
 
 @login_required
@@ -88,6 +75,22 @@ def order_detail(request, order_id: int):
     return render(request, 'orders/order_detail.html', {'order': order})
 
 
+def _order_status(request, order_id: int):
+    if not request.user.is_authenticated:
+        return None
+    return Order.objects.filter(id=order_id, user=request.user).values_list('status', flat=True).first()
+
+
+async def order_events(request, order_id: int):
+    """Server-Sent Events with the order's status changes (see core.events)."""
+    subscription = events.broker.subscribe(events.channel('order', order_id))
+    status = await sync_to_async(_order_status)(request, order_id)
+    if status is None:
+        subscription.close()
+        raise Http404
+    return events.event_stream(request, subscription, [('status', events.status_payload(Order, status))])
+
+
 @login_required
 def payment(request):
 
@@ -98,30 +101,29 @@ def payment(request):
         order = latest_pending_order
     else:
         # Fallback: try to calculate from cart items if no pending order found
-        items = CartItem.objects.filter(cart__user=request.user).select_related('service')
-        total = sum([it.quantity * it.service.base_price for it in items])
+        total = CartItem.objects.for_user(request.user).total()
         order = None
     
-    return render(request, 'orders/payment.html', {'total': total, 'order': order})
+    return render(request, 'orders/payment.html', {'total': total, 'order': order, 'idempotency_key': new_key()})
 
 
 @login_required
+@idempotent('payment_success')
 def payment_success(request):
+    if request.method != 'POST':
+        return redirect('payment')
     # Get the latest pending order for this user and mark it as confirmed
     latest_pending_order = Order.objects.filter(user=request.user, status='pending').order_by('-created_at').first()
     
     if latest_pending_order:
         # Mark as confirmed
-        latest_pending_order.status = 'confirmed'
-        latest_pending_order.save()
+        transition(latest_pending_order, 'confirmed')
         
 
         CartItem.objects.filter(cart__user=request.user).delete()
         
-        # Debug logging
-        print(f"Payment Success - Pending Order: #{latest_pending_order.id}, Amount: {latest_pending_order.total_amount}")
-        for item in latest_pending_order.items.all():
-            print(f"  - {item.service.name}: {item.quantity} x Tk {item.price} = Tk {item.line_total()}")
+        logger.info("Payment success for pending order #%s, amount %s",
+                    latest_pending_order.id, latest_pending_order.total_amount)
         
         messages.success(request, 'Payment successful! Your service booking has been confirmed.')
         
@@ -138,9 +140,8 @@ def payment_success(request):
             CartItem.objects.filter(cart__user=request.user).delete()
             
 
-            print(f"Payment Success - Fallback Order: #{latest_order.id}, Amount: {latest_order.total_amount}")
-            for item in latest_order.items.all():
-                print(f"  - {item.service.name}: {item.quantity} x Tk {item.price} = Tk {item.line_total()}")
+            logger.info("Payment success fallback to order #%s, amount %s",
+                        latest_order.id, latest_order.total_amount)
             
             messages.success(request, 'Payment successful! Your service booking has been confirmed.')
             return render(request, 'orders/payment_success.html', {
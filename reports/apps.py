@@ -5,3 +5,15 @@ class ReportsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reports'
     verbose_name = 'Problem Reports'
+
+    def ready(self):
+        from core import transitions
+        from core.events import track_status
+        from core.storage import track_references
+        from . import events, images, stats  # noqa: F401  (connects the live, variant and rollup signals)
+        from .models import ProblemPhoto, ProblemReport
+
+        track_references(ProblemPhoto, 'photo')
+        track_status(ProblemReport, 'problem')
+        transitions.register(ProblemReport, 'problem', ProblemReport.STATUS_TRANSITIONS, 'assigned_center',
+                             {'assign': 'assigned', 'resolve': 'resolved'})
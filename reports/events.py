@@ -0,0 +1,29 @@
+"""Live updates for ``problem_detail``: new responses on ``problem:<id>``.
+
+Status changes are published by ``core.events.track_status``.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import dateformat, timezone
+
+from core import events
+from .models import ProblemResponse
+
+
+def response_payload(response: ProblemResponse) -> dict:
+    responder = response.responder
+    return {
+        'id': response.id,
+        'responder': responder.get_full_name() or responder.username,
+        'message': response.message,
+        'is_solution': response.is_solution,
+        # Same format as the rendered page.
+        'created_at': dateformat.format(timezone.localtime(response.created_at), 'F d, Y H:i'),
+    }
+
+
+@receiver(post_save, sender=ProblemResponse)
+def _response_saved(sender, instance, created, **kwargs):
+    if created:
+        events.publish_on_commit(events.channel('problem', instance.problem_report_id), 'response',
+                                 response_payload(instance))
@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
+from core.transitions import can_transition
 from .models import ProblemReport, ProblemPhoto, ProblemResponse
 
 class MultipleFileInput(forms.ClearableFileInput):
@@ -99,3 +100,12 @@ class ProblemReportUpdateForm(forms.ModelForm):
             }),
         }
 
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        if self.instance.pk and not can_transition(self.instance, status):
+            labels = dict(ProblemReport.STATUS_CHOICES)
+            raise forms.ValidationError(
+                f"Status cannot change from {labels[self.instance.status]} to {labels[status]}."
+            )
+        return status
+
@@ -0,0 +1,141 @@
+"""Breakdown heatmap: report counts per geohash cell, precomputed.
+
+``rebuild`` folds ``ProblemReport`` into ``ProblemHeatCell`` rows, one per
+``HEATMAP_PRECISION``-character geohash cell (6 is about 1.2 x 0.6 km), local
+day, problem type and priority; reports without coordinates use their
+center's. ``manage.py build_heatmap`` refreshes the last few days (run it
+from cron) or everything with ``--all``. Each rebuild replaces the
+``ProblemHeatBuild`` row in the same transaction; its id is the version tile
+ETags and cache keys are built from, so every web worker sees a rebuild as
+soon as it commits.
+
+A tile is a geohash prefix. ``tile`` sums its child cells
+``HEATMAP_TILE_DEPTH`` characters deeper over the requested days and
+filters, reading an index range of the rollup instead of the reports table.
+"""
+import hashlib
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce, Substr
+from django.utils import timezone
+
+from core.geo import geohash_bounds, geohash_encode, is_geohash
+from .models import ProblemHeatBuild, ProblemHeatCell, ProblemReport
+
+# Sorts after every geohash character, so [prefix, prefix + '~') is the prefix range.
+_PREFIX_END = '~'
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def precision() -> int:
+    return _setting('HEATMAP_PRECISION', 6)
+
+
+def version() -> str:
+    return str(ProblemHeatBuild.objects.order_by('-id').values_list('id', flat=True).first() or 0)
+
+
+def rebuild(since: date = None) -> int:
+    """Recompute the cells for days from ``since`` (all days if None); returns rows written."""
+    reports = (ProblemReport.objects.order_by()
+               .annotate(lat=Coalesce('latitude', 'assigned_center__latitude'),
+                         lng=Coalesce('longitude', 'assigned_center__longitude'))
+               .filter(lat__isnull=False, lng__isnull=False))
+    if since is not None:
+        reports = reports.filter(created_at__gte=timezone.make_aware(datetime.combine(since, time.min)))
+    counts = Counter()
+    length = precision()
+    rows = reports.values_list('lat', 'lng', 'created_at', 'problem_type', 'priority')
+    for lat, lng, created_at, problem_type, priority in rows.iterator(chunk_size=5000):
+        counts[(geohash_encode(lat, lng, length), timezone.localdate(created_at), problem_type, priority)] += 1
+    with transaction.atomic():
+        stale = ProblemHeatCell.objects.all() if since is None else ProblemHeatCell.objects.filter(day__gte=since)
+        stale.delete()
+        ProblemHeatCell.objects.bulk_create([
+            ProblemHeatCell(geohash=geohash, day=day, problem_type=problem_type, priority=priority, count=n)
+            for (geohash, day, problem_type, priority), n in counts.items()
+        ], batch_size=1000)
+        build = ProblemHeatBuild.objects.create(since=since)
+        ProblemHeatBuild.objects.filter(id__lt=build.id).delete()
+    return len(counts)
+
+
+def _date(value, name: str):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a YYYY-MM-DD date.') from None
+
+
+def _choices(value, choices, name: str) -> tuple:
+    if not value:
+        return ()
+    picked = tuple(sorted(set(value.split(','))))
+    unknown = set(picked) - {key for key, _ in choices}
+    if unknown:
+        raise ValueError(f'Unknown {name}: {", ".join(sorted(unknown))}.')
+    return picked
+
+
+def parse_params(tile: str, query) -> dict:
+    """Validated ``tile`` arguments from a tile path and query string; raises ValueError."""
+    if len(tile) >= precision() or not is_geohash(tile):
+        raise ValueError('Unknown tile.')
+    until = _date(query.get('until'), 'until') or timezone.localdate()
+    since = _date(query.get('since'), 'since')
+    if since is None:
+        try:
+            days = int(query.get('days', 7))
+        except ValueError:
+            raise ValueError('days must be a number.') from None
+        since = until - timedelta(days=max(days, 1) - 1)
+    if since > until or (until - since).days >= _setting('HEATMAP_MAX_DAYS', 366):
+        raise ValueError('Invalid date range.')
+    return {
+        'tile': tile, 'since': since, 'until': until,
+        'problem_types': _choices(query.get('problem_type'), ProblemReport.PROBLEM_TYPES, 'problem_type'),
+        'priorities': _choices(query.get('priority'), ProblemReport.PRIORITY_CHOICES, 'priority'),
+    }
+
+
+def _digest(params: dict) -> str:
+    return hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()[:16]
+
+
+def etag(params: dict, build: str = None) -> str:
+    return f'"{build or version()}-{_digest(params)}"'
+
+
+def tile(tile: str, since: date, until: date, problem_types=(), priorities=()) -> dict:
+    """Report counts for the cells of ``tile``, ``HEATMAP_TILE_DEPTH`` characters deeper."""
+    depth = min(len(tile) + _setting('HEATMAP_TILE_DEPTH', 2), precision())
+    cells = ProblemHeatCell.objects.filter(geohash__gte=tile, geohash__lt=tile + _PREFIX_END,
+                                           day__range=(since, until))
+    if problem_types:
+        cells = cells.filter(problem_type__in=problem_types)
+    if priorities:
+        cells = cells.filter(priority__in=priorities)
+    rows = (cells.annotate(cell=Substr('geohash', 1, depth)).values('cell')
+            .annotate(total=Sum('count')).order_by('cell').values_list('cell', 'total'))
+    result = []
+    for cell, total in rows:
+        min_lat, max_lat, min_lng, max_lng = geohash_bounds(cell)
+        result.append({'geohash': cell, 'lat': round((min_lat + max_lat) / 2, 5),
+                       'lng': round((min_lng + max_lng) / 2, 5), 'count': total})
+    return {'tile': tile, 'precision': depth, 'since': since.isoformat(), 'until': until.isoformat(),
+            'cells': result}
+
+
+def cached_tile(params: dict, build: str = None) -> dict:
+    key = f'heatmap:{build or version()}:{_digest(params)}'
+    return cache.get_or_set(key, lambda: tile(**params), _setting('HEATMAP_CACHE_TIMEOUT', 3600))
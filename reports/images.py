@@ -0,0 +1,120 @@
+"""Resized JPEG and WebP variants of uploaded problem photos.
+
+Each ``ProblemPhoto`` gets ``thumb`` and ``medium`` variants in both formats,
+stored next to the original as ``<name>.<size>.<format>``. They are built
+with Pillow on a small thread pool once the upload's transaction commits, so
+the request that saved the photo never waits on image work; until then
+``variant_url`` falls back to the original. ``IMAGE_VARIANT_WORKERS = 0``
+builds them inline on commit instead.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps
+
+from .models import ProblemPhoto
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels.
+SIZES = {'thumb': 400, 'medium': 1280}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 75, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name: str, size: str, fmt: str) -> str:
+    stem, _ = os.path.splitext(name)
+    return f'{stem}.{size}.{fmt}'
+
+
+def _encode(image, fmt: str) -> bytes:
+    pil_format, options = FORMATS[fmt]
+    buf = io.BytesIO()
+    image.save(buf, pil_format, **options)
+    return buf.getvalue()
+
+
+def _save(storage, name: str, content) -> None:
+    if hasattr(storage, 'save_derived'):
+        # Content-addressed storage would rename the variant into a blob of its own.
+        storage.save_derived(name, content)
+        return
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, content)
+
+
+def build_variants(photo: ProblemPhoto) -> None:
+    """Write every size/format variant of ``photo`` and mark it ready.
+
+    Variants go through the photo field's storage under names derived from
+    the original, so photos sharing a content-addressed blob share variants
+    too (and the blob's cleanup removes them).
+    """
+    storage = photo.photo.storage
+    names = [variant_name(photo.photo.name, size, fmt) for size in SIZES for fmt in FORMATS]
+    if all(storage.exists(name) for name in names):
+        ProblemPhoto.objects.filter(pk=photo.pk).update(variants_ready=True)
+        return
+    with photo.photo.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image = image.convert('RGB')
+    for size, edge in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        for fmt in FORMATS:
+            _save(storage, variant_name(photo.photo.name, size, fmt), ContentFile(_encode(resized, fmt)))
+    ProblemPhoto.objects.filter(pk=photo.pk).update(variants_ready=True)
+
+
+def _build(photo_id: int) -> None:
+    try:
+        photo = ProblemPhoto.objects.filter(pk=photo_id).first()
+        if photo is not None and photo.photo:
+            build_variants(photo)
+    except Exception:
+        logger.exception("could not build variants for ProblemPhoto %s", photo_id)
+
+
+def _build_in_worker(photo_id: int) -> None:
+    try:
+        _build(photo_id)
+    finally:
+        # Pool threads hold their own connection; don't leave it open between jobs.
+        connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='photo-variants')
+        return _executor
+
+
+def schedule(photo_id: int) -> None:
+    """Build variants for ``photo_id`` after the current transaction commits."""
+    if getattr(settings, 'IMAGE_VARIANT_WORKERS', 2):
+        transaction.on_commit(lambda: _get_executor().submit(_build_in_worker, photo_id))
+    else:
+        transaction.on_commit(lambda: _build(photo_id))
+
+
+@receiver(post_save, sender=ProblemPhoto)
+def _photo_saved(sender, instance, created, **kwargs):
+    if created and instance.photo:
+        schedule(instance.pk)
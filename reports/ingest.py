@@ -0,0 +1,246 @@
+"""Bulk problem report intake for call-center partners.
+
+``ingest`` validates every row with one reused serializer, then inserts the
+valid ones ``PROBLEM_INGEST_BATCH`` at a time with ``bulk_create``, one
+transaction per batch. ``bulk_create`` skips model signals, so each batch
+also counts its reports in the dashboard rollup and logs their creation
+events itself; the search index follows through its triggers.
+
+Photos are not downloaded during the request. Each reference becomes a
+``PendingPhoto`` that ``fetch_pending`` (``manage.py fetch_pending_photos``)
+later turns into a ``ProblemPhoto``. A ``sha256`` matching a photo already
+in content-addressed storage is linked without any download.
+
+URLs come from partners, so downloads are refused unless the host is in
+``PROBLEM_PHOTO_FETCH_HOSTS``, the connection must land on a public address
+(checked on the connected socket, so DNS tricks do not help) and redirects
+are not followed.
+"""
+import http.client
+import io
+import ipaddress
+import json
+import logging
+import urllib.parse
+import urllib.request
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+
+from core.models import Blob
+from core.storage import photo_storage
+from core.transitions import record_created
+from .models import PendingPhoto, ProblemPhoto, ProblemReport
+from .serializers import ProblemReportIngestSerializer
+from .stats import count_created
+
+IMAGE_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name: str, default):
+    return getattr(settings, name, default)
+
+
+def max_rows() -> int:
+    return _setting('PROBLEM_INGEST_MAX_ROWS', 10000)
+
+
+TOO_MANY_ROWS = 'Too many reports.'
+
+
+class InvalidLine:
+    """An NDJSON line that is not valid JSON; reported as that row's error."""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+class NDJSONParser(BaseParser):
+    """One JSON object per line; blank lines are ignored.
+
+    Reading stops with a ``ParseError`` as soon as the body has more than
+    ``PROBLEM_INGEST_MAX_ROWS`` rows, so an oversized upload is never kept.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            raise ParseError('Empty body.')
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        limit = max_rows()
+        rows = []
+        # Read line by line; the body is never held as one decoded string.
+        for line in stream:
+            if not line.strip():
+                continue
+            if len(rows) == limit:
+                raise ParseError(TOO_MANY_ROWS)
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                rows.append(InvalidLine(f'Invalid JSON: {exc}'))
+        return rows
+
+
+def _validate(rows):
+    """``(index, validated_data)`` for good rows and ``{index, errors}`` results for the rest."""
+    serializer = ProblemReportIngestSerializer()
+    valid, failed = [], []
+    for index, row in enumerate(rows):
+        if isinstance(row, InvalidLine):
+            failed.append({'index': index, 'errors': {'non_field_errors': [row.message]}})
+            continue
+        try:
+            valid.append((index, serializer.run_validation(row)))
+        except ValidationError as exc:
+            failed.append({'index': index, 'errors': exc.detail})
+    return valid, failed
+
+
+def _insert(user, batch) -> list:
+    with transaction.atomic():
+        reports = ProblemReport.objects.bulk_create([
+            ProblemReport(user=user, **{k: v for k, v in data.items() if k != 'photos'}) for _, data in batch
+        ])
+        PendingPhoto.objects.bulk_create([
+            PendingPhoto(problem_report=report, url=photo.get('url', ''), sha256=photo.get('sha256', ''),
+                         description=photo.get('description', ''))
+            for report, (_, data) in zip(reports, batch) for photo in data.get('photos', ())
+        ])
+        count_created(reports)
+        record_created(ProblemReport, reports)
+    return [{'index': index, 'id': report.pk} for report, (index, _) in zip(reports, batch)]
+
+
+def ingest(user, rows) -> list:
+    """Create a ``ProblemReport`` owned by ``user`` for every valid row.
+
+    Returns one result per row, in order: ``{index, id}`` or ``{index, errors}``.
+    """
+    valid, results = _validate(rows)
+    size = _setting('PROBLEM_INGEST_BATCH', 1000)
+    for start in range(0, len(valid), size):
+        results += _insert(user, valid[start:start + size])
+    return sorted(results, key=lambda result: result['index'])
+
+
+class PhotoFetchError(Exception):
+    pass
+
+
+def _stored_blob(digest: str):
+    prefix = photo_storage.blob_name(digest, '')
+    return Blob.objects.filter(name__startswith=prefix).values_list('name', flat=True).first()
+
+
+def _check_peer(sock) -> None:
+    address = ipaddress.ip_address(sock.getpeername()[0].split('%')[0])
+    if not address.is_global and not _setting('PROBLEM_PHOTO_FETCH_ALLOW_PRIVATE', False):
+        sock.close()
+        raise PhotoFetchError('Host is not a public address.')
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        _check_peer(self.sock)
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        raise PhotoFetchError('Redirects are not followed.')
+
+
+# No proxies: the peer check has to see the photo host itself.
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _PublicHTTPHandler,
+                                      _PublicHTTPSHandler, _NoRedirect)
+
+
+def _download(pending) -> str:
+    parts = urllib.parse.urlsplit(pending.url)
+    if parts.scheme not in ('http', 'https') or parts.hostname not in _setting('PROBLEM_PHOTO_FETCH_HOSTS', ()):
+        raise PhotoFetchError('URL not allowed.')
+    limit = _setting('PROBLEM_PHOTO_MAX_BYTES', 10 * 1024 * 1024)
+    try:
+        with _opener.open(pending.url, timeout=_setting('PROBLEM_PHOTO_FETCH_TIMEOUT', 10)) as response:
+            data = response.read(limit + 1)
+    except (OSError, ValueError, http.client.HTTPException) as exc:
+        raise PhotoFetchError(f'Download failed: {exc}') from exc
+    if len(data) > limit:
+        raise PhotoFetchError('Photo too large.')
+    if pending.sha256 and sha256(data).hexdigest() != pending.sha256:
+        raise PhotoFetchError('Content does not match sha256.')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+            ext = IMAGE_EXTENSIONS.get(image.format)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as exc:
+        raise PhotoFetchError('Not an image.') from exc
+    if ext is None:
+        raise PhotoFetchError('Unsupported image format.')
+    return photo_storage.save('photo' + ext, ContentFile(data))
+
+
+def _resolve(pending) -> str:
+    """Storage name for ``pending``'s photo, downloading it only if not already stored."""
+    if pending.sha256:
+        name = _stored_blob(pending.sha256)
+        if name:
+            return name
+        if not pending.url:
+            raise PhotoFetchError('No stored photo has this sha256.')
+    return _download(pending)
+
+
+def fetch_pending(limit: int = None) -> tuple:
+    """Turn pending photos into ``ProblemPhoto`` rows; returns ``(fetched, failed)``.
+
+    Failures are retried on later runs, up to ``PROBLEM_PHOTO_FETCH_ATTEMPTS``;
+    any error is recorded on its own row so one bad photo cannot stall the rest.
+    """
+    pending_photos = PendingPhoto.objects.filter(
+        attempts__lt=_setting('PROBLEM_PHOTO_FETCH_ATTEMPTS', 3)).order_by('id')
+    if limit:
+        pending_photos = pending_photos[:limit]
+    fetched = failed = 0
+    for pending in pending_photos:
+        try:
+            name = _resolve(pending)
+            with transaction.atomic():
+                ProblemPhoto.objects.create(problem_report_id=pending.problem_report_id, photo=name,
+                                            description=pending.description)
+                pending.delete()
+        except Exception as exc:
+            if not isinstance(exc, PhotoFetchError):
+                logger.exception("Fetching pending photo %s failed", pending.pk)
+            pending.attempts += 1
+            pending.last_error = (str(exc) or type(exc).__name__)[:200]
+            pending.save(update_fields=['attempts', 'last_error'])
+            failed += 1
+            continue
+        fetched += 1
+    return fetched, failed
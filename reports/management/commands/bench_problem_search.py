@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from reports import search
+from reports.models import ProblemReport
+
+WORDS = (
+    'engine tyre tire battery brake clutch fuel leak smoke noise overheating puncture wiring horn '
+    'headlight meter starter chain seat mirror rickshaw stalled flat dead grinding rattling spark '
+    'plug filter coolant belt pedal steering axle bearing exhaust charger cable terminal fuse'
+).split()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark problem search: the full-text index vs. the icontains Q filter. "
+            "Synthetic reports are inserted inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stderr.write("This database has no full-text index; nothing to compare.")
+            return
+        rng = random.Random(options['seed'])
+        limit = options['limit']
+        with transaction.atomic():
+            self._populate(rng, options['reports'])
+            queries = [' '.join(rng.sample(WORDS, rng.choice((1, 1, 2)))) for _ in range(options['queries'])]
+            queries.append('zzzmissing')
+
+            self.stdout.write(f"{'query':<24} {'fts ms':>9} {'hits':>6} {'icontains ms':>13} {'hits':>6}")
+            fts_times, like_times = [], []
+            for query in queries:
+                started = time.perf_counter()
+                ids = search.search_ids(query, limit)
+                fts_ms = (time.perf_counter() - started) * 1000
+
+                started = time.perf_counter()
+                like = Q()
+                for word in query.split():
+                    like &= Q(title__icontains=word) | Q(description__icontains=word) | Q(user__username__icontains=word)
+                rows = list(ProblemReport.objects.filter(like).order_by('-created_at', '-id')
+                            .values_list('id', flat=True)[:limit])
+                like_ms = (time.perf_counter() - started) * 1000
+
+                fts_times.append(fts_ms)
+                like_times.append(like_ms)
+                self.stdout.write(f"{query:<24} {fts_ms:>9.1f} {len(ids):>6} {like_ms:>13.1f} {len(rows):>6}")
+            fts_times.sort()
+            like_times.sort()
+            self.stdout.write(
+                f"{'p50':<24} {fts_times[len(fts_times) // 2]:>9.1f} {'':>6} "
+                f"{like_times[len(like_times) // 2]:>13.1f}"
+            )
+            transaction.set_rollback(True)
+
+    def _populate(self, rng, count):
+        started = time.perf_counter()
+        users = [User(username=f'bench-search-{i}') for i in range(200)]
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(username__startswith='bench-search-'))
+        batch = []
+        for i in range(count):
+            batch.append(ProblemReport(
+                user=rng.choice(users),
+                title=' '.join(rng.sample(WORDS, 3)),
+                description=' '.join(rng.choice(WORDS) for _ in range(20)),
+                location='Dhaka', phone_number='0170000000',
+                problem_type=rng.choice(ProblemReport.PROBLEM_TYPES)[0],
+            ))
+            if len(batch) == 5000:
+                ProblemReport.objects.bulk_create(batch)
+                batch = []
+        ProblemReport.objects.bulk_create(batch)
+        self.stdout.write(f"Inserted {count} reports in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from reports.heatmap import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the ProblemHeatCell rollup behind the breakdown heatmap"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help="Recompute this many most recent days (default 2).")
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute every day, picking up edits and deletes of older reports.")
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else timezone.localdate() - timedelta(days=max(options['days'], 1) - 1)
+        cells = rebuild(since)
+        scope = "all days" if since is None else f"days since {since}"
+        self.stdout.write(self.style.SUCCESS(f"Wrote {cells} heatmap cells for {scope}."))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from reports.images import build_variants
+from reports.models import ProblemPhoto
+
+
+class Command(BaseCommand):
+    help = "Build thumbnail and medium WebP/JPEG variants for problem photos that lack them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild variants for every photo.")
+
+    def handle(self, *args, **options):
+        photos = ProblemPhoto.objects.exclude(photo='')
+        if not options['all']:
+            photos = photos.filter(variants_ready=False)
+        built = failed = 0
+        for photo in photos.iterator(chunk_size=200):
+            try:
+                build_variants(photo)
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"{photo.photo.name}: {exc}")
+            else:
+                built += 1
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} photos ({failed} failed)."))
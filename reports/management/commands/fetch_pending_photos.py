@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reports.ingest import fetch_pending
+
+
+class Command(BaseCommand):
+    help = "Download photos referenced by bulk-ingested problem reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help="Fetch at most this many photos.")
+
+    def handle(self, *args, **options):
+        fetched, failed = fetch_pending(options['limit'])
+        self.stdout.write(self.style.SUCCESS(f"Fetched {fetched} photos, {failed} failed."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.stats import reconcile
+
+
+class Command(BaseCommand):
+    help = "Compare the ProblemStats rollup with ProblemReport and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only report drift; exit with an error if any is found.")
+
+    def handle(self, *args, **options):
+        drift = reconcile(repair=not options['check'])
+        for key, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"{key}: stored {stored}, actual {actual}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("ProblemStats is in sync."))
+        elif options['check']:
+            raise CommandError(f"{len(drift)} counters have drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} counters."))
@@ -0,0 +1,36 @@
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed(apps, schema_editor):
+    ProblemReport = apps.get_model('reports', 'ProblemReport')
+    ProblemStats = apps.get_model('reports', 'ProblemStats')
+    aggregates = {'total': Count('id')}
+    for prefix, field in (('status', 'status'), ('type', 'problem_type'), ('priority', 'priority')):
+        for value, _ in ProblemReport._meta.get_field(field).choices:
+            aggregates[f'{prefix}:{value}'] = Count('id', filter=Q(**{field: value}))
+    counts = ProblemReport.objects.order_by().aggregate(**aggregates)
+    ProblemStats.objects.bulk_create([ProblemStats(key=key, count=n) for key, n in counts.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'problem stats',
+            },
+        ),
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
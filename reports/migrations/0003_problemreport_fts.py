@@ -0,0 +1,127 @@
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE reports_problemreport_fts USING fts5(
+        title, description, username, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """INSERT INTO reports_problemreport_fts (rowid, title, description, username)
+       SELECT r.id, r.title, r.description, u.username
+       FROM reports_problemreport r JOIN auth_user u ON u.id = r.user_id""",
+    """CREATE TRIGGER reports_problemreport_fts_ai AFTER INSERT ON reports_problemreport BEGIN
+        INSERT INTO reports_problemreport_fts (rowid, title, description, username)
+        VALUES (new.id, new.title, new.description, (SELECT username FROM auth_user WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER reports_problemreport_fts_au AFTER UPDATE OF title, description, user_id
+       ON reports_problemreport
+       WHEN old.title IS NOT new.title OR old.description IS NOT new.description
+            OR old.user_id IS NOT new.user_id BEGIN
+        UPDATE reports_problemreport_fts
+        SET title = new.title, description = new.description,
+            username = (SELECT username FROM auth_user WHERE id = new.user_id)
+        WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER reports_problemreport_fts_ad AFTER DELETE ON reports_problemreport BEGIN
+        DELETE FROM reports_problemreport_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER reports_problemreport_fts_user_au AFTER UPDATE OF username ON auth_user
+       WHEN old.username IS NOT new.username BEGIN
+        UPDATE reports_problemreport_fts SET username = new.username
+        WHERE rowid IN (SELECT id FROM reports_problemreport WHERE user_id = new.id);
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_user_au",
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_ad",
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_au",
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_ai",
+    "DROP TABLE IF EXISTS reports_problemreport_fts",
+]
+
+POSTGRES_FORWARD = [
+    """CREATE FUNCTION reports_problemreport_fts_document(title text, description text, username text)
+       RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(username, '')), 'B')
+            || setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+    $$""",
+    """CREATE TABLE reports_problemreport_fts (
+        report_id bigint PRIMARY KEY REFERENCES reports_problemreport (id) ON DELETE CASCADE,
+        document tsvector NOT NULL
+    )""",
+    "CREATE INDEX reports_problemreport_fts_document_idx ON reports_problemreport_fts USING GIN (document)",
+    """INSERT INTO reports_problemreport_fts (report_id, document)
+       SELECT r.id, reports_problemreport_fts_document(r.title, r.description, u.username)
+       FROM reports_problemreport r JOIN auth_user u ON u.id = r.user_id""",
+    """CREATE FUNCTION reports_problemreport_fts_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO reports_problemreport_fts (report_id, document)
+        SELECT NEW.id, reports_problemreport_fts_document(NEW.title, NEW.description, u.username)
+        FROM auth_user u WHERE u.id = NEW.user_id
+        ON CONFLICT (report_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NULL;
+    END
+    $$""",
+    """CREATE TRIGGER reports_problemreport_fts_ai AFTER INSERT ON reports_problemreport
+       FOR EACH ROW EXECUTE FUNCTION reports_problemreport_fts_sync()""",
+    """CREATE TRIGGER reports_problemreport_fts_au AFTER UPDATE OF title, description, user_id
+       ON reports_problemreport FOR EACH ROW
+       WHEN (OLD.title IS DISTINCT FROM NEW.title OR OLD.description IS DISTINCT FROM NEW.description
+             OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+       EXECUTE FUNCTION reports_problemreport_fts_sync()""",
+    """CREATE FUNCTION reports_problemreport_fts_user_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE reports_problemreport_fts f
+        SET document = reports_problemreport_fts_document(r.title, r.description, NEW.username)
+        FROM reports_problemreport r
+        WHERE r.id = f.report_id AND r.user_id = NEW.id;
+        RETURN NULL;
+    END
+    $$""",
+    """CREATE TRIGGER reports_problemreport_fts_user_au AFTER UPDATE OF username ON auth_user
+       FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username)
+       EXECUTE FUNCTION reports_problemreport_fts_user_sync()""",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_user_au ON auth_user",
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_au ON reports_problemreport",
+    "DROP TRIGGER IF EXISTS reports_problemreport_fts_ai ON reports_problemreport",
+    "DROP FUNCTION IF EXISTS reports_problemreport_fts_user_sync()",
+    "DROP FUNCTION IF EXISTS reports_problemreport_fts_sync()",
+    "DROP TABLE IF EXISTS reports_problemreport_fts",
+    "DROP FUNCTION IF EXISTS reports_problemreport_fts_document(text, text, text)",
+]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+    'postgresql': (POSTGRES_FORWARD, POSTGRES_BACKWARD),
+}
+
+
+def _run(schema_editor, index):
+    # Other backends get no index; reports.search falls back to icontains.
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements:
+        for sql in statements[index]:
+            schema_editor.execute(sql)
+
+
+def forwards(apps, schema_editor):
+    _run(schema_editor, 0)
+
+
+def backwards(apps, schema_editor):
+    _run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('reports', '0002_problemstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,40 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_problemreport_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['created_at', 'id'], name='report_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='report_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='report_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['priority', 'created_at', 'id'], name='report_priority_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['problem_type', 'created_at', 'id'], name='report_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['assigned_agent', 'status'], name='report_agent_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='problemreport',
+            index=models.Index(fields=['status', 'problem_type', 'priority'], name='report_stats_idx'),
+        ),
+    ]
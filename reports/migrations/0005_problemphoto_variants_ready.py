@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_problemreport_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problemphoto',
+            name='variants_ready',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_problemphoto_variants_ready'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='problemphoto',
+            name='photo',
+            field=models.ImageField(help_text='Upload photos of the problem', storage=core.storage.ContentAddressedStorage(), upload_to='problem_photos/%Y/%m/%d/'),
+        ),
+    ]
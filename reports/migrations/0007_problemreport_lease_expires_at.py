@@ -0,0 +1,17 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0006_alter_problemphoto_photo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='problemreport',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_problemreport_lease_expires_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingPhoto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(blank=True, max_length=500)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('description', models.CharField(blank=True, max_length=200)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('problem_report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_photos', to='reports.problemreport')),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_pendingphoto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemHeatCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geohash', models.CharField(max_length=12)),
+                ('day', models.DateField()),
+                ('problem_type', models.CharField(max_length=20)),
+                ('priority', models.CharField(max_length=10)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'geohash'], name='heat_cell_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='problemheatcell',
+            constraint=models.UniqueConstraint(fields=('geohash', 'day', 'problem_type', 'priority'), name='heat_cell_unique'),
+        ),
+    ]
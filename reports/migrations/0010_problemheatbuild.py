@@ -0,0 +1,20 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_problemheatcell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemHeatBuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('built_at', models.DateTimeField(auto_now_add=True)),
+                ('since', models.DateField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from core.storage import photo_storage
 
 class ProblemReport(models.Model):
     STATUS_CHOICES = [
@@ -10,6 +11,13 @@ class ProblemReport(models.Model):
         ('resolved', 'Resolved'),
         ('closed', 'Closed'),
     ]
+    # Allowed status changes; enforced by core.transitions.
+    STATUS_TRANSITIONS = {
+        'pending': {'assigned', 'in_progress', 'resolved', 'closed'},
+        'assigned': {'pending', 'in_progress', 'resolved', 'closed'},
+        'in_progress': {'assigned', 'resolved', 'closed'},
+        'resolved': {'in_progress', 'closed'},
+    }
 
     
     PRIORITY_CHOICES = [
@@ -52,25 +60,62 @@ class ProblemReport(models.Model):
     assigned_agent = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, 
                                      related_name='assigned_reports', limit_choices_to={'groups__name': 'Agents'})
     assigned_center = models.ForeignKey('centers.ServiceCenter', on_delete=models.SET_NULL, null=True, blank=True)
+    # Set while an agent holds a queue claim it has not acknowledged yet.
+    lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     def __str__(self):
         return f"{self.title} - {self.user.username} ({self.status})"
     
     class Meta:
         ordering = ['-created_at']
+        # Each list filters on at most one of these columns and pages on
+        # (created_at, id); see core.pagination.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='report_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='report_user_created_idx'),
+            models.Index(fields=['status', 'created_at', 'id'], name='report_status_created_idx'),
+            models.Index(fields=['priority', 'created_at', 'id'], name='report_priority_created_idx'),
+            models.Index(fields=['problem_type', 'created_at', 'id'], name='report_type_created_idx'),
+            models.Index(fields=['assigned_agent', 'status'], name='report_agent_status_idx'),
+            # Covers reports.stats.compute_stats without touching the table.
+            models.Index(fields=['status', 'problem_type', 'priority'], name='report_stats_idx'),
+        ]
 
 class ProblemPhoto(models.Model):
     problem_report = models.ForeignKey(ProblemReport, on_delete=models.CASCADE, related_name='photos')
-    photo = models.ImageField(upload_to='problem_photos/%Y/%m/%d/', help_text='Upload photos of the problem')
+    photo = models.ImageField(upload_to='problem_photos/%Y/%m/%d/', storage=photo_storage,
+                              help_text='Upload photos of the problem')
     description = models.CharField(max_length=200, blank=True, help_text='Optional description of this photo')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    variants_ready = models.BooleanField(default=False, editable=False)
     
     def __str__(self):
         return f"Photo for {self.problem_report.title}"
+
+    def variant_url(self, size='medium', fmt='jpg'):
+        """URL of a resized variant (see ``reports.images``), or the original until it exists."""
+        if not self.variants_ready:
+            return self.photo.url
+        from .images import variant_name
+
+        return self.photo.storage.url(variant_name(self.photo.name, size, fmt))
     
     class Meta:
         ordering = ['uploaded_at']
 
+class PendingPhoto(models.Model):
+    """A photo sent by URL or content hash, fetched later by ``fetch_pending_photos``."""
+    problem_report = models.ForeignKey(ProblemReport, on_delete=models.CASCADE, related_name='pending_photos')
+    url = models.URLField(max_length=500, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    description = models.CharField(max_length=200, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pending photo for report #{self.problem_report_id}"
+
 class ProblemResponse(models.Model):
     problem_report = models.ForeignKey(ProblemReport, on_delete=models.CASCADE, related_name='responses')
     responder = models.ForeignKey(User, on_delete=models.CASCADE, related_name='problem_responses')
@@ -82,4 +127,44 @@ class ProblemResponse(models.Model):
         return f"Response to {self.problem_report.title} by {self.responder.username}"
     
     class Meta:
-        ordering = ['created_at']
\ No newline at end of file
+        ordering = ['created_at']
+
+class ProblemHeatCell(models.Model):
+    """Reports per geohash cell, local day, type and priority (see ``reports.heatmap``)."""
+    geohash = models.CharField(max_length=12)
+    day = models.DateField()
+    problem_type = models.CharField(max_length=20)
+    priority = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.geohash} {self.day}: {self.count}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['geohash', 'day', 'problem_type', 'priority'], name='heat_cell_unique'),
+        ]
+        indexes = [models.Index(fields=['day', 'geohash'], name='heat_cell_day_idx')]
+
+class ProblemHeatBuild(models.Model):
+    """The latest ``ProblemHeatCell`` rebuild; its id versions heatmap ETags and cache keys."""
+    built_at = models.DateTimeField(auto_now_add=True)
+    since = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Heatmap build #{self.pk} at {self.built_at}"
+
+class ProblemStats(models.Model):
+    """Rollup counters for the problem dashboard, one row per key.
+
+    Keys are ``total``, ``status:<status>``, ``type:<problem_type>`` and
+    ``priority:<priority>``. Maintained incrementally by ``reports.stats``.
+    """
+    key = models.CharField(max_length=40, unique=True)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.count}"
+
+    class Meta:
+        verbose_name_plural = 'problem stats'
@@ -0,0 +1,76 @@
+"""Ranked full-text search over problem reports.
+
+The index lives in ``reports_problemreport_fts`` and is maintained by
+database triggers (see migration ``0003_problemreport_fts``), so it follows
+every write to ``ProblemReport`` and ``auth_user.username``, including bulk
+and raw SQL ones:
+
+* SQLite: an FTS5 virtual table ranked with ``bm25()``.
+* PostgreSQL: a side table holding a ``tsvector`` under a GIN index, ranked
+  with ``ts_rank``.
+
+Other backends have no index; ``search_ids`` returns None and callers fall
+back to ``icontains`` filters.
+"""
+import re
+
+from django.db import connection
+
+FTS_TABLE = 'reports_problemreport_fts'
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# Column weights for title, description and username. ``{within}`` is an
+# optional ``AND <id> IN (subquery)`` that applies the caller's filters
+# before the LIMIT.
+_SQLITE_SEARCH = (
+    f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{{within}} "
+    f"ORDER BY bm25({FTS_TABLE}, 10.0, 1.0, 5.0) LIMIT %s"
+)
+_POSTGRES_SEARCH = (
+    f"SELECT report_id FROM {FTS_TABLE}, to_tsquery('simple', %s) query "
+    f"WHERE document @@ query{{within}} ORDER BY ts_rank(document, query) DESC, report_id DESC LIMIT %s"
+)
+
+
+def is_supported() -> bool:
+    return connection.vendor in ('sqlite', 'postgresql')
+
+
+def _tokens(query: str) -> list:
+    return [t.lower() for t in _TOKEN.findall(query or '')][:16]
+
+
+def search_ids(query: str, limit: int = 50, within=None):
+    """Ids of reports matching every word of ``query`` (as a prefix), best first.
+
+    ``within`` is an optional ``ProblemReport`` queryset the matches must
+    belong to. Returns None when the database has no search index.
+    """
+    if not is_supported():
+        return None
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+    if connection.vendor == 'sqlite':
+        sql, term, column = _SQLITE_SEARCH, ' '.join(f'"{t}"*' for t in tokens), 'rowid'
+    else:
+        sql, term, column = _POSTGRES_SEARCH, ' & '.join(f'{t}:*' for t in tokens), 'report_id'
+    subquery, params = '', []
+    if within is not None and within.query.where:
+        subquery, params = within.order_by().values('pk').query.sql_with_params()
+        subquery = f' AND {column} IN ({subquery})'
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(within=subquery), [term, *params, limit])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def ranked(queryset, query: str, limit: int = 50):
+    """The best ``limit`` matches within ``queryset``, as a list in rank order.
+
+    Returns None when the database has no search index.
+    """
+    ids = search_ids(query, limit, within=queryset)
+    if ids is None:
+        return None
+    position = {pk: i for i, pk in enumerate(ids)}
+    return sorted(queryset.filter(id__in=ids), key=lambda obj: position[obj.id])
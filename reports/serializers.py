@@ -0,0 +1,31 @@
+from rest_framework import serializers
+
+from .models import ProblemReport
+
+
+class PhotoReferenceSerializer(serializers.Serializer):
+    """A photo to fetch later: a ``url``, a ``sha256`` of an already stored photo, or both."""
+
+    url = serializers.URLField(required=False, max_length=500)
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False)
+    description = serializers.CharField(required=False, allow_blank=True, max_length=200)
+
+    def validate(self, attrs):
+        if not attrs.get('url') and not attrs.get('sha256'):
+            raise serializers.ValidationError('Give a url or a sha256.')
+        return attrs
+
+
+class ProblemReportIngestSerializer(serializers.ModelSerializer):
+    """One row of a bulk ingest; the reporter is the authenticated partner account."""
+
+    photos = PhotoReferenceSerializer(many=True, required=False, max_length=10)
+
+    class Meta:
+        model = ProblemReport
+        fields = ['title', 'description', 'problem_type', 'priority', 'location', 'latitude', 'longitude',
+                  'phone_number', 'photos']
+        extra_kwargs = {
+            'latitude': {'min_value': -90, 'max_value': 90},
+            'longitude': {'min_value': -180, 'max_value': 180},
+        }
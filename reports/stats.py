@@ -0,0 +1,139 @@
+"""Problem dashboard counters.
+
+``ProblemStats`` holds one counter per key and is kept current from
+``ProblemReport`` signals: ``core.tracking`` remembers the counted fields as
+loaded, and saves and ``post_delete`` apply the difference with
+``count = count + delta`` updates. Reading the dashboard is then a single
+query over a fixed number of rows. Writes that bypass signals (queryset
+``update()``, raw SQL) must call ``adjust`` themselves; ``reconcile`` repairs
+any remaining drift from ``compute_stats``, one conditional aggregate.
+"""
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from core.tracking import loaded, track
+from .models import ProblemReport, ProblemStats
+
+COUNTED_FIELDS = (('status', 'status'), ('type', 'problem_type'), ('priority', 'priority'))
+
+
+def all_keys():
+    keys = ['total']
+    keys += [f'status:{value}' for value, _ in ProblemReport.STATUS_CHOICES]
+    keys += [f'type:{value}' for value, _ in ProblemReport.PROBLEM_TYPES]
+    keys += [f'priority:{value}' for value, _ in ProblemReport.PRIORITY_CHOICES]
+    return keys
+
+
+def _keys_for(values) -> list:
+    return ['total'] + [f'{prefix}:{value}' for (prefix, _), value in zip(COUNTED_FIELDS, values)]
+
+
+def compute_stats() -> dict:
+    """Every counter straight from ``ProblemReport`` in one aggregate query."""
+    aggregates = {'total': Count('id')}
+    for prefix, field in COUNTED_FIELDS:
+        choices = ProblemReport._meta.get_field(field).choices
+        for value, _ in choices:
+            aggregates[f'{prefix}:{value}'] = Count('id', filter=Q(**{field: value}))
+    return ProblemReport.objects.order_by().aggregate(**aggregates)
+
+
+def rollup() -> dict:
+    """Counters from ``ProblemStats``, or None if the table has not been seeded."""
+    counts = dict(ProblemStats.objects.values_list('key', 'count'))
+    if 'total' not in counts:
+        return None
+    return {key: counts.get(key, 0) for key in all_keys()}
+
+
+def current_stats() -> dict:
+    if getattr(settings, 'PROBLEM_STATS_ROLLUP', True):
+        counts = rollup()
+        if counts is not None:
+            return counts
+    return compute_stats()
+
+
+def adjust(deltas: dict) -> None:
+    """Add ``{key: delta}`` to the counters, one ``UPDATE`` per distinct delta.
+
+    Keys without a row are skipped rather than started from zero; ``reconcile``
+    creates them with the right value.
+    """
+    by_delta = {}
+    for key, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(key)
+    for delta, keys in by_delta.items():
+        ProblemStats.objects.filter(key__in=keys).update(count=F('count') + delta)
+
+
+def count_created(reports) -> None:
+    """Count ``reports`` inserted without signals, e.g. by ``bulk_create``."""
+    deltas = {}
+    for report in reports:
+        for key in _keys_for(_counted_values(report)):
+            deltas[key] = deltas.get(key, 0) + 1
+    adjust(deltas)
+
+
+def count_status_changes(changes) -> None:
+    """Move ``(pk, old_status, new_status)`` changes written without signals between counters."""
+    deltas = {}
+    for _, old, new in changes:
+        if old != new:
+            deltas[f'status:{old}'] = deltas.get(f'status:{old}', 0) - 1
+            deltas[f'status:{new}'] = deltas.get(f'status:{new}', 0) + 1
+    adjust(deltas)
+
+
+def reconcile(repair: bool = True) -> dict:
+    """Compare the rollup with a fresh aggregate; returns ``{key: (stored, actual)}``.
+
+    With ``repair`` every drifted or missing counter is overwritten.
+    """
+    actual = compute_stats()
+    stored = dict(ProblemStats.objects.values_list('key', 'count'))
+    drift = {key: (stored.get(key), n) for key, n in actual.items() if stored.get(key) != n}
+    if repair and drift:
+        ProblemStats.objects.bulk_create(
+            [ProblemStats(key=key, count=actual[key]) for key in drift],
+            update_conflicts=True, unique_fields=['key'], update_fields=['count'],
+        )
+    return drift
+
+
+def _counted_values(instance):
+    # Read from __dict__ so deferred fields are never fetched just to count.
+    return tuple(instance.__dict__.get(field) for _, field in COUNTED_FIELDS)
+
+
+def _loaded_values(instance):
+    return tuple(loaded(instance, field) for _, field in COUNTED_FIELDS)
+
+
+def _report_saved(instance, created):
+    new = _counted_values(instance)
+    old = _loaded_values(instance)
+    if created:
+        adjust({key: 1 for key in _keys_for(new)})
+        return
+    if old == new or None in old:
+        return
+    deltas = {}
+    for key in _keys_for(old)[1:]:
+        deltas[key] = deltas.get(key, 0) - 1
+    for key in _keys_for(new)[1:]:
+        deltas[key] = deltas.get(key, 0) + 1
+    adjust(deltas)
+
+
+track(ProblemReport, [field for _, field in COUNTED_FIELDS], _report_saved)
+
+
+@receiver(post_delete, sender=ProblemReport)
+def _report_deleted(sender, instance, **kwargs):
+    adjust({key: -1 for key in _keys_for(_loaded_values(instance))})
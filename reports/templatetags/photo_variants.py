@@ -0,0 +1,28 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+@register.simple_tag
+def photo_url(photo, size='medium', fmt='jpg'):
+    return photo.variant_url(size, fmt)
+
+
+@register.simple_tag
+def photo_picture(photo, size='thumb', **attrs):
+    """``<picture>`` with a WebP source and a JPEG fallback for ``size``.
+
+    Until the variants exist this is a plain ``<img>`` of the original.
+    Underscores in attribute names become hyphens (``data_full`` ->
+    ``data-full``).
+    """
+    attrs = {name.replace('_', '-'): value for name, value in attrs.items()}
+    attrs.setdefault('loading', 'lazy')
+    if not photo.variants_ready:
+        return format_html('<img src="{}"{}>', photo.photo.url, flatatt(attrs))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}"><img src="{}"{}></picture>',
+        photo.variant_url(size, 'webp'), photo.variant_url(size, 'jpg'), flatatt(attrs),
+    )
@@ -1,4 +1,403 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.exceptions import ParseError
 
+from centers.models import ServiceCenter
+from core.geo import geohash_encode
+from core.models import Blob, StatusEvent
+from core.storage import photo_storage
+from . import heatmap, images, search
+from .ingest import NDJSONParser, fetch_pending
+from .models import PendingPhoto, ProblemPhoto, ProblemReport
+from .stats import compute_stats, reconcile, rollup
+
+
+class ProblemStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pw')
+
+    def report(self, **fields):
+        fields.setdefault('title', 'Flat tyre')
+        return ProblemReport.objects.create(user=self.user, description='', location='Mirpur',
+                                            phone_number='017', **fields)
+
+    def test_rollup_follows_saves_and_deletes(self):
+        a = self.report(problem_type='tire', priority='high')
+        b = self.report(problem_type='engine')
+        self.report(problem_type='engine', priority='urgent')
+        a.status = 'resolved'
+        a.save()
+        b = ProblemReport.objects.get(pk=b.pk)
+        b.priority = 'low'
+        b.save()
+        ProblemReport.objects.get(pk=a.pk).delete()
+        self.assertEqual(rollup(), compute_stats())
+        self.assertEqual(rollup()['type:engine'], 2)
+        self.assertEqual(rollup()['status:resolved'], 0)
+
+    def test_dashboard_cost_does_not_grow(self):
+        staff = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.report()
+        self.client.get('/reports/stats/')
+        for _ in range(20):
+            self.report(problem_type='fuel')
+        # Session, user, the rollup rows, the response-time totals and the
+        # navbar's profile lookup.
+        with self.assertNumQueries(5):
+            response = self.client.get('/reports/stats/')
+        self.assertEqual(response.context['total_problems'], 21)
+        self.assertEqual(response.context['problem_types']['Fuel System'], 20)
+
+    def test_reconcile_repairs_drift(self):
+        self.report()
+        ProblemReport.objects.update(status='closed')  # bypasses signals
+        self.assertEqual(reconcile(repair=False), {'status:pending': (1, 0), 'status:closed': (0, 1)})
+        call_command('reconcile_problem_stats', verbosity=0, stdout=open('/dev/null', 'w'))
+        self.assertEqual(reconcile(repair=False), {})
+
+
+class ProblemSearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('rider', password='pw')
+
+    def report(self, title, description=''):
+        return ProblemReport.objects.create(user=self.user, title=title, description=description,
+                                            location='Mirpur', phone_number='017')
+
+    def test_ranked_and_kept_in_sync(self):
+        weak = self.report('Noise', 'battery light flickers')
+        strong = self.report('Battery dead', 'battery will not hold a charge')
+        self.report('Flat tyre')
+        self.assertEqual(search.search_ids('batt'), [strong.id, weak.id])
+
+        weak.title = 'Clutch slipping'
+        weak.description = ''
+        weak.save()
+        self.assertEqual(search.search_ids('battery'), [strong.id])
+        self.assertEqual(search.search_ids('clutch slip'), [weak.id])
+
+        self.user.username = 'tuktukdriver'
+        self.user.save()
+        self.assertEqual(len(search.search_ids('tuktukdriver')), 3)
+
+        strong.delete()
+        self.assertEqual(search.search_ids('battery'), [])
+        self.assertEqual(search.search_ids('"); DROP TABLE x; --'), [])
+
+    def test_all_problems_uses_index(self):
+        staff = User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        match = self.report('Brake squeal')
+        self.report('Engine smoke')
+        response = self.client.get('/reports/all-problems/', {'search': 'brake'})
+        self.assertEqual([p.id for p in response.context['problems']], [match.id])
+
+    @override_settings(PROBLEM_SEARCH_LIMIT=2)
+    def test_filters_apply_before_the_limit(self):
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+        resolved = self.report('Engine noise')
+        ProblemReport.objects.filter(pk=resolved.pk).update(status='resolved')
+        for _ in range(3):
+            self.report('Engine engine engine smoke')
+        response = self.client.get('/reports/all-problems/', {'search': 'engine', 'status': 'resolved'})
+        self.assertEqual([p.id for p in response.context['problems']], [resolved.id])
+
+
+class ProblemQueryPlanTests(TestCase):
+    """EXPLAIN every ProblemReport query the list and stats views run."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('admin', password='pw', is_staff=True)
+        cls.user = User.objects.create_user('rider', password='pw')
+        ProblemReport.objects.bulk_create([
+            ProblemReport(user=cls.user, title=f'Report {i}', description='', location='Mirpur',
+                          phone_number='017', status=('pending', 'resolved')[i % 2])
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan text is SQLite specific')
+
+    def assertIndexedPlans(self, user, url, params=None):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        checked = 0
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'FROM "reports_problemreport"' not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = '\n'.join(row[-1] for row in cursor.fetchall())
+            checked += 1
+            with self.subTest(url=url, params=params, sql=sql):
+                self.assertNotRegex(plan, r'SCAN reports_problemreport(?! USING)')
+                self.assertNotIn('TEMP B-TREE', plan)
+        return checked
+
+    def test_my_problems(self):
+        self.assertEqual(self.assertIndexedPlans(self.user, '/reports/my-problems/'), 1)
+        cursor = self.client.get('/reports/my-problems/', {'format': 'json'}).json()['next_cursor']
+        self.assertIndexedPlans(self.user, '/reports/my-problems/', {'cursor': cursor})
+
+    def test_all_problems_filters(self):
+        for params in ({}, {'status': 'pending'}, {'priority': 'high'}, {'problem_type': 'engine'},
+                       {'status': 'pending', 'priority': 'medium'}):
+            self.assertEqual(self.assertIndexedPlans(self.staff, '/reports/all-problems/', params), 1)
+
+    def test_problem_stats_fallback(self):
+        with override_settings(PROBLEM_STATS_ROLLUP=False):
+            self.assertEqual(self.assertIndexedPlans(self.staff, '/reports/stats/'), 1)
+
+
+class PhotoVariantTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media, IMAGE_VARIANT_WORKERS=0))
+        self.user = User.objects.create_user('rider', password='pw')
+        self.report = ProblemReport.objects.create(user=self.user, title='Flat tyre', description='',
+                                                   location='Mirpur', phone_number='017')
+
+    def upload(self):
+        buf = io.BytesIO()
+        Image.new('RGB', (3000, 2000), 'orange').save(buf, 'JPEG', quality=95)
+        return SimpleUploadedFile('tyre.jpg', buf.getvalue(), content_type='image/jpeg')
+
+    def test_variants_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            photo = ProblemPhoto.objects.create(problem_report=self.report, photo=self.upload())
+            self.assertEqual(photo.variant_url('thumb'), photo.photo.url)
+        photo.refresh_from_db()
+        self.assertTrue(photo.variants_ready)
+        storage = photo.photo.storage
+        for size, edge in images.SIZES.items():
+            for fmt in images.FORMATS:
+                name = images.variant_name(photo.photo.name, size, fmt)
+                with storage.open(name) as f:
+                    self.assertEqual(max(Image.open(f).size), edge)
+        # Variants sit beside the blob rather than becoming blobs themselves.
+        self.assertEqual(list(Blob.objects.values_list('name', flat=True)), [photo.photo.name])
+        self.assertTrue(photo.variant_url('thumb', 'webp').endswith('.thumb.webp'))
+
+        self.client.force_login(self.user)
+        html = self.client.get(f'/reports/problem/{self.report.id}/').content.decode()
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('.medium.jpg', html)
+
+
+class ProblemIngestTests(TestCase):
+    def setUp(self):
+        self.partner = User.objects.create_user('callcenter', password='pw')
+        self.partner.user_permissions.add(Permission.objects.get(codename='add_problemreport'))
+        self.client.force_login(self.partner)
+
+    def row(self, title, **fields):
+        return {'title': title, 'description': 'Stalled', 'location': 'Mirpur 10', 'phone_number': '017',
+                'problem_type': 'engine', **fields}
+
+    def post(self, body, content_type='application/json'):
+        return self.client.post('/reports/api/ingest/', body, content_type=content_type)
+
+    def test_json_rows_are_validated_and_inserted_independently(self):
+        digest = 'a' * 64
+        rows = [
+            self.row('Gearbox noise', priority='urgent', photos=[{'url': 'https://photos.example/1.jpg'},
+                                                                  {'sha256': digest}]),
+            self.row('Bad', priority='whenever', latitude=123),
+            self.row('Starter motor'),
+        ]
+        # Session, user, two permission lookups, then one batch: savepoint, reports,
+        # pending photos, two rollup updates, status events, release.
+        with self.assertNumQueries(11):
+            response = self.post(json.dumps(rows))
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (2, 1))
+        self.assertEqual(set(body['results'][1]['errors']), {'priority', 'latitude'})
+        ids = [body['results'][0]['id'], body['results'][2]['id']]
+        reports = ProblemReport.objects.in_bulk(ids)
+        self.assertEqual(reports[ids[0]].user, self.partner)
+        self.assertEqual(reports[ids[0]].priority, 'urgent')
+        self.assertEqual(sorted(PendingPhoto.objects.values_list('url', 'sha256')),
+                         [('', digest), ('https://photos.example/1.jpg', '')])
+        self.assertEqual(rollup(), compute_stats())
+        self.assertEqual(StatusEvent.objects.filter(kind='problem', object_id__in=ids, to_status='pending').count(), 2)
+        self.assertEqual(search.search_ids('gearbox'), [ids[0]])
+
+    def test_ndjson_reports_bad_lines_per_row(self):
+        body = '\n'.join([json.dumps(self.row('One')), '{not json', '', json.dumps(self.row('Two'))])
+        results = self.post(body, 'application/x-ndjson').json()['results']
+        self.assertEqual([sorted(r) for r in results], [['id', 'index'], ['errors', 'index'], ['id', 'index']])
+
+    @override_settings(PROBLEM_INGEST_MAX_ROWS=2)
+    def test_ndjson_stops_reading_past_the_row_limit(self):
+        lines = [json.dumps(self.row(f'Row {i}')) for i in range(5)]
+        stream = io.BytesIO('\n'.join(lines).encode())
+        with self.assertRaises(ParseError):
+            NDJSONParser().parse(stream)
+        # The third row tripped the limit; nothing after it was read.
+        self.assertEqual(stream.readline().decode().strip(), lines[3])
+        response = self.post('\n'.join(lines), 'application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ProblemReport.objects.exists())
+
+    def test_needs_permission_and_a_list(self):
+        self.assertEqual(self.post(json.dumps({'title': 'x'})).status_code, 400)
+        self.client.force_login(User.objects.create_user('rider', password='pw'))
+        self.assertEqual(self.post(json.dumps([self.row('x')])).status_code, 403)
+        self.assertFalse(ProblemReport.objects.exists())
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class PendingPhotoFetchTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        user = User.objects.create_user('rider', password='pw')
+        self.report = ProblemReport.objects.create(user=user, title='Flat tyre', description='',
+                                                   location='Mirpur', phone_number='017')
+        buf = io.BytesIO()
+        Image.new('RGB', (40, 30), 'teal').save(buf, 'PNG')
+        self.png = buf.getvalue()
+
+    def serve(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with open(f'{root}/tyre.png', 'wb') as f:
+            f.write(self.png)
+        buf = io.BytesIO()
+        Image.new('1', (20000, 10000)).save(buf, 'PNG')
+        with open(f'{root}/bomb.png', 'wb') as f:
+            f.write(buf.getvalue())
+        os.mkdir(f'{root}/album')
+        server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=root))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    @override_settings(PROBLEM_PHOTO_FETCH_HOSTS=['127.0.0.1'], PROBLEM_PHOTO_FETCH_ALLOW_PRIVATE=True)
+    def test_photos_are_downloaded_or_linked_by_hash(self):
+        digest = hashlib.sha256(self.png).hexdigest()
+        base = self.serve()
+        PendingPhoto.objects.create(problem_report=self.report, url=f'{base}/tyre.png', sha256=digest)
+        PendingPhoto.objects.create(problem_report=self.report, sha256=digest, description='again')
+        PendingPhoto.objects.create(problem_report=self.report, url=f'{base}/missing.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(fetch_pending(), (2, 1))
+        names = set(self.report.photos.values_list('photo', flat=True))
+        self.assertEqual(names, {photo_storage.blob_name(digest, '.png')})
+        self.assertEqual(self.report.photos.count(), 2)
+        failed = PendingPhoto.objects.get()
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn('Download failed', failed.last_error)
+
+    def test_only_listed_public_hosts_are_fetched(self):
+        base = self.serve()
+        PendingPhoto.objects.create(problem_report=self.report, url=f'{base}/tyre.png')
+        self.assertEqual(fetch_pending(), (0, 1))
+        self.assertEqual(PendingPhoto.objects.get().last_error, 'URL not allowed.')
+        with self.settings(PROBLEM_PHOTO_FETCH_HOSTS=['127.0.0.1']):
+            self.assertEqual(fetch_pending(), (0, 1))
+        self.assertEqual(PendingPhoto.objects.get().last_error, 'Host is not a public address.')
+
+    @override_settings(PROBLEM_PHOTO_FETCH_HOSTS=['127.0.0.1'], PROBLEM_PHOTO_FETCH_ALLOW_PRIVATE=True)
+    def test_redirects_are_not_followed(self):
+        PendingPhoto.objects.create(problem_report=self.report, url=f'{self.serve()}/album')
+        self.assertEqual(fetch_pending(), (0, 1))
+        self.assertEqual(PendingPhoto.objects.get().last_error, 'Redirects are not followed.')
+
+    @override_settings(PROBLEM_PHOTO_FETCH_HOSTS=['127.0.0.1'], PROBLEM_PHOTO_FETCH_ALLOW_PRIVATE=True,
+                       PROBLEM_PHOTO_FETCH_ATTEMPTS=2)
+    def test_bad_photos_do_not_block_the_queue(self):
+        base = self.serve()
+        bomb = PendingPhoto.objects.create(problem_report=self.report, url=f'{base}/bomb.png')
+        PendingPhoto.objects.create(problem_report=self.report, url=f'{base}/tyre.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(fetch_pending(), (1, 1))
+        self.assertEqual(fetch_pending(), (0, 1))
+        self.assertEqual(fetch_pending(), (0, 0))
+        bomb.refresh_from_db()
+        self.assertEqual((bomb.attempts, bomb.last_error), (2, 'Not an image.'))
+        self.assertEqual(self.report.photos.count(), 1)
+
+
+class ProblemHeatmapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('rider', password='pw')
+        center = ServiceCenter.objects.create(name='Uttara', phone='1', address='Uttara',
+                                              latitude=23.8759, longitude=90.3795)
+        self.report(23.7925, 90.4078, problem_type='tire')
+        self.report(23.7926, 90.4079)
+        self.report(23.7925, 90.4078, days_ago=30)
+        self.report(None, None, assigned_center=center, priority='urgent')
+        self.report(None, None)
+        heatmap.rebuild()
+        self.client.force_login(User.objects.create_user('ops', password='pw', is_staff=True))
+
+    def report(self, lat, lng, days_ago=0, **fields):
+        report = ProblemReport.objects.create(user=self.user, title='Stalled', description='', location='x',
+                                              phone_number='1', latitude=lat, longitude=lng, **fields)
+        if days_ago:
+            ProblemReport.objects.filter(pk=report.pk).update(created_at=report.created_at - timedelta(days=days_ago))
+
+    def cells(self, url):
+        return {cell['geohash']: cell['count'] for cell in self.client.get(url).json()['cells']}
+
+    def test_tiles_sum_the_rollup(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        banani, uttara = geohash_encode(23.7925, 90.4078), geohash_encode(23.8759, 90.3795)
+        with self.assertNumQueries(5):  # session, user, roles, build, one aggregate over the rollup
+            body = self.client.get('/reports/heatmap/wh/').json()
+        self.assertEqual(body['precision'], 4)
+        self.assertEqual({c['geohash']: c['count'] for c in body['cells']}, {banani[:4]: 3})
+        self.assertEqual(self.cells(f'/reports/heatmap/{banani[:4]}/'), {banani: 2, uttara: 1})
+        self.assertEqual(self.cells(f'/reports/heatmap/{banani[:4]}/?days=60'), {banani: 3, uttara: 1})
+        self.assertEqual(self.cells(f'/reports/heatmap/{banani[:4]}/?problem_type=tire,engine&priority=medium'),
+                         {banani: 1})
+        self.assertEqual(self.client.get('/reports/heatmap/?priority=soon').status_code, 400)
+        self.assertEqual(self.client.get('/reports/heatmap/aaaa/').status_code, 400)
+
+    def test_etag_changes_only_when_the_rollup_is_rebuilt(self):
+        first = self.client.get('/reports/heatmap/')
+        etag = first['ETag']
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get('/reports/heatmap/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotEqual(self.client.get('/reports/heatmap/?days=3')['ETag'], etag)
+        self.report(23.7925, 90.4078)
+        self.assertEqual(self.client.get('/reports/heatmap/').json(), first.json())  # served from cache
+        heatmap.rebuild(timezone.localdate())
+        response = self.client.get('/reports/heatmap/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(sum(c['count'] for c in response.json()['cells']), 4)
@@ -5,8 +5,12 @@ urlpatterns = [
     path('', views.report_problem, name='report_problem'),
     path('my-problems/', views.my_problems, name='my_problems'),
     path('problem/<int:problem_id>/', views.problem_detail, name='problem_detail'),
+    path('problem/<int:problem_id>/events/', views.problem_events, name='problem_events'),
     path('all-problems/', views.all_problems, name='all_problems'),
     path('problem/<int:problem_id>/respond/', views.add_response, name='add_response'),
     path('problem/<int:problem_id>/update/', views.update_problem_status, name='update_problem_status'),
     path('stats/', views.problem_stats, name='problem_stats'),
+    path('heatmap/', views.problem_heatmap, name='problem_heatmap'),
+    path('heatmap/<slug:tile>/', views.problem_heatmap, name='problem_heatmap_tile'),
+    path('api/ingest/', views.ProblemIngestAPIView.as_view(), name='problem_ingest_api'),
 ]
@@ -1,15 +1,31 @@
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.conf import settings
+from rest_framework import permissions, status
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from core import events
+from core.pagination import KeysetPage, paginate, wants_json
+from core.roles import get_roles
+from core.transitions import can_transition, durations, transition
+from . import heatmap, search
+from .ingest import TOO_MANY_ROWS, NDJSONParser, ingest, max_rows
 from .models import ProblemReport, ProblemPhoto, ProblemResponse
 from .forms import ProblemReportForm, ProblemResponseForm, ProblemReportUpdateForm
+from .stats import current_stats
 
 def is_agent_or_admin(user):
 
-    return user.is_staff or user.groups.filter(name='Agents').exists()
+    return get_roles(user).agent_or_admin
 
 @login_required
 def report_problem(request):
@@ -25,15 +41,14 @@ def report_problem(request):
             if not problem_report.phone_number and hasattr(request.user, 'profile'):
                 problem_report.phone_number = request.user.profile.phone_number or ""
             
-            problem_report.save()
-            
-
             photos = request.FILES.getlist('photos')
-            for photo in photos:
-                ProblemPhoto.objects.create(
-                    problem_report=problem_report,
-                    photo=photo
-                )
+            with transaction.atomic():
+                problem_report.save()
+                for photo in photos:
+                    ProblemPhoto.objects.create(
+                        problem_report=problem_report,
+                        photo=photo
+                    )
             
             messages.success(request, 'Your problem has been reported successfully! Our team will review it and get back to you soon.')
             return redirect('problem_detail', problem_id=problem_report.id)
@@ -42,16 +57,28 @@ def report_problem(request):
     
     return render(request, 'reports/report_problem.html', {'form': form})
 
+def _problem_json(problem):
+    return {
+        'id': problem.id,
+        'title': problem.title,
+        'problem_type': problem.problem_type,
+        'priority': problem.priority,
+        'status': problem.status,
+        'location': problem.location,
+        'latitude': problem.latitude,
+        'longitude': problem.longitude,
+        'assigned_agent_id': problem.assigned_agent_id,
+        'created_at': problem.created_at.isoformat(),
+    }
+
 @login_required
 def my_problems(request):
 
-    problems = ProblemReport.objects.filter(user=request.user).order_by('-created_at')
-    
+    problems = ProblemReport.objects.filter(user=request.user)
+    problems = paginate(problems, request, 10)
+    if wants_json(request):
+        return JsonResponse(problems.as_json(_problem_json))
 
-    paginator = Paginator(problems, 10)
-    page_number = request.GET.get('page')
-    problems = paginator.get_page(page_number)
-    
     return render(request, 'reports/my_problems.html', {'problems': problems})
 
 @login_required
@@ -60,7 +87,7 @@ def problem_detail(request, problem_id):
     problem = get_object_or_404(ProblemReport, id=problem_id)
     
 
-    if not (problem.user == request.user or is_agent_or_admin(request.user)):
+    if not (problem.user_id == request.user.id or request.roles.agent_or_admin):
         messages.error(request, 'You do not have permission to view this problem report.')
         return redirect('home')
     
@@ -69,7 +96,7 @@ def problem_detail(request, problem_id):
     
 
     response_form = None
-    if is_agent_or_admin(request.user):
+    if request.roles.agent_or_admin:
         response_form = ProblemResponseForm()
     
     return render(request, 'reports/problem_detail.html', {
@@ -79,11 +106,32 @@ def problem_detail(request, problem_id):
         'response_form': response_form,
     })
 
+def _problem_snapshot(request, problem_id):
+    if not request.user.is_authenticated:
+        return None
+    problem = ProblemReport.objects.filter(id=problem_id).only('user_id', 'status').first()
+    if problem is None or not (problem.user_id == request.user.id or request.roles.agent_or_admin):
+        return None
+    return [
+        ('status', events.status_payload(ProblemReport, problem.status)),
+        # Lets a reconnecting page notice responses it missed.
+        ('responses', {'count': problem.responses.count()}),
+    ]
+
+async def problem_events(request, problem_id):
+    """Server-Sent Events with status changes and new responses (see core.events)."""
+    subscription = events.broker.subscribe(events.channel('problem', problem_id))
+    snapshot = await sync_to_async(_problem_snapshot)(request, problem_id)
+    if snapshot is None:
+        subscription.close()
+        raise Http404
+    return events.event_stream(request, subscription, snapshot)
+
 @login_required
 @user_passes_test(is_agent_or_admin)
 def all_problems(request):
 
-    problems = ProblemReport.objects.all().order_by('-created_at')
+    problems = ProblemReport.objects.select_related('user__profile', 'assigned_agent')
     
 
     status_filter = request.GET.get('status')
@@ -97,18 +145,24 @@ def all_problems(request):
         problems = problems.filter(priority=priority_filter)
     if problem_type_filter:
         problems = problems.filter(problem_type=problem_type_filter)
+    results = None
     if search_query:
-        problems = problems.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(user__username__icontains=search_query)
-        )
-    
+        results = search.ranked(problems, search_query, getattr(settings, 'PROBLEM_SEARCH_LIMIT', 50))
+        if results is None:
+            problems = problems.filter(
+                Q(title__icontains=search_query) |
+                Q(description__icontains=search_query) |
+                Q(user__username__icontains=search_query)
+            )
+
+    if results is not None:
+        # Ranked matches come back as a single page, best first.
+        problems = KeysetPage(results, None, None, [])
+    else:
+        problems = paginate(problems, request, 15)
+    if wants_json(request):
+        return JsonResponse(problems.as_json(_problem_json))
 
-    paginator = Paginator(problems, 15)
-    page_number = request.GET.get('page')
-    problems = paginator.get_page(page_number)
-    
     return render(request, 'reports/all_problems.html', {
         'problems': problems,
         'status_choices': ProblemReport.STATUS_CHOICES,
@@ -128,12 +182,10 @@ def add_response(request, problem_id):
             response = form.save(commit=False)
             response.problem_report = problem
             response.responder = request.user
-            response.save()
-            
-
-            if response.is_solution:
-                problem.status = 'resolved'
-                problem.save()
+            with transaction.atomic():
+                response.save()
+                if response.is_solution and can_transition(problem, 'resolved'):
+                    transition(problem, 'resolved')
             
             messages.success(request, 'Your response has been added successfully!')
             return redirect('problem_detail', problem_id=problem.id)
@@ -154,7 +206,8 @@ def update_problem_status(request, problem_id):
     if request.method == 'POST':
         form = ProblemReportUpdateForm(request.POST, instance=problem)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                form.save()
             messages.success(request, 'Problem status updated successfully!')
             return redirect('problem_detail', problem_id=problem.id)
     else:
@@ -168,30 +221,80 @@ def update_problem_status(request, problem_id):
 @login_required
 def problem_stats(request):
 
-    if not is_agent_or_admin(request.user):
+    if not request.roles.agent_or_admin:
         messages.error(request, 'You do not have permission to view this page.')
         return redirect('home')
     
-    total_problems = ProblemReport.objects.count()
-    pending_problems = ProblemReport.objects.filter(status='pending').count()
-    in_progress_problems = ProblemReport.objects.filter(status='in_progress').count()
-    resolved_problems = ProblemReport.objects.filter(status='resolved').count()
-    
-
-    problem_types = {}
-    for choice in ProblemReport.PROBLEM_TYPES:
-        problem_types[choice[1]] = ProblemReport.objects.filter(problem_type=choice[0]).count()
-    
+    counts = current_stats()
+    problem_types = {label: counts[f'type:{value}'] for value, label in ProblemReport.PROBLEM_TYPES}
+    priority_dist = {label: counts[f'priority:{value}'] for value, label in ProblemReport.PRIORITY_CHOICES}
 
-    priority_dist = {}
-    for choice in ProblemReport.PRIORITY_CHOICES:
-        priority_dist[choice[1]] = ProblemReport.objects.filter(priority=choice[0]).count()
-    
     return render(request, 'reports/problem_stats.html', {
-        'total_problems': total_problems,
-        'pending_problems': pending_problems,
-        'in_progress_problems': in_progress_problems,
-        'resolved_problems': resolved_problems,
+        'total_problems': counts['total'],
+        'pending_problems': counts['status:pending'],
+        'in_progress_problems': counts['status:in_progress'],
+        'resolved_problems': counts['status:resolved'],
         'problem_types': problem_types,
         'priority_dist': priority_dist,
-    })
\ No newline at end of file
+        'response_times': _response_times(),
+    })
+
+def _response_times():
+    """Mean time to assign and to resolve per center, from the status log totals."""
+    rows = []
+    for center_id, metrics in durations('problem').items():
+        center = next(iter(metrics.values())).center
+        row = {'center': center.name if center else 'No center'}
+        for metric in ('assign', 'resolve'):
+            total = metrics.get(metric)
+            row[metric] = timedelta(seconds=round(total.mean_seconds)) if total else None
+            row[f'{metric}_count'] = total.count if total else 0
+        rows.append(row)
+    return sorted(rows, key=lambda row: (row['center'] == 'No center', row['center']))
+
+class ProblemIngestAPIView(APIView):
+    """``POST`` many problem reports at once, as a JSON array or NDJSON.
+
+    A JSON body may also be ``{"reports": [...]}``. Rows are validated and
+    inserted independently (see ``reports.ingest``); the response lists one
+    ``{index, id}`` or ``{index, errors}`` result per row. Needs the
+    ``reports.add_problemreport`` permission.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, permissions.DjangoModelPermissions]
+    parser_classes = [JSONParser, NDJSONParser]
+    queryset = ProblemReport.objects.none()
+
+    def post(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get('reports')
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of reports.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > max_rows():
+            # NDJSON bodies are cut off while parsing; this catches JSON arrays.
+            return Response({'detail': TOO_MANY_ROWS}, status=status.HTTP_400_BAD_REQUEST)
+        results = ingest(request.user, rows)
+        failed = sum('errors' in result for result in results)
+        return Response({'created': len(results) - failed, 'failed': failed, 'results': results})
+
+@login_required
+@user_passes_test(is_agent_or_admin)
+def problem_heatmap(request, tile=''):
+    """Breakdown counts for one geohash tile as JSON (see reports.heatmap).
+
+    Query: ``days`` (default 7) or ``since``/``until`` dates, and optional
+    comma-separated ``problem_type`` and ``priority`` filters.
+    """
+    try:
+        params = heatmap.parse_params(tile, request.GET)
+    except ValueError as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+    build = heatmap.version()
+    etag = heatmap.etag(params, build)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(heatmap.cached_tile(params, build))
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'HEATMAP_TILE_MAX_AGE', 300))
+    return response